@@ -7,9 +7,15 @@ We'll define the relevant feature engineering tasks to clean up the SQLite3 data
 
 # %%
 # Firstly, let's import the required libraries.
+import json
+import math
+import os
+import typing
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 import pandas as pd
-from flytekit import task
+from flytekit import FlyteContext, map_task, task, workflow
 from numpy.core.fromnumeric import sort
 from sklearn.feature_selection import SelectKBest, f_classif
 from sklearn.impute import SimpleImputer
@@ -45,6 +51,9 @@ def univariate_selection(
     dataframe: pd.DataFrame, split_mask: int, num_features: int
 ) -> pd.DataFrame:
 
+    if len(dataframe) == 0:
+        # There is nothing to score - e.g. an empty table - so the empty dataframe is passed through
+        return dataframe
     X = dataframe.iloc[:, 0:split_mask]
     y = dataframe.iloc[:, split_mask]
     test = SelectKBest(score_func=f_classif, k=num_features)
@@ -56,3 +65,371 @@ def univariate_selection(
 
 # %%
 # This task returns a dataframe with the specified number of columns.
+
+
+# %%
+# Fusing the Steps
+# ^^^^^^^^^^^^^^^^
+# Every task reads its input from a ``FlyteSchema`` and writes its output to another one, so running the steps as
+# separate tasks serializes the full dataframe in between. Within the steps, ``replace`` and the imputer copy the frame
+# once more. When the steps always run back to back, they can be fused into a single task instead: the dataframe is
+# converted into one float NumPy array, the missing values are filled in place, and only the selected features are
+# serialized at the end.
+def to_float_array(dataframe: pd.DataFrame) -> np.ndarray:
+    """
+    Converts the dataframe into a single float array, reading ``"?"`` and ``NULL`` as missing values
+    """
+    values = np.empty(dataframe.shape, dtype=np.float64)
+    for i, (_, column) in enumerate(dataframe.items()):
+        column = column.to_numpy()
+        if column.dtype == object:
+            column = np.where((column == "?") | pd.isna(column), np.nan, column)
+        values[:, i] = column
+    return values
+
+
+def impute_inplace(values: np.ndarray, imputation_method: str) -> np.ndarray:
+    if imputation_method not in ["median", "mean"]:
+        raise ValueError("imputation_method takes only values 'median' or 'mean'")
+    if imputation_method == "median":
+        statistics = np.nanmedian(values, axis=0)
+    else:
+        statistics = np.nanmean(values, axis=0)
+    rows, columns = np.nonzero(np.isnan(values))
+    values[rows, columns] = statistics[columns]
+    return values
+
+
+def select_features(
+    values: np.ndarray, column_names: pd.Index, split_mask: int, num_features: int
+) -> pd.DataFrame:
+    X = values[:, 0:split_mask]
+    y = values[:, split_mask]
+    test = SelectKBest(score_func=f_classif, k=num_features)
+    fit = test.fit(X, y)
+    indices = sort((-fit.scores_).argsort()[:num_features])
+    return pd.DataFrame(fit.transform(X), columns=column_names[indices])
+
+
+# %%
+# The fused task takes the inputs of both steps.
+@task
+def fused_feature_engineering(
+    dataframe: pd.DataFrame,
+    imputation_method: str,
+    split_mask: int,
+    num_features: int,
+) -> pd.DataFrame:
+
+    values = impute_inplace(to_float_array(dataframe), imputation_method)
+    return select_features(values, dataframe.columns, split_mask, num_features)
+
+
+# %%
+# Incremental Imputation
+# ^^^^^^^^^^^^^^^^^^^^^^
+# The scheduled launch plan in the workflow file computes the imputation statistics from scratch on every run. When
+# new rows are appended to the database between runs, the statistics can instead be kept from one run to the next and
+# updated with the new rows only. Means are exact: a count and a sum per column merge trivially. Exact medians would
+# require keeping every value, so they are estimated with a mergeable quantile sketch.
+#
+# The sketch counts values in logarithmically sized buckets, so every estimate is within a relative error of ``alpha``
+# of a value at the requested rank. Two sketches merge by adding up their bucket counts.
+class QuantileSketch(object):
+    def __init__(
+        self,
+        alpha: float = 0.01,
+        positive: typing.Optional[typing.Dict[int, int]] = None,
+        negative: typing.Optional[typing.Dict[int, int]] = None,
+        zeros: int = 0,
+    ):
+        self.alpha = alpha
+        self._gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self._gamma)
+        self.positive = dict(positive or {})
+        self.negative = dict(negative or {})
+        self.zeros = zeros
+
+    @property
+    def count(self) -> int:
+        return sum(self.positive.values()) + sum(self.negative.values()) + self.zeros
+
+    def _add(self, buckets: typing.Dict[int, int], values: np.ndarray):
+        keys, counts = np.unique(
+            np.ceil(np.log(values) / self._log_gamma).astype(np.int64),
+            return_counts=True,
+        )
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            buckets[key] = buckets.get(key, 0) + count
+
+    def update(self, values: np.ndarray):
+        values = values[~np.isnan(values)]
+        self._add(self.positive, values[values > 0])
+        self._add(self.negative, -values[values < 0])
+        self.zeros += int((values == 0).sum())
+
+    def merge(self, other: "QuantileSketch"):
+        if other.alpha != self.alpha:
+            raise ValueError("Only sketches with the same accuracy can be merged")
+        for buckets, other_buckets in (
+            (self.positive, other.positive),
+            (self.negative, other.negative),
+        ):
+            for key, count in other_buckets.items():
+                buckets[key] = buckets.get(key, 0) + count
+        self.zeros += other.zeros
+
+    def _value(self, key: int) -> float:
+        return 2 * self._gamma**key / (self._gamma + 1)
+
+    def quantile(self, q: float) -> float:
+        count = self.count
+        if count == 0:
+            return np.nan
+        rank = q * (count - 1)
+        seen = 0
+        # From the most negative to the most positive value
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self._value(key)
+        seen += self.zeros
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self._value(key)
+        return self._value(max(self.positive))
+
+    def to_dict(self) -> dict:
+        return {
+            "alpha": self.alpha,
+            "positive": self.positive,
+            "negative": self.negative,
+            "zeros": self.zeros,
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "QuantileSketch":
+        # JSON object keys are always strings
+        return cls(
+            alpha=d["alpha"],
+            positive={int(k): v for k, v in d["positive"].items()},
+            negative={int(k): v for k, v in d["negative"].items()},
+            zeros=d["zeros"],
+        )
+
+
+# %%
+# ``ImputerStatistics`` keeps the statistics of every column together with the number of rows they were computed from.
+# The rows of a run are identified by the number of rows that were seen before them, which also makes an update
+# idempotent: when a run is retried after its statistics were saved, its rows are not counted twice.
+class ImputerStatistics(object):
+    def __init__(
+        self,
+        rows_seen: int = 0,
+        counts: typing.Optional[typing.Dict[str, int]] = None,
+        totals: typing.Optional[typing.Dict[str, float]] = None,
+        sketches: typing.Optional[typing.Dict[str, QuantileSketch]] = None,
+    ):
+        self.rows_seen = rows_seen
+        self.counts = counts or {}
+        self.totals = totals or {}
+        self.sketches = sketches or {}
+
+    def update(self, values: np.ndarray, column_names: pd.Index, offset: int):
+        if offset != self.rows_seen:
+            # These rows have been counted before
+            return
+        missing = np.isnan(values)
+        for i, name in enumerate(column_names):
+            self.counts[name] = self.counts.get(name, 0) + int((~missing[:, i]).sum())
+            self.totals[name] = self.totals.get(name, 0.0) + float(
+                np.nansum(values[:, i])
+            )
+            self.sketches.setdefault(name, QuantileSketch()).update(values[:, i])
+        self.rows_seen += values.shape[0]
+
+    def statistics(self, column_names: pd.Index, imputation_method: str) -> np.ndarray:
+        if imputation_method not in ["median", "mean"]:
+            raise ValueError("imputation_method takes only values 'median' or 'mean'")
+        # Columns that have not been seen yet have no statistics
+        if imputation_method == "median":
+            return np.array(
+                [
+                    self.sketches[c].quantile(0.5) if c in self.sketches else np.nan
+                    for c in column_names
+                ]
+            )
+        return np.array(
+            [
+                self.totals[c] / self.counts[c] if self.counts.get(c) else np.nan
+                for c in column_names
+            ]
+        )
+
+    @classmethod
+    def load(cls, ctx: FlyteContext, uri: str) -> "ImputerStatistics":
+        if not ctx.file_access.exists(uri):
+            return cls()
+        local_path = ctx.file_access.get_random_local_path()
+        ctx.file_access.get_data(uri, local_path)
+        with open(local_path) as f:
+            d = json.load(f)
+        return cls(
+            rows_seen=d["rows_seen"],
+            counts=d["counts"],
+            totals=d["totals"],
+            sketches={k: QuantileSketch.from_dict(v) for k, v in d["sketches"].items()},
+        )
+
+    def save(self, ctx: FlyteContext, uri: str):
+        local_path = ctx.file_access.get_random_local_path()
+        with open(local_path, "w") as f:
+            json.dump(
+                {
+                    "rows_seen": self.rows_seen,
+                    "counts": self.counts,
+                    "totals": self.totals,
+                    "sketches": {k: v.to_dict() for k, v in self.sketches.items()},
+                },
+                f,
+            )
+        ctx.file_access.put_data(local_path, uri)
+
+
+# %%
+# The statistics live at a fixed ``statistics_uri`` that every scheduled run reads and updates. The ``rows_seen``
+# task tells the workflow where the new rows start. ``incremental_mean_median_imputer`` updates the statistics with the
+# new rows in ``dataframe``, and imputes ``window`` - the rows the features are selected from - with the statistics of
+# all the rows seen so far. A run without new rows leaves the statistics as they are.
+@task
+def rows_seen(statistics_uri: str) -> int:
+    return ImputerStatistics.load(
+        FlyteContext.current_context(), statistics_uri
+    ).rows_seen
+
+
+@task
+def incremental_mean_median_imputer(
+    dataframe: pd.DataFrame,
+    imputation_method: str,
+    statistics_uri: str,
+    offset: int,
+    window: pd.DataFrame,
+) -> pd.DataFrame:
+
+    ctx = FlyteContext.current_context()
+    imputer_statistics = ImputerStatistics.load(ctx, statistics_uri)
+    if len(dataframe) > 0:
+        imputer_statistics.update(to_float_array(dataframe), dataframe.columns, offset)
+        imputer_statistics.save(ctx, statistics_uri)
+    values = to_float_array(window)
+    statistics = imputer_statistics.statistics(window.columns, imputation_method)
+    rows, columns = np.nonzero(np.isnan(values))
+    values[rows, columns] = statistics[columns]
+    return pd.DataFrame(values, columns=window.columns)
+
+
+# %%
+# Parallel Feature Scoring
+# ^^^^^^^^^^^^^^^^^^^^^^^^
+# ``univariate_selection`` scores every feature in a single thread. The F-score of a feature only depends on that
+# feature and the target, so the features can be split into blocks of columns that are scored independently. Once all
+# the blocks are scored, the top ``num_features`` are selected from the concatenated scores exactly as ``SelectKBest``
+# does, so the result is the same as the result of ``univariate_selection``. Both tasks below split the features with
+# ``feature_blocks``, which rejects a ``num_shards`` of less than one.
+def feature_blocks(
+    num_columns: int, num_shards: int
+) -> typing.List[typing.Tuple[int, int]]:
+    if num_shards < 1:
+        raise ValueError(f"num_shards must be at least 1, got {num_shards}")
+    bounds = np.linspace(0, num_columns, min(num_shards, num_columns) + 1).astype(int)
+    return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+
+def _f_scores(block: typing.Tuple[pd.DataFrame, pd.Series]) -> np.ndarray:
+    X, y = block
+    return f_classif(X, y)[0]
+
+
+def select_top_k(
+    dataframe: pd.DataFrame, split_mask: int, num_features: int, scores: np.ndarray
+) -> pd.DataFrame:
+    X = dataframe.iloc[:, 0:split_mask]
+    y = dataframe.iloc[:, split_mask]
+    # The scores are already computed, so the selector only has to pick the best ones
+    test = SelectKBest(score_func=lambda X, y: scores, k=num_features)
+    fit = test.fit(X, y)
+    indices = sort((-fit.scores_).argsort()[:num_features])
+    column_names = map(dataframe.columns.__getitem__, indices)
+    features = fit.transform(X)
+    return pd.DataFrame(features, columns=column_names)
+
+
+# %%
+# Locally - or on a single node with many cores - the blocks are scored by a pool of processes.
+@task
+def parallel_univariate_selection(
+    dataframe: pd.DataFrame, split_mask: int, num_features: int, num_shards: int
+) -> pd.DataFrame:
+
+    y = dataframe.iloc[:, split_mask]
+    blocks = [
+        (dataframe.iloc[:, start:end], y)
+        for start, end in feature_blocks(split_mask, num_shards)
+    ]
+    with ProcessPoolExecutor(max_workers=min(len(blocks), os.cpu_count() or 1)) as pool:
+        scores = np.concatenate(list(pool.map(_f_scores, blocks)))
+    return select_top_k(dataframe, split_mask, num_features, scores)
+
+
+# %%
+# On a cluster, a map task scores the blocks in separate pods. Every block is passed as a dataframe
+# with its features followed by the target column.
+@task
+def split_feature_blocks(
+    dataframe: pd.DataFrame, split_mask: int, num_shards: int
+) -> typing.List[pd.DataFrame]:
+    y = dataframe.iloc[:, split_mask]
+    return [
+        pd.concat([dataframe.iloc[:, start:end], y], axis=1)
+        for start, end in feature_blocks(split_mask, num_shards)
+    ]
+
+
+@task
+def score_feature_block(block: pd.DataFrame) -> typing.List[float]:
+    return _f_scores((block.iloc[:, :-1], block.iloc[:, -1])).tolist()
+
+
+@task
+def merge_feature_scores(
+    dataframe: pd.DataFrame,
+    split_mask: int,
+    num_features: int,
+    scores: typing.List[typing.List[float]],
+) -> pd.DataFrame:
+    return select_top_k(
+        dataframe,
+        split_mask,
+        num_features,
+        np.concatenate([np.array(s, dtype=np.float64) for s in scores]),
+    )
+
+
+@workflow
+def sharded_univariate_selection(
+    dataframe: pd.DataFrame, split_mask: int, num_features: int, num_shards: int
+) -> pd.DataFrame:
+    blocks = split_feature_blocks(
+        dataframe=dataframe, split_mask=split_mask, num_shards=num_shards
+    )
+    scores = map_task(score_feature_block)(block=blocks)
+    return merge_feature_scores(
+        dataframe=dataframe,
+        split_mask=split_mask,
+        num_features=num_features,
+        scores=scores,
+    )
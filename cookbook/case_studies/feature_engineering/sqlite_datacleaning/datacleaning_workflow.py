@@ -47,10 +47,85 @@ def univariate_selection(
     ...
 
 
+@reference_task(
+    project="flytesnacks",
+    domain="development",
+    name="sqlite_datacleaning.tasks.fused_feature_engineering",
+    version="fast4f51f7895819256f2540a08c97a51194",
+)
+def fused_feature_engineering(
+    dataframe: pd.DataFrame,
+    imputation_method: str,
+    split_mask: int,
+    num_features: int,
+) -> pd.DataFrame:
+    ...
+
+
+@reference_task(
+    project="flytesnacks",
+    domain="development",
+    name="sqlite_datacleaning.tasks.rows_seen",
+    version="fast4f51f7895819256f2540a08c97a51194",
+)
+def rows_seen(statistics_uri: str) -> int:
+    ...
+
+
+@reference_task(
+    project="flytesnacks",
+    domain="development",
+    name="sqlite_datacleaning.tasks.incremental_mean_median_imputer",
+    version="fast4f51f7895819256f2540a08c97a51194",
+)
+def incremental_mean_median_imputer(
+    dataframe: pd.DataFrame,
+    imputation_method: str,
+    statistics_uri: str,
+    offset: int,
+    window: pd.DataFrame,
+) -> pd.DataFrame:
+    ...
+
+
 # %%
 # .. note::
 #
 #   The ``version`` varies depending on the version assigned during the task registration process.
+#
+# .. tip::
+#
+#   Workflows that reference many tasks can look up their interfaces instead of declaring them, with a local cache
+#   and an offline stand-in for Flyte Admin. Refer to ``reference_cache.py`` in this directory.
+
+# %%
+# The feature engineering steps are chained by ``add_steps``. Each step is declared with its own task and inputs, and
+# receives the dataframe produced by the step before it. If a ``fused_task`` is given, the steps are added as a single
+# node of that task instead, which takes the inputs of all the steps and runs them in one execution, without
+# serializing the intermediate dataframes. The fused task takes every input once, so steps with inputs of the same name
+# cannot be fused.
+def add_steps(wb: Workflow, dataframe, steps, fused_task=None):
+    if fused_task is not None:
+        inputs = {}
+        for entity, step_inputs in steps:
+            for name, value in step_inputs.items():
+                if name == "dataframe" or name in inputs:
+                    raise ValueError(
+                        f"Input {name} of {entity.name} is already given to {fused_task.name}"
+                    )
+                inputs[name] = value
+        return wb.add_entity(fused_task, dataframe=dataframe, **inputs)
+    node = None
+    for entity, step_inputs in steps:
+        node = wb.add_entity(entity, dataframe=dataframe, **step_inputs)
+        dataframe = node.outputs["o0"]
+    return node
+
+
+# %%
+# Set ``FUSE_STEPS`` to ``True`` to run the steps as a single ``fused_feature_engineering`` task, once that task is
+# registered along with the other tasks.
+FUSE_STEPS = False
 
 # %%
 # Finally, we define an imperative workflow that accepts the two reference tasks we've prototyped above. The data flow can be interpreted as follows:
@@ -59,6 +134,8 @@ def univariate_selection(
 # #. The output (FlyteSchema) is passed to the ``mean_median_imputer`` task
 # #. The output produced by ``mean_median_imputer`` is given to the ``univariate_selection`` task
 # #. The dataframe generated by ``univariate_selection`` is the workflow output
+#
+# With ``FUSE_STEPS`` enabled, the two feature engineering tasks run as a single ``fused_feature_engineering`` node.
 wb = Workflow(name="sqlite_datacleaning.workflow.fe_wf")
 wb.add_workflow_input("imputation_method", str)
 wb.add_workflow_input("limit", int)
@@ -79,16 +156,14 @@ node_t1 = wb.add_entity(
     sql_task,
     limit=wb.inputs["limit"],
 )
-node_t2 = wb.add_entity(
-    mean_median_imputer,
-    dataframe=node_t1.outputs["results"],
-    imputation_method=wb.inputs["imputation_method"],
-)
-node_t3 = wb.add_entity(
-    univariate_selection,
-    dataframe=node_t2.outputs["o0"],
-    split_mask=23,
-    num_features=wf_in,
+node_t3 = add_steps(
+    wb,
+    node_t1.outputs["results"],
+    [
+        (mean_median_imputer, {"imputation_method": wb.inputs["imputation_method"]}),
+        (univariate_selection, {"split_mask": 23, "num_features": wf_in}),
+    ],
+    fused_task=fused_feature_engineering if FUSE_STEPS else None,
 )
 wb.add_workflow_output(
     "output_from_t3", node_t3.outputs["o0"], python_type=pd.DataFrame
@@ -103,6 +178,76 @@ sqlite_dataclean_lp = LaunchPlan.get_or_create(
     schedule=CronSchedule("0 10 * * ? *"),
 )
 
+# %%
+# Incremental Runs
+# ^^^^^^^^^^^^^^^^
+# The launch plan above recomputes the imputation statistics over ``limit`` rows every day. The incremental workflow
+# below only queries the rows that were appended since the last run and updates the statistics that are kept at
+# ``statistics_uri`` with them, so the daily cost of the statistics scales with the new data only. The features are
+# selected from the latest ``limit`` rows - the window - imputed with the updated statistics, so a day with few or no
+# new rows still selects from a full window. It assumes that rows are only ever appended to the table, so that their
+# ``rowid`` counts the rows before them.
+incremental_wb = Workflow(name="sqlite_datacleaning.workflow.incremental_fe_wf")
+incremental_wb.add_workflow_input("imputation_method", str)
+incremental_wb.add_workflow_input("limit", int)
+incremental_wb.add_workflow_input("num_features", int)
+incremental_wb.add_workflow_input("statistics_uri", str)
+
+incremental_sql_task = SQLite3Task(
+    name="sqlite3.horse_colic.incremental",
+    query_template="select * from data where rowid > {{ .inputs.offset }} order by rowid limit {{ .inputs.limit }}",
+    inputs=kwtypes(offset=int, limit=int),
+    output_schema_type=FlyteSchema,
+    task_config=sql_task.task_config,
+)
+
+window_sql_task = SQLite3Task(
+    name="sqlite3.horse_colic.window",
+    query_template="select * from data order by rowid desc limit {{ .inputs.limit }}",
+    inputs=kwtypes(limit=int),
+    output_schema_type=FlyteSchema,
+    task_config=sql_task.task_config,
+)
+
+node_offset = incremental_wb.add_entity(
+    rows_seen, statistics_uri=incremental_wb.inputs["statistics_uri"]
+)
+node_rows = incremental_wb.add_entity(
+    incremental_sql_task,
+    offset=node_offset.outputs["o0"],
+    limit=incremental_wb.inputs["limit"],
+)
+node_window = incremental_wb.add_entity(
+    window_sql_task, limit=incremental_wb.inputs["limit"]
+)
+node_imputed = incremental_wb.add_entity(
+    incremental_mean_median_imputer,
+    dataframe=node_rows.outputs["results"],
+    imputation_method=incremental_wb.inputs["imputation_method"],
+    statistics_uri=incremental_wb.inputs["statistics_uri"],
+    offset=node_offset.outputs["o0"],
+    window=node_window.outputs["results"],
+)
+node_selected = incremental_wb.add_entity(
+    univariate_selection,
+    dataframe=node_imputed.outputs["o0"],
+    split_mask=23,
+    num_features=incremental_wb.inputs["num_features"],
+)
+incremental_wb.add_workflow_output(
+    "output_from_t3", node_selected.outputs["o0"], python_type=pd.DataFrame
+)
+
+sqlite_dataclean_incremental_lp = LaunchPlan.get_or_create(
+    workflow=incremental_wb,
+    name="sqlite_datacleaning_incremental",
+    default_inputs={
+        **DEFAULT_INPUTS,
+        "statistics_uri": "s3://flyte-demo/sqlite_datacleaning/imputer_statistics.json",
+    },
+    schedule=CronSchedule("0 10 * * ? *"),
+)
+
 if __name__ == "__main__":
     print(
         wb(
@@ -0,0 +1,225 @@
+"""
+Reference Task Resolution Cache
+-------------------------------
+
+The data cleaning workflow declares the interface of every reference task by hand, in the signature of a stub
+function. With a handful of references that is fine, but a generated workflow that references hundreds of tasks needs
+their interfaces from Flyte Admin, and fetching hundreds of task definitions makes every compile slow and dependent on
+the network.
+
+A task version is immutable once it is registered, so its interface never changes. This makes interfaces safe to
+cache locally, keyed by project, domain, name and version. With the cache in place, only the first compile talks to
+Admin and every compile after that is served from the local disk. For fully offline - and deterministic - compiles,
+Admin can be replaced by a local stand-in that serves interfaces from the output of ``pyflyte serialize``.
+"""
+import glob
+import os
+import time
+import typing
+
+import pandas as pd
+from flyteidl.admin import task_pb2 as _admin_task_pb2
+from flyteidl.core import interface_pb2
+from flytekit.core.interface import transform_interface_to_typed_interface
+from flytekit.core.reference_entity import TaskReference
+from flytekit.core.task import ReferenceTask
+from flytekit.core.type_engine import TypeEngine
+from flytekit.models import interface as interface_models
+from google.protobuf import json_format
+
+CACHE_DIR_ENV = "FLYTE_REFERENCE_CACHE_DIR"
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "flytesnacks", "references"
+)
+
+
+# %%
+# Resolving Interfaces
+# ^^^^^^^^^^^^^^^^^^^^
+# A resolver returns the interface of a referenced task. ``AdminResolver`` asks Flyte Admin through a
+# :py:class:`flytekit.clients.friendly.SynchronousFlyteClient`.
+class AdminResolver(object):
+    def __init__(self, client):
+        self._client = client
+
+    def resolve(self, reference: TaskReference) -> interface_models.TypedInterface:
+        task = self._client.get_task(reference.id)
+        return task.closure.compiled_task.template.interface
+
+
+# %%
+# ``LocalAdmin`` is the offline stand-in. It stores interfaces as JSON files in a directory, which can be filled from
+# the ``*_1.pb`` task specs that ``pyflyte serialize`` writes - e.g. with ``make serialize`` - or from the tasks
+# themselves. Serialized specs do not know the project, domain and version they will be registered with, so those are
+# passed in.
+class LocalAdmin(object):
+    def __init__(self, directory: str):
+        self._dir = directory
+
+    def _path(self, reference: TaskReference) -> str:
+        return os.path.join(
+            self._dir,
+            reference.project,
+            reference.domain,
+            reference.name,
+            f"{reference.version}.json",
+        )
+
+    def register(
+        self, reference: TaskReference, interface: interface_models.TypedInterface
+    ):
+        path = self._path(reference)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(json_format.MessageToJson(interface.to_flyte_idl()))
+        # Other compiles may read the same interface concurrently
+        os.replace(tmp, path)
+
+    def load_serialized(self, directory: str, project: str, domain: str, version: str):
+        for path in sorted(glob.glob(os.path.join(directory, "*_1.pb"))):
+            spec = _admin_task_pb2.TaskSpec()
+            with open(path, "rb") as f:
+                spec.ParseFromString(f.read())
+            self.register(
+                TaskReference(project, domain, spec.template.id.name, version),
+                interface_models.TypedInterface.from_flyte_idl(spec.template.interface),
+            )
+
+    def resolve(
+        self, reference: TaskReference
+    ) -> typing.Optional[interface_models.TypedInterface]:
+        try:
+            with open(self._path(reference)) as f:
+                return interface_models.TypedInterface.from_flyte_idl(
+                    json_format.Parse(f.read(), interface_pb2.TypedInterface())
+                )
+        except FileNotFoundError:
+            return None
+
+
+# %%
+# The Cache
+# ^^^^^^^^^
+# ``ReferenceCache`` checks an in-memory dictionary first, then the files on disk - which are laid out just like the
+# ones of the ``LocalAdmin`` - and only then asks its resolver. The python types of the interface are guessed from its
+# Flyte literal types, e.g. a schema becomes a :py:class:`flytekit.types.schema.FlyteSchema`. Guessing a type tries
+# every registered transformer in turn, and most references share the same few types, so the guesses are cached too.
+_PYTHON_TYPES: typing.Dict[bytes, type] = {}
+
+
+def guess_python_types(
+    variables: typing.Dict[str, interface_models.Variable],
+) -> typing.Dict[str, type]:
+    python_types = {}
+    for name, variable in variables.items():
+        key = variable.type.to_flyte_idl().SerializeToString()
+        if key not in _PYTHON_TYPES:
+            _PYTHON_TYPES[key] = TypeEngine.guess_python_type(variable.type)
+        python_types[name] = _PYTHON_TYPES[key]
+    return python_types
+
+
+class ReferenceCache(object):
+    def __init__(self, cache_dir: typing.Optional[str] = None, resolver=None):
+        self._disk = LocalAdmin(
+            cache_dir or os.environ.get(CACHE_DIR_ENV, DEFAULT_CACHE_DIR)
+        )
+        self._resolver = resolver
+        self._memory: typing.Dict[
+            typing.Tuple[str, str, str, str],
+            typing.Tuple[typing.Dict[str, type], typing.Dict[str, type]],
+        ] = {}
+
+    def interface(self, reference: TaskReference) -> interface_models.TypedInterface:
+        interface = self._disk.resolve(reference)
+        if interface is None:
+            task = f"{reference.project}/{reference.domain}/{reference.name}:{reference.version}"
+            if self._resolver is None:
+                raise ValueError(
+                    f"Interface of {task} is not cached and there is no resolver to look it up"
+                )
+            interface = self._resolver.resolve(reference)
+            if interface is None:
+                raise ValueError(f"Task {task} not found")
+            self._disk.register(reference, interface)
+        return interface
+
+    def reference_task(
+        self, project: str, domain: str, name: str, version: str
+    ) -> ReferenceTask:
+        """
+        Returns a reference task like :py:func:`flytekit.reference_task` does, without requiring a stub for its
+        interface
+        """
+        key = (project, domain, name, version)
+        if key not in self._memory:
+            interface = self.interface(TaskReference(*key))
+            self._memory[key] = (
+                guess_python_types(interface.inputs),
+                guess_python_types(interface.outputs),
+            )
+        inputs, outputs = self._memory[key]
+        return ReferenceTask(project, domain, name, version, inputs, outputs)
+
+
+# %%
+# Compiling Offline
+# ^^^^^^^^^^^^^^^^^
+# To compile without Admin, the stand-in is filled with the interfaces of the data cleaning tasks and the cache resolves
+# from it. We then resolve the same references many times over - like a generated workflow that references hundreds of
+# tasks would - with an empty cache, with the cache on disk only, as in a new compile, and with the cache in memory.
+def populate_from_tasks(
+    admin: LocalAdmin, tasks: typing.List, project: str, domain: str, version: str
+):
+    for t in tasks:
+        admin.register(
+            TaskReference(project, domain, t.name, version),
+            transform_interface_to_typed_interface(t.python_interface),
+        )
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    from flytekit import Workflow
+
+    try:
+        from . import datacleaning_tasks
+    except ImportError:
+        import datacleaning_tasks
+
+    project, domain, version = "flytesnacks", "development", "v1"
+    tasks = [
+        datacleaning_tasks.mean_median_imputer,
+        datacleaning_tasks.univariate_selection,
+    ]
+    with tempfile.TemporaryDirectory() as d:
+        admin = LocalAdmin(os.path.join(d, "admin"))
+        for i in range(500):
+            populate_from_tasks(admin, tasks, project, domain, f"{version}.{i}")
+
+        # A new cache stands for a new compile, which only finds the interfaces on disk
+        for label in ("empty cache", "cache on disk", "cache in memory"):
+            if label != "cache in memory":
+                cache = ReferenceCache(os.path.join(d, "cache"), resolver=admin)
+            start = time.monotonic()
+            for i in range(500):
+                for t in tasks:
+                    cache.reference_task(project, domain, t.name, f"{version}.{i}")
+            print(
+                f"Resolved 1000 references ({label}) in {time.monotonic() - start:.3f}s"
+            )
+
+        imputer = cache.reference_task(project, domain, tasks[0].name, f"{version}.0")
+        selection = cache.reference_task(project, domain, tasks[1].name, f"{version}.0")
+        wb = Workflow(name="sqlite_datacleaning.reference_cache.wf")
+        wb.add_workflow_input("dataframe", pd.DataFrame)
+        n1 = wb.add_entity(
+            imputer, dataframe=wb.inputs["dataframe"], imputation_method="mean"
+        )
+        n2 = wb.add_entity(
+            selection, dataframe=n1.outputs["o0"], split_mask=23, num_features=15
+        )
+        wb.add_workflow_output("o0", n2.outputs["o0"])
+        print(f"Compiled {wb.name} with {len(wb.nodes)} nodes")
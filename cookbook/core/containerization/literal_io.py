@@ -0,0 +1,320 @@
+"""
+.. _literal_io:
+
+Reading and Writing Literal Maps in Containers
+----------------------------------------------
+
+A raw container with ``metadata_format=ContainerTask.MetadataFormat.PROTO`` finds all of its inputs in a single binary
+file, ``inputs.pb`` in its input directory: a ``LiteralMap`` protobuf message. Reading it usually takes flyteidl and
+protobuf, which most container images do not have. This module reads and writes those files with nothing but the Python
+standard library, so it can be copied into any image that has Python.
+
+The file is memory mapped, and only indexed when it is opened: a value is decoded when it is accessed, and binary values
+are returned as views on the mapped file rather than copies. Primitives, ``None``, binaries, and collections and maps of
+those are supported; blobs and schemas are not. Integers have to fit into 64 bits, like in Flyte.
+
+The decoder is plain Python, so it pays off for collections - a list of floats is unpacked at once - and for large
+binary and string values, which are not copied. A map of a few small primitives is read about as fast from the JSON
+metadata file, which is parsed by the C implementation of the ``json`` module, and can be faster for many of them.
+"""
+import datetime
+import mmap
+import struct
+import typing
+from collections.abc import Mapping
+
+# %%
+# Encoding
+# ^^^^^^^^
+# The field numbers are the ones of ``flyteidl/core/literals.proto``. Values are mapped to literals the way flytekit
+# maps the matching Python types.
+_VARINT, _FIXED64, _BYTES = 0, 1, 2
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def _varint(n: int) -> bytes:
+    # Negative integers are written in two's complement, like protobuf's int64
+    if not -(1 << 63) <= n < 1 << 63:
+        raise OverflowError(f"{n} does not fit into a 64-bit integer")
+    n &= (1 << 64) - 1
+    out = bytearray()
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+def _field(number: int, wire_type: int, payload: bytes) -> bytes:
+    if wire_type == _BYTES:
+        payload = _varint(len(payload)) + payload
+    return _varint(number << 3 | wire_type) + payload
+
+
+def _seconds_and_nanos(seconds: int, micros: int) -> bytes:
+    return _field(1, _VARINT, _varint(seconds)) + _field(
+        2, _VARINT, _varint(micros * 1000)
+    )
+
+
+def _encode_literal(value: typing.Any) -> bytes:
+    if value is None:
+        return _field(1, _BYTES, _field(5, _BYTES, b""))
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return _field(1, _BYTES, _field(3, _BYTES, _field(1, _BYTES, bytes(value))))
+    if isinstance(value, (list, tuple)):
+        return _field(
+            2, _BYTES, b"".join(_field(1, _BYTES, _encode_literal(v)) for v in value)
+        )
+    if isinstance(value, dict):
+        return _field(3, _BYTES, _encode_map(value))
+
+    if isinstance(value, bool):
+        primitive = _field(4, _VARINT, _varint(int(value)))
+    elif isinstance(value, int):
+        primitive = _field(1, _VARINT, _varint(value))
+    elif isinstance(value, float):
+        primitive = _field(2, _FIXED64, struct.pack("<d", value))
+    elif isinstance(value, str):
+        primitive = _field(3, _BYTES, value.encode("utf-8"))
+    elif isinstance(value, datetime.datetime):
+        delta = value - _EPOCH if value.tzinfo else value - _EPOCH.replace(tzinfo=None)
+        primitive = _field(
+            5,
+            _BYTES,
+            _seconds_and_nanos(delta.days * 86400 + delta.seconds, delta.microseconds),
+        )
+    elif isinstance(value, datetime.timedelta):
+        primitive = _field(
+            6,
+            _BYTES,
+            _seconds_and_nanos(value.days * 86400 + value.seconds, value.microseconds),
+        )
+    else:
+        raise TypeError(f"Values of type {type(value)} are not supported")
+    return _field(1, _BYTES, _field(1, _BYTES, primitive))
+
+
+def _encode_map(values: typing.Dict[str, typing.Any]) -> bytes:
+    return b"".join(
+        _field(
+            1,
+            _BYTES,
+            _field(1, _BYTES, k.encode("utf-8"))
+            + _field(2, _BYTES, _encode_literal(v)),
+        )
+        for k, v in values.items()
+    )
+
+
+def dumps(values: typing.Dict[str, typing.Any]) -> bytes:
+    return _encode_map(values)
+
+
+def dump(values: typing.Dict[str, typing.Any], path: str):
+    with open(path, "wb") as f:
+        f.write(dumps(values))
+
+
+# %%
+# Decoding
+# ^^^^^^^^
+# Messages are walked field by field. A field is returned with the bounds of its payload for length delimited fields,
+# and with its value otherwise, so nested messages are decoded in place, without copying them out of the buffer.
+def _read_varint(buf: memoryview, pos: int) -> typing.Tuple[int, int]:
+    b = buf[pos]
+    if b < 0x80:
+        return b, pos + 1
+    result = shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if not b & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _fields(
+    buf: memoryview, start: int, end: int
+) -> typing.Iterator[typing.Tuple[int, typing.Any]]:
+    pos = start
+    while pos < end:
+        key, pos = _read_varint(buf, pos)
+        wire_type = key & 7
+        if wire_type == _VARINT:
+            value, pos = _read_varint(buf, pos)
+        elif wire_type == _FIXED64:
+            value, pos = pos, pos + 8
+        elif wire_type == _BYTES:
+            length, pos = _read_varint(buf, pos)
+            value, pos = (pos, pos + length), pos + length
+        elif wire_type == 5:
+            value, pos = pos, pos + 4
+        else:
+            raise ValueError(f"Unsupported wire type {wire_type}")
+        yield key >> 3, value
+
+
+def _signed(n: int) -> int:
+    return n - (1 << 64) if n >= 1 << 63 else n
+
+
+def _time(buf: memoryview, start: int, end: int) -> datetime.timedelta:
+    seconds = nanos = 0
+    for number, value in _fields(buf, start, end):
+        if number == 1:
+            seconds = _signed(value)
+        elif number == 2:
+            nanos = value
+    return datetime.timedelta(seconds=seconds, microseconds=nanos // 1000)
+
+
+def _decode_primitive(buf: memoryview, start: int, end: int) -> typing.Any:
+    tag = buf[start] if start < end else None
+    if tag == 0x11:
+        return _DOUBLE.unpack_from(buf, start + 1)[0]
+    if tag == 0x08:
+        return _signed(_read_varint(buf, start + 1)[0])
+    for number, value in _fields(buf, start, end):
+        if number == 1:
+            return _signed(value)
+        if number == 2:
+            return _DOUBLE.unpack_from(buf, value)[0]
+        if number == 3:
+            return str(buf[value[0] : value[1]], "utf-8")
+        if number == 4:
+            return bool(value)
+        if number == 5:
+            return _EPOCH + _time(buf, *value)
+        if number == 6:
+            return _time(buf, *value)
+    return None
+
+
+# %%
+# Most literals are small primitives, whose nested messages all have lengths below 128. Their layout is fixed, so the
+# primitive is found without walking the literal and its scalar. Collections of floats have a fixed layout as well:
+# 15 bytes per float, of which the last 8 are the float, so they are unpacked all at once.
+_DOUBLE = struct.Struct("<d")
+_DOUBLE_RECORD = struct.Struct("<7xd")
+_DOUBLE_HEADER = b"\x0a\x0d\x0a\x0b\x0a\x09\x11"
+
+
+def _decode_collection(buf: memoryview, start: int, end: int) -> typing.List:
+    size = end - start
+    if size and size % _DOUBLE_RECORD.size == 0:
+        records = buf[start:end]
+        n = size // _DOUBLE_RECORD.size
+        if all(
+            records[i :: _DOUBLE_RECORD.size] == _DOUBLE_HEADER[i : i + 1] * n
+            for i in range(len(_DOUBLE_HEADER))
+        ):
+            return [v for (v,) in _DOUBLE_RECORD.iter_unpack(records)]
+    return [_decode_literal(buf, *v) for n, v in _fields(buf, start, end) if n == 1]
+
+
+def _decode_literal(buf: memoryview, start: int, end: int) -> typing.Any:
+    if end - start < 128 and buf[start] == 0x0A and buf[start + 2] == 0x0A:
+        return _decode_primitive(buf, start + 4, end)
+    for number, value in _fields(buf, start, end):
+        if number == 1:
+            for scalar_number, scalar in _fields(buf, *value):
+                if scalar_number == 1:
+                    return _decode_primitive(buf, *scalar)
+                if scalar_number == 3:
+                    for binary_number, binary in _fields(buf, *scalar):
+                        if binary_number == 1:
+                            return buf[binary[0] : binary[1]]
+                    return buf[0:0]
+                if scalar_number == 5:
+                    return None
+                raise ValueError(f"Scalars of field {scalar_number} are not supported")
+        if number == 2:
+            return _decode_collection(buf, *value)
+        if number == 3:
+            return {k: _decode_literal(buf, *v) for k, v in _index(buf, *value).items()}
+    return None
+
+
+def _index(
+    buf: memoryview, start: int, end: int
+) -> typing.Dict[str, typing.Tuple[int, int]]:
+    # Maps and their entries only have length delimited fields with numbers below 16 - their tags take one byte - so
+    # they are walked without _fields, reading the lengths in place unless they take more than one byte
+    index = {}
+    pos = start
+    while pos < end:
+        tag, length = buf[pos], buf[pos + 1]
+        if length < 0x80:
+            pos += 2
+        else:
+            length, pos = _read_varint(buf, pos + 1)
+        entry_end = pos + length
+        if tag == 0x0A:
+            key, value = "", (entry_end, entry_end)
+            while pos < entry_end:
+                tag, length = buf[pos], buf[pos + 1]
+                if length < 0x80:
+                    pos += 2
+                else:
+                    length, pos = _read_varint(buf, pos + 1)
+                if tag == 0x0A:
+                    key = str(buf[pos : pos + length], "utf-8")
+                elif tag == 0x12:
+                    value = (pos, pos + length)
+                pos += length
+            index[key] = value
+        pos = entry_end
+    return index
+
+
+# %%
+# Literal Files
+# ^^^^^^^^^^^^^
+# A ``LiteralFile`` is a read-only mapping from the names of the literal map to their values. Binary values are views
+# on the file, which keep it mapped until they are released.
+class LiteralFile(Mapping):
+    def __init__(self, data: typing.Union[bytes, mmap.mmap]):
+        self._data = data
+        self._buf = memoryview(data)
+        self._index = _index(self._buf, 0, len(self._buf))
+
+    def __getitem__(self, key: str) -> typing.Any:
+        return _decode_literal(self._buf, *self._index[key])
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def close(self):
+        try:
+            self._buf.release()
+            if isinstance(self._data, mmap.mmap):
+                self._data.close()
+        except BufferError:
+            # Binary values are still in use, the file is unmapped once they are gone
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def loads(data: bytes) -> LiteralFile:
+    return LiteralFile(data)
+
+
+def load(path: str, use_mmap: bool = True) -> LiteralFile:
+    with open(path, "rb") as f:
+        if use_mmap:
+            try:
+                return LiteralFile(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            except ValueError:
+                # Empty files cannot be mapped
+                pass
+        return LiteralFile(f.read())
@@ -0,0 +1,308 @@
+"""
+.. _local_containers:
+
+Running Raw Containers Locally
+------------------------------
+
+Running :ref:`the raw container example <raw_container>` locally performs no execution: flytekit cannot run containers,
+so ``raw_container_wf`` returns nothing unless the containers are mocked.
+
+The commands of most raw containers - like the shell commands of ``square`` and ``sum`` - run just as well on the local
+machine though. This example runs them as plain local processes: every container gets temporary input and output
+directories in place of ``input_data_dir`` and ``output_data_dir``, an empty working directory and an environment with
+nothing but ``PATH`` and the environment of the task. Containers that do not depend on each other, like the two
+``square`` calls, run at the same time, so raw container workflows can be run - and timed - end to end on one machine.
+
+This is not a sandbox. The commands run as the current user, with the local ``PATH``, and can read and write anything
+that user can - none of the isolation of a container applies, and the image of the task is not used at all. Only run
+containers whose commands you would run in a shell yourself.
+"""
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import typing
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from flyteidl.core import literals_pb2 as _literals_pb2
+from flytekit import ContainerTask, kwtypes, workflow
+from flytekit.common import constants as _common_constants
+from flytekit.core.context_manager import FlyteContextManager, SerializationSettings, get_image_config
+from flytekit.core.python_function_task import PythonFunctionTask
+from flytekit.core.type_engine import TypeEngine
+from flytekit.core.workflow import PythonFunctionWorkflow
+from flytekit.models import literals as _literal_models
+from google.protobuf import json_format as _json_format
+
+from core.containerization.raw_container import raw_container_wf, sum
+
+# %%
+# Running a Container
+# ^^^^^^^^^^^^^^^^^^^
+# The container is taken from the task the way it is serialized, so the command is exactly what Flyte would run. Inputs
+# are written to the input directory like Flyte's raw protocol does - one file per primitive input, and all inputs as a
+# literal map in the ``metadata_format`` of the task, e.g. ``inputs.pb`` - and ``{{.Inputs.<name>}}`` in the command is
+# replaced with the value of the input. Paths under the data directories, and under the container paths of ``mounts``,
+# are rewritten to the directories on the local machine - as a whole or up to a ``/``, by their longest matching prefix,
+# so that a mount of ``/var/inputs`` leaves ``/var/inputs2`` alone. Outputs are read from a literal map in
+# ``outputs.pb``, if the container writes one - see :ref:`literal_io` - or else from the file of their name in the
+# output directory.
+_SETTINGS = SerializationSettings(
+    project="flytesnacks",
+    domain="development",
+    version="local",
+    env={},
+    image_config=get_image_config("flytesnacks:local"),
+)
+
+_TEMPLATE = re.compile(r"{{\s*\.[Ii]nputs\.(\w+)\s*}}")
+
+_METADATA_FILES = {
+    ContainerTask.MetadataFormat.JSON.value: "inputs.json",
+    # JSON is valid YAML
+    ContainerTask.MetadataFormat.YAML.value: "inputs.yaml",
+    ContainerTask.MetadataFormat.PROTO.value: "inputs.pb",
+}
+
+_PARSERS = {
+    int: int,
+    float: float,
+    str: lambda s: s.rstrip("\n"),
+    bool: lambda s: s.strip().lower() == "true",
+}
+
+
+def run_container(
+    task: ContainerTask,
+    mounts: typing.Optional[typing.Dict[str, str]] = None,
+    **kwargs,
+) -> typing.Dict[str, typing.Any]:
+    container = task.get_container(_SETTINGS)
+    data_config = container.data_loading_config.to_flyte_idl()
+
+    scratch = tempfile.mkdtemp(prefix=f"{task.name}-")
+    try:
+        input_dir = os.path.join(scratch, "inputs")
+        output_dir = os.path.join(scratch, "outputs")
+        work_dir = os.path.join(scratch, "work")
+        for d in (input_dir, output_dir, work_dir):
+            os.mkdir(d)
+
+        ctx = FlyteContextManager.current_context()
+        literals = {}
+        for var, t in task.python_interface.inputs.items():
+            literals[var] = TypeEngine.to_literal(
+                ctx, kwargs[var], t, TypeEngine.to_literal_type(t)
+            )
+            if t in _PARSERS:
+                with open(os.path.join(input_dir, var), "w") as f:
+                    f.write(str(kwargs[var]).lower() if t is bool else str(kwargs[var]))
+        literal_map = _literal_models.LiteralMap(literals=literals).to_flyte_idl()
+        with open(
+            os.path.join(input_dir, _METADATA_FILES[data_config.format]), "wb"
+        ) as f:
+            if data_config.format == ContainerTask.MetadataFormat.PROTO.value:
+                f.write(literal_map.SerializeToString())
+            else:
+                f.write(_json_format.MessageToJson(literal_map).encode())
+
+        paths = {**(mounts or {})}
+        if data_config.input_path:
+            paths[data_config.input_path] = input_dir
+        if data_config.output_path:
+            paths[data_config.output_path] = output_dir
+
+        prefixes = re.compile(
+            r"(?<![\w./-])("
+            + "|".join(
+                re.escape(p.rstrip("/") or "/")
+                for p in sorted(paths, key=len, reverse=True)
+            )
+            + r")(?![\w.-])"
+        )
+        local_paths = {p.rstrip("/") or "/": local for p, local in paths.items()}
+
+        def render(arg: str) -> str:
+            arg = _TEMPLATE.sub(lambda m: str(kwargs[m.group(1)]), arg)
+            if local_paths:
+                arg = prefixes.sub(lambda m: local_paths[m.group(1)], arg)
+            return arg
+
+        command = [
+            render(a) for a in (container.command or []) + (container.args or [])
+        ]
+        timeout = (
+            task.metadata.timeout.total_seconds() if task.metadata.timeout else None
+        )
+        process = subprocess.run(
+            command,
+            cwd=work_dir,
+            env={
+                "PATH": os.environ.get("PATH", ""),
+                **{k: render(v) for k, v in (container.env or {}).items()},
+            },
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+        )
+        if process.returncode != 0:
+            raise RuntimeError(
+                f"{task.name} exited with {process.returncode}: {process.stderr[-1000:]}"
+            )
+
+        output_types = task.python_interface.outputs
+        if os.path.exists(os.path.join(output_dir, "outputs.pb")):
+            output_map = _literals_pb2.LiteralMap()
+            with open(os.path.join(output_dir, "outputs.pb"), "rb") as f:
+                output_map.ParseFromString(f.read())
+            return TypeEngine.literal_map_to_kwargs(
+                ctx, _literal_models.LiteralMap.from_flyte_idl(output_map), output_types
+            )
+
+        outputs = {}
+        for var, t in output_types.items():
+            if t not in _PARSERS:
+                raise ValueError(
+                    f"Output {var} of {task.name} is a {t}, which is only supported in outputs.pb"
+                )
+            path = os.path.join(output_dir, var)
+            if not os.path.exists(path):
+                raise RuntimeError(f"{task.name} did not write its output {var}")
+            with open(path) as f:
+                outputs[var] = _PARSERS[t](f.read())
+        return outputs
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+# %%
+# Running Workflows
+# ^^^^^^^^^^^^^^^^^
+# A node is started as soon as all nodes it depends on - its upstream nodes and the nodes its inputs are bound to -
+# are done. Containers run in a pool of up to ``max_parallel`` workers; they spend their time in their own process, so
+# threads are enough. Python tasks are run as well, but one at a time, since local execution is not thread safe.
+_python_task_lock = threading.Lock()
+
+
+def _resolve(b: _literal_models.BindingData, values: typing.Dict) -> typing.Any:
+    if b.promise is not None:
+        return values[(b.promise.node_id, b.promise.var)]
+    if b.collection is not None:
+        return [_resolve(c, values) for c in b.collection.bindings]
+    if b.map is not None:
+        return {k: _resolve(v, values) for k, v in b.map.bindings.items()}
+    if b.scalar is not None and b.scalar.primitive is not None:
+        return b.scalar.primitive.value
+    raise ValueError(f"Binding {b} is not supported")
+
+
+def _run_node(node, mounts, kwargs) -> typing.Dict[str, typing.Any]:
+    task = node.flyte_entity
+    if isinstance(task, ContainerTask):
+        return run_container(task, mounts, **kwargs)
+    with _python_task_lock:
+        result = task.execute(**kwargs)
+    outputs = list(task.python_interface.outputs.keys())
+    if len(outputs) == 1:
+        return {outputs[0]: result}
+    return dict(zip(outputs, result or ()))
+
+
+def run_workflow(
+    wf: PythonFunctionWorkflow,
+    max_parallel: int = 8,
+    mounts: typing.Optional[typing.Dict[str, str]] = None,
+    **kwargs,
+):
+    for n in wf.nodes:
+        entity = n.flyte_entity
+        if not isinstance(entity, (ContainerTask, PythonFunctionTask)) or (
+            isinstance(entity, PythonFunctionTask)
+            and entity.execution_mode != PythonFunctionTask.ExecutionBehavior.DEFAULT
+        ):
+            raise ValueError(
+                f"Node {n.id} of {wf.name} runs {entity}, which is not supported"
+            )
+
+    values = {
+        (_common_constants.GLOBAL_INPUT_NODE_ID, k): v
+        for k, v in {**wf.python_interface.default_inputs_as_kwargs, **kwargs}.items()
+    }
+    waiting = {
+        n.id: {u.id for u in n.upstream_nodes}
+        | {
+            b.binding.promise.node_id
+            for b in n.bindings
+            if b.binding.promise is not None
+            and b.binding.promise.node_id != _common_constants.GLOBAL_INPUT_NODE_ID
+        }
+        for n in wf.nodes
+    }
+    nodes = {n.id: n for n in wf.nodes}
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_parallel) as pool:
+        while waiting or running:
+            for node_id in [i for i, deps in waiting.items() if not deps]:
+                del waiting[node_id]
+                node = nodes[node_id]
+                inputs = {b.var: _resolve(b.binding, values) for b in node.bindings}
+                running[pool.submit(_run_node, node, mounts, inputs)] = node_id
+            if not running:
+                raise ValueError(f"{wf.name} has a cycle between {sorted(waiting)}")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                node_id = running.pop(future)
+                for var, v in future.result().items():
+                    values[(node_id, var)] = v
+                for deps in waiting.values():
+                    deps.discard(node_id)
+
+    results = tuple(_resolve(b.binding, values) for b in wf.output_bindings)
+    if len(results) == 1:
+        return results[0]
+    return results or None
+
+
+# %%
+# Timing a Fan-out
+# ^^^^^^^^^^^^^^^^
+# ``slow_square`` takes a second, like a container that does some real work. ``slow_squares_wf`` squares four numbers
+# and sums them up pairwise, so its four squares can run at the same time.
+slow_square = ContainerTask(
+    name="slow_square",
+    input_data_dir="/var/inputs",
+    output_data_dir="/var/outputs",
+    inputs=kwtypes(val=int),
+    outputs=kwtypes(out=int),
+    image="alpine",
+    command=[
+        "sh",
+        "-c",
+        "sleep 1; echo $(( {{.Inputs.val}} * {{.Inputs.val}} )) | tee /var/outputs/out",
+    ],
+)
+
+
+@workflow
+def slow_squares_wf(a: int, b: int, c: int, d: int) -> int:
+    return sum(
+        x=sum(x=slow_square(val=a), y=slow_square(val=b)),
+        y=sum(x=slow_square(val=c), y=slow_square(val=d)),
+    )
+
+
+if __name__ == "__main__":
+    print(
+        f"raw_container_wf(val1=3, val2=4) = {run_workflow(raw_container_wf, val1=3, val2=4)}"
+    )
+    for max_parallel in (1, 4):
+        start = time.perf_counter()
+        result = run_workflow(
+            slow_squares_wf, max_parallel=max_parallel, a=1, b=2, c=3, d=4
+        )
+        print(
+            f"slow_squares_wf(1, 2, 3, 4) = {result} with {max_parallel} workers in {time.perf_counter() - start:.2f}s"
+        )
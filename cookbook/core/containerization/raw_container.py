@@ -66,7 +66,8 @@ def raw_container_wf(val1: int, val2: int) -> int:
 
 # %%
 # ContainerTasks cannot really be executed locally as Flytekit is incapable of executing Containers currently.
-# but it is possible to mock the execution.
+# but it is possible to mock the execution, or to run the commands as local processes as shown in
+# :ref:`local_containers`.
 if __name__ == "__main__":
     print(f"Running {__file__} main...")
     print(
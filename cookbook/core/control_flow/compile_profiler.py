@@ -0,0 +1,301 @@
+"""
+.. _compile_profiler:
+
+Profiling Workflow Compilation
+------------------------------
+
+Workflows are compiled by running their Python body: every task call creates a node, every input creates a binding and
+every binding converts a value or a promise with the type engine. Dynamic workflows do the same at run time, before
+they are serialized and handed back to Flyte. For workflows with many nodes, nested conditions or deep subworkflows,
+compilation can take a noticeable amount of time - and it is not obvious where it goes.
+
+This example builds a small profiler that records how long the compilation of each workflow, each node, each binding
+and each type transformation takes, counts the nodes and edges of every compiled workflow, and writes everything to a
+`Chrome trace <https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU>`__ that can be opened
+in ``chrome://tracing`` or `Perfetto <https://ui.perfetto.dev>`__.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import typing
+
+from flytekit.common import constants as _common_constants
+from flytekit.common import translator
+from flytekit.core import condition
+from flytekit.core import interface as flyte_interface
+from flytekit.core import promise
+from flytekit.core.context_manager import FlyteContextManager, SerializationSettings, get_image_config
+from flytekit.core.python_function_task import PythonFunctionTask
+from flytekit.core.type_engine import TypeEngine
+from flytekit.core.workflow import PythonFunctionWorkflow
+
+
+# %%
+# Counting Nodes and Edges
+# ^^^^^^^^^^^^^^^^^^^^^^^^
+# An edge is a dependency of a node on an upstream node, whether data is passed along it or not. Dependencies on the
+# inputs of the workflow - the global start node - are not counted. The nodes of the cases of a branch, and of
+# subworkflows, are compiled along with the workflow, so they are counted as well.
+def _children(node) -> typing.List:
+    entity = node.flyte_entity
+    if isinstance(entity, condition.BranchNode):
+        block = entity._ifelse_block
+        children = [c.then_node for c in [block.case] + (block.other or [])]
+        return children + ([block.else_node] if block.else_node else [])
+    if isinstance(entity, PythonFunctionWorkflow):
+        return entity.nodes
+    return []
+
+
+def graph_size(nodes: typing.List) -> typing.Tuple[int, int]:
+    size, edges = len(nodes), 0
+    for n in nodes:
+        edges += sum(
+            1
+            for u in n.upstream_nodes
+            if u.id != _common_constants.GLOBAL_INPUT_NODE_ID
+        )
+        child_size, child_edges = graph_size(_children(n))
+        size += child_size
+        edges += child_edges
+    return size, edges
+
+
+# %%
+# The Profiler
+# ^^^^^^^^^^^^
+# The profiler wraps the flytekit functions that do the work while it is active. Functions like
+# ``create_and_link_node`` are imported by name into several flytekit modules, so every module that holds a reference
+# to the original function gets the wrapper. Spans nest - a binding is resolved while its node is constructed - so
+# besides the total time of every category, the summary reports the self time, which excludes nested spans.
+NODE = "node"
+BINDING = "binding"
+TYPE = "type"
+WORKFLOW = "workflow"
+BRANCH = "branch"
+SERIALIZE = "serialize"
+
+
+def _name(entity) -> str:
+    # Nodes have an id instead of a name
+    return getattr(entity, "name", None) or entity.id
+
+
+class CompileProfiler(object):
+    def __init__(self):
+        self.events: typing.List[typing.Dict[str, typing.Any]] = []
+        self.graphs: typing.List[typing.Dict[str, typing.Any]] = []
+        self._stack: typing.List[typing.List[float]] = []
+        self._patches: typing.List[typing.Tuple[typing.Any, str, typing.Any]] = []
+        self._start = 0.0
+
+    def _span(
+        self, category: str, name: typing.Callable[..., str], fn: typing.Callable
+    ):
+        profiler = self
+
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            # The second element accumulates the time spent in nested spans
+            profiler._stack.append([start, 0.0])
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _, nested = profiler._stack.pop()
+                end = time.perf_counter()
+                if profiler._stack:
+                    profiler._stack[-1][1] += end - start
+                profiler.events.append(
+                    {
+                        "name": name(*args, **kwargs),
+                        "cat": category,
+                        "ph": "X",
+                        "ts": (start - profiler._start) * 1e6,
+                        "dur": (end - start) * 1e6,
+                        "pid": os.getpid(),
+                        "tid": threading.get_ident(),
+                        "args": {"self_us": (end - start - nested) * 1e6},
+                    }
+                )
+
+        return wrapper
+
+    def _patch_function(
+        self, module, attr: str, category: str, name: typing.Callable[..., str]
+    ):
+        original = getattr(module, attr)
+        wrapper = self._span(category, name, original)
+        for m in list(sys.modules.values()):
+            if (
+                getattr(m, "__name__", "").startswith("flytekit")
+                and getattr(m, attr, None) is original
+            ):
+                self._patches.append((m, attr, original))
+                setattr(m, attr, wrapper)
+
+    def _patch_method(
+        self,
+        cls,
+        attr: str,
+        category: str,
+        name: typing.Callable[..., str],
+        classmethod_=False,
+    ):
+        original = cls.__dict__[attr]
+        fn = original.__func__ if classmethod_ else original
+        wrapper = self._span(category, name, fn)
+        self._patches.append((cls, attr, original))
+        setattr(cls, attr, classmethod(wrapper) if classmethod_ else wrapper)
+
+    def _compile(self, wf, *args, **kwargs):
+        # Wraps the compilation of a workflow to count its nodes and edges once it is done
+        result = self._original_compile(wf, *args, **kwargs)
+        nodes, edges = graph_size(wf.nodes)
+        self.graphs.append({"workflow": wf.name, "nodes": nodes, "edges": edges})
+        return result
+
+    def __enter__(self) -> "CompileProfiler":
+        self._start = time.perf_counter()
+        self._original_compile = PythonFunctionWorkflow.compile
+        self._patches.append(
+            (PythonFunctionWorkflow, "compile", self._original_compile)
+        )
+        PythonFunctionWorkflow.compile = self._span(
+            WORKFLOW,
+            lambda wf, **kwargs: f"compile {wf.name}",
+            lambda wf, *a, **k: self._compile(wf, *a, **k),
+        )
+        self._patch_function(
+            promise,
+            "create_and_link_node",
+            NODE,
+            lambda ctx, entity, *args, **kwargs: f"node {entity.name}",
+        )
+        self._patch_function(
+            promise,
+            "binding_from_python_std",
+            BINDING,
+            lambda ctx, var_name, *args, **kwargs: f"binding {var_name}",
+        )
+        self._patch_function(
+            condition,
+            "to_branch_node",
+            BRANCH,
+            lambda name, cs: f"branch {name}",
+        )
+        self._patch_function(
+            flyte_interface,
+            "transform_interface_to_typed_interface",
+            TYPE,
+            lambda interface: "typed interface",
+        )
+        self._patch_function(
+            translator,
+            "get_serializable",
+            SERIALIZE,
+            lambda mapping, settings, entity, *args, **kwargs: f"serialize {_name(entity)}",
+        )
+        for attr in ("to_literal_type", "to_literal", "to_python_value"):
+            self._patch_method(
+                TypeEngine,
+                attr,
+                TYPE,
+                lambda *args, attr=attr, **kwargs: attr,
+                classmethod_=True,
+            )
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        for target, attr, original in reversed(self._patches):
+            setattr(target, attr, original)
+        self._patches = []
+
+    def summary(self) -> typing.Dict[str, typing.Any]:
+        categories = {}
+        for e in self.events:
+            c = categories.setdefault(
+                e["cat"], {"count": 0, "total_ms": 0.0, "self_ms": 0.0}
+            )
+            c["count"] += 1
+            c["total_ms"] += e["dur"] / 1000
+            c["self_ms"] += e["args"]["self_us"] / 1000
+        return {"categories": categories, "workflows": self.graphs}
+
+    def write_chrome_trace(self, path: str):
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "traceEvents": self.events,
+                    "displayTimeUnit": "ms",
+                    "otherData": {"workflows": self.graphs},
+                },
+                f,
+            )
+
+    def print_summary(self):
+        summary = self.summary()
+        print(f"{'category':<12}{'count':>8}{'total ms':>12}{'self ms':>12}")
+        for name, c in sorted(summary["categories"].items()):
+            print(
+                f"{name:<12}{c['count']:>8}{c['total_ms']:>12.2f}{c['self_ms']:>12.2f}"
+            )
+        for g in summary["workflows"]:
+            print(f"{g['workflow']}: {g['nodes']} nodes, {g['edges']} edges")
+
+
+# %%
+# Profiling the Control Flow Examples
+# ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+# ``@workflow`` compiles when it is declared, so a workflow that already exists is profiled by compiling it again. A
+# ``@dynamic`` workflow compiles - and serializes its workflow - when it runs on a cluster. Run locally, it just calls
+# its function, so ``compile_dynamic`` compiles it the way it would be compiled on a cluster instead.
+def compile_dynamic(task: PythonFunctionTask, **kwargs):
+    ctx = FlyteContextManager.current_context()
+    settings = SerializationSettings(
+        project="flytesnacks",
+        domain="development",
+        version="profile",
+        image_config=get_image_config("flytesnacks:profile"),
+    )
+    with FlyteContextManager.with_context(
+        ctx.with_serialization_settings(settings)
+    ) as ctx:
+        return task.compile_into_workflow(ctx, False, task.task_function, **kwargs)
+
+
+def profile_workflows(
+    workflows: typing.List[PythonFunctionWorkflow],
+    dynamic: typing.List[
+        typing.Tuple[PythonFunctionTask, typing.Dict[str, typing.Any]]
+    ] = None,
+) -> CompileProfiler:
+    with CompileProfiler() as profiler:
+        for wf in workflows:
+            wf.compile()
+        for task, inputs in dynamic or []:
+            compile_dynamic(task, **inputs)
+    return profiler
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    from core.control_flow.run_conditions import nested_conditions
+    from core.control_flow.run_merge_sort import merge_sort, merge_sort_remotely
+    from core.control_flow.subworkflows import nested_parent_wf
+
+    profiler = profile_workflows(
+        [nested_conditions, nested_parent_wf, merge_sort],
+        dynamic=[
+            (
+                merge_sort_remotely,
+                {"numbers": list(range(100, 0, -1)), "run_local_at_count": 10},
+            )
+        ],
+    )
+    profiler.print_summary()
+    path = os.path.join(tempfile.mkdtemp(), "compile_trace.json")
+    profiler.write_chrome_trace(path)
+    print(f"Wrote {len(profiler.events)} events to {path}")
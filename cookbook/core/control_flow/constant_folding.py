@@ -0,0 +1,234 @@
+"""
+.. _constant_folding:
+
+Folding Conditions on Fixed Inputs
+----------------------------------
+
+The workflows in :ref:`the conditions example <sphx_glr_auto_core_control_flow_run_conditions.py>` branch on their
+inputs. A launch plan can fix some of these inputs, and then the outcome of a condition is known before the workflow
+ever runs. Flyte still registers every branch and evaluates the branch node at run time, though.
+
+This example folds such conditions at compile time. Conditions whose operands are all known are evaluated, branches
+that can never be taken are pruned and a branch node with a single remaining branch is replaced by the node of that
+branch. The result is a smaller workflow, without the latency of evaluating branch nodes, that is registered together
+with the launch plan that fixes its inputs.
+"""
+import copy
+import operator
+import typing
+
+from flytekit import LaunchPlan
+from flytekit.common import constants as _common_constants
+from flytekit.core.condition import BranchNode
+from flytekit.core.node import Node
+from flytekit.core.workflow import PythonFunctionWorkflow
+from flytekit.models.core import condition as _core_cond
+from flytekit.models.core import workflow as _core_wf
+
+from core.control_flow.run_conditions import multiplier, multiplier_2, nested_conditions
+
+# %%
+# Evaluating Conditions
+# ^^^^^^^^^^^^^^^^^^^^^
+# A condition compiles to a boolean expression over operands, which are either primitives or variables bound to the
+# inputs of the branch node. A variable is known if it is bound to a fixed workflow input. Since other variables are not
+# known, evaluation uses three values: ``True``, ``False`` and ``None`` for unknown. ``False & x`` is ``False`` and
+# ``True | x`` is ``True`` whatever ``x`` turns out to be.
+_UNKNOWN = object()
+
+_COMPARATORS = {
+    _core_cond.ComparisonExpression.Operator.EQ: operator.eq,
+    _core_cond.ComparisonExpression.Operator.NEQ: operator.ne,
+    _core_cond.ComparisonExpression.Operator.GT: operator.gt,
+    _core_cond.ComparisonExpression.Operator.GTE: operator.ge,
+    _core_cond.ComparisonExpression.Operator.LT: operator.lt,
+    _core_cond.ComparisonExpression.Operator.LTE: operator.le,
+}
+
+
+def known_operands(
+    node: Node, fixed_inputs: typing.Dict[str, typing.Any]
+) -> typing.Dict[str, typing.Any]:
+    known = {}
+    for b in node.bindings:
+        ref = b.binding.promise
+        if (
+            ref is not None
+            and ref.node_id == _common_constants.GLOBAL_INPUT_NODE_ID
+            and ref.var in fixed_inputs
+        ):
+            known[b.var] = fixed_inputs[ref.var]
+    return known
+
+
+def _operand(o: _core_cond.Operand, known: typing.Dict[str, typing.Any]):
+    if o.primitive is not None:
+        return o.primitive.value
+    return known.get(o.var, _UNKNOWN)
+
+
+def evaluate(
+    expr: _core_cond.BooleanExpression, known: typing.Dict[str, typing.Any]
+) -> typing.Optional[bool]:
+    if expr.conjunction is not None:
+        left = evaluate(expr.conjunction.left_expression, known)
+        right = evaluate(expr.conjunction.right_expression, known)
+        if (
+            expr.conjunction.operator
+            == _core_cond.ConjunctionExpression.LogicalOperator.AND
+        ):
+            if left is False or right is False:
+                return False
+            return True if left and right else None
+        if left or right:
+            return True
+        return False if left is False and right is False else None
+    lhs = _operand(expr.comparison.left_value, known)
+    rhs = _operand(expr.comparison.right_value, known)
+    if lhs is _UNKNOWN or rhs is _UNKNOWN:
+        return None
+    return _COMPARATORS[expr.comparison.operator](lhs, rhs)
+
+
+# %%
+# Pruning Branches
+# ^^^^^^^^^^^^^^^^
+# Cases are checked in order. Cases that are known to be false are dropped, and a case that is known to be true becomes
+# the ``else`` of the cases before it - none of the cases after it can ever be taken. If no case remains, the selected
+# node replaces the branch node and takes over its id, so that everything downstream of the branch node is still bound
+# to the right outputs. Nested conditions are folded the same way. A branch that is known to end in ``fail`` fails at
+# compile time instead of at run time.
+def _replace(branch: Node, selected: Node) -> Node:
+    n = Node(
+        id=branch.id,
+        metadata=selected.metadata,
+        bindings=selected.bindings,
+        upstream_nodes=selected.upstream_nodes,
+        flyte_entity=selected.flyte_entity,
+    )
+    n._aliases = selected._aliases
+    return n
+
+
+def fold_node(node: Node, fixed_inputs: typing.Dict[str, typing.Any]) -> Node:
+    if not isinstance(node.flyte_entity, BranchNode):
+        return node
+    block: _core_wf.IfElseBlock = node.flyte_entity._ifelse_block
+    known = known_operands(node, fixed_inputs)
+    cases = []
+    else_node, error = None, None
+    for case in [block.case] + (block.other or []):
+        taken = evaluate(case.condition, known)
+        if taken is False:
+            continue
+        then_node = fold_node(case.then_node, fixed_inputs)
+        if taken:
+            else_node = then_node
+            break
+        cases.append(_core_wf.IfBlock(condition=case.condition, then_node=then_node))
+    else:
+        if block.else_node is not None:
+            else_node = fold_node(block.else_node, fixed_inputs)
+        error = block.error
+
+    if cases:
+        ifelse = _core_wf.IfElseBlock(
+            case=cases[0], other=cases[1:] or None, else_node=else_node, error=error
+        )
+        return Node(
+            id=node.id,
+            metadata=node.metadata,
+            bindings=node.bindings,
+            upstream_nodes=node.upstream_nodes,
+            flyte_entity=BranchNode(node.flyte_entity.name, ifelse),
+        )
+    if else_node is None:
+        raise ValueError(
+            f"Condition {node.flyte_entity.name} always fails for inputs {fixed_inputs}: {error.to_flyte_idl().message}"
+        )
+    return _replace(node, else_node)
+
+
+# %%
+# Folding a Workflow
+# ^^^^^^^^^^^^^^^^^^
+# The workflow is copied, so the original stays as it is. Nodes are in topological order, so by the time a node is
+# visited, all of its upstream nodes have been folded and the node is pointed at their replacements.
+def fold_conditions(
+    wf: PythonFunctionWorkflow,
+    fixed_inputs: typing.Dict[str, typing.Any],
+    name: typing.Optional[str] = None,
+) -> PythonFunctionWorkflow:
+    replaced: typing.Dict[Node, Node] = {}
+    nodes = []
+    for n in wf.nodes:
+        folded = fold_node(n, fixed_inputs)
+        upstream = [replaced.get(u, u) for u in folded.upstream_nodes]
+        if upstream != folded.upstream_nodes:
+            folded = copy.copy(folded)
+            folded._upstream_nodes = upstream
+        replaced[n] = folded
+        nodes.append(folded)
+
+    folded_wf = copy.copy(wf)
+    folded_wf._name = name or f"{wf.name}_folded"
+    folded_wf._nodes = nodes
+    return folded_wf
+
+
+def folded_launch_plan(
+    wf: PythonFunctionWorkflow,
+    name: str,
+    fixed_inputs: typing.Dict[str, typing.Any],
+    **kwargs,
+) -> LaunchPlan:
+    """
+    Returns a launch plan like :py:meth:`flytekit.LaunchPlan.get_or_create` does, for a copy of the workflow that has
+    the conditions on the fixed inputs folded
+    """
+    folded = fold_conditions(wf, fixed_inputs, name=f"{wf.name}.{name}")
+    return LaunchPlan.get_or_create(
+        workflow=folded, name=name, fixed_inputs=fixed_inputs, **kwargs
+    )
+
+
+# %%
+# These launch plans fix the inputs of the workflows in the conditions example. ``multiplier`` and ``multiplier_2``
+# fold down to a single task node and so does ``nested_conditions``, including its inner condition.
+multiplier_fraction_lp = folded_launch_plan(
+    multiplier, "multiplier_fraction", fixed_inputs={"my_input": 0.5}
+)
+multiplier_2_ten_lp = folded_launch_plan(
+    multiplier_2, "multiplier_2_ten", fixed_inputs={"my_input": 10.0}
+)
+nested_conditions_small_lp = folded_launch_plan(
+    nested_conditions, "nested_conditions_small", fixed_inputs={"my_input": 0.4}
+)
+
+
+# %%
+# Counting the nodes - including the ones inside of branches - shows how much smaller the folded workflows are.
+def count_nodes(nodes: typing.List[Node]) -> int:
+    count = 0
+    for n in nodes:
+        count += 1
+        if isinstance(n.flyte_entity, BranchNode):
+            block = n.flyte_entity._ifelse_block
+            inner = [c.then_node for c in [block.case] + (block.other or [])]
+            count += count_nodes(inner + ([block.else_node] if block.else_node else []))
+    return count
+
+
+if __name__ == "__main__":
+    for lp in (multiplier_fraction_lp, multiplier_2_ten_lp, nested_conditions_small_lp):
+        wf = {"multiplier_fraction": multiplier, "multiplier_2_ten": multiplier_2}.get(
+            lp.name, nested_conditions
+        )
+        print(
+            f"{lp.name}: {count_nodes(wf.nodes)} nodes -> {count_nodes(lp.workflow.nodes)} nodes, "
+            f"runs {[n.flyte_entity.name for n in lp.workflow.nodes]}"
+        )
+    try:
+        fold_conditions(nested_conditions, {"my_input": 0.8})
+    except ValueError as e:
+        print(e)
@@ -0,0 +1,233 @@
+"""
+.. _local_conditions:
+
+Fast Local Runs of Conditions
+-----------------------------
+
+Calling a workflow locally runs its Python body every time: the conditions of
+:ref:`the conditions example <sphx_glr_auto_core_control_flow_run_conditions.py>` create their promises, cases and
+branch contexts anew, and all inputs and outputs are converted to Flyte literals and back. In a tight loop - like a
+unit test that runs ``bool_input_wf`` or ``nested_conditions`` for many inputs - that overhead is most of the run time.
+
+The workflow has already been compiled to nodes when it was declared though. This example turns those nodes into plain
+Python functions the first time a workflow is run, and caches them: every condition becomes a decision function and
+every run after the first only evaluates the decisions and calls the selected task.
+"""
+import operator
+import time
+import typing
+
+from flytekit.common import constants as _common_constants
+from flytekit.core.condition import BranchNode
+from flytekit.core.node import Node
+from flytekit.core.python_function_task import PythonFunctionTask
+from flytekit.core.workflow import PythonFunctionWorkflow
+from flytekit.models import literals as _literal_models
+from flytekit.models.core import condition as _core_cond
+from flytekit.models.core import workflow as _core_wf
+
+from core.control_flow.run_conditions import basic_boolean_wf, bool_input_wf, nested_conditions
+
+# %%
+# Compiling Nodes
+# ^^^^^^^^^^^^^^^
+# Values are kept in a dictionary keyed by node id and output name, with the inputs of the workflow under the id of the
+# start node. A binding becomes a getter on that dictionary. Only bindings to outputs and to primitives are compiled -
+# collections and maps of bindings are left to the regular local execution, and so are all tasks that are not plain
+# Python function tasks, e.g. dynamic workflows.
+Values = typing.Dict[typing.Tuple[str, str], typing.Any]
+
+
+class Unsupported(Exception):
+    pass
+
+
+def compile_binding(
+    b: _literal_models.BindingData,
+) -> typing.Callable[[Values], typing.Any]:
+    if b.promise is not None:
+        key = (b.promise.node_id, b.promise.var)
+        return lambda values: values[key]
+    if b.scalar is not None and b.scalar.primitive is not None:
+        value = b.scalar.primitive.value
+        return lambda values: value
+    raise Unsupported(f"Binding {b} is not supported")
+
+
+def compile_task(node: Node) -> typing.Callable[[Values], typing.Dict[str, typing.Any]]:
+    task = node.flyte_entity
+    if (
+        not isinstance(task, PythonFunctionTask)
+        or task.execution_mode != PythonFunctionTask.ExecutionBehavior.DEFAULT
+    ):
+        raise Unsupported(f"Node {node.id} runs {task}, which is not supported")
+    inputs = [(b.var, compile_binding(b.binding)) for b in node.bindings]
+    outputs = list(task.python_interface.outputs.keys())
+
+    def run(values: Values) -> typing.Dict[str, typing.Any]:
+        result = task.execute(**{var: get(values) for var, get in inputs})
+        if len(outputs) == 1:
+            return {outputs[0]: result}
+        return dict(zip(outputs, result or ()))
+
+    return run
+
+
+# %%
+# Compiling Conditions
+# ^^^^^^^^^^^^^^^^^^^^
+# The variables of a condition are bound to the inputs of its branch node, so they are resolved through the bindings
+# of the branch node. Each case becomes a pair of a decision function and the compiled node of its branch, and the
+# branch node runs the first case that is decided to be true.
+_COMPARATORS = {
+    _core_cond.ComparisonExpression.Operator.EQ: operator.eq,
+    _core_cond.ComparisonExpression.Operator.NEQ: operator.ne,
+    _core_cond.ComparisonExpression.Operator.GT: operator.gt,
+    _core_cond.ComparisonExpression.Operator.GTE: operator.ge,
+    _core_cond.ComparisonExpression.Operator.LT: operator.lt,
+    _core_cond.ComparisonExpression.Operator.LTE: operator.le,
+}
+
+
+def compile_expression(
+    expr: _core_cond.BooleanExpression,
+    variables: typing.Dict[str, typing.Callable[[Values], typing.Any]],
+) -> typing.Callable[[Values], bool]:
+    if expr.conjunction is not None:
+        left = compile_expression(expr.conjunction.left_expression, variables)
+        right = compile_expression(expr.conjunction.right_expression, variables)
+        if (
+            expr.conjunction.operator
+            == _core_cond.ConjunctionExpression.LogicalOperator.AND
+        ):
+            return lambda values: left(values) and right(values)
+        return lambda values: left(values) or right(values)
+
+    def operand(o: _core_cond.Operand) -> typing.Callable[[Values], typing.Any]:
+        if o.primitive is not None:
+            value = o.primitive.value
+            return lambda values: value
+        return variables[o.var]
+
+    lhs = operand(expr.comparison.left_value)
+    rhs = operand(expr.comparison.right_value)
+    compare = _COMPARATORS[expr.comparison.operator]
+    return lambda values: compare(lhs(values), rhs(values))
+
+
+def compile_branch(
+    node: Node,
+) -> typing.Callable[[Values], typing.Dict[str, typing.Any]]:
+    block: _core_wf.IfElseBlock = node.flyte_entity._ifelse_block
+    variables = {b.var: compile_binding(b.binding) for b in node.bindings}
+    cases = [
+        (compile_expression(c.condition, variables), compile_node(c.then_node))
+        for c in [block.case] + (block.other or [])
+    ]
+    else_node = compile_node(block.else_node) if block.else_node else None
+    error = block.error.to_flyte_idl().message if block.error else None
+
+    def run(values: Values) -> typing.Dict[str, typing.Any]:
+        for decide, then_node in cases:
+            if decide(values):
+                return then_node(values)
+        if else_node is None:
+            raise ValueError(error)
+        return else_node(values)
+
+    return run
+
+
+def compile_node(node: Node) -> typing.Callable[[Values], typing.Dict[str, typing.Any]]:
+    if isinstance(node.flyte_entity, BranchNode):
+        return compile_branch(node)
+    return compile_task(node)
+
+
+# %%
+# Compiling a Workflow
+# ^^^^^^^^^^^^^^^^^^^^
+# The nodes of a workflow are in topological order, so they are simply run one after the other. Local execution
+# converts the inputs to their declared types - e.g. ``3`` to ``3.0`` for a ``float`` - which is done here for
+# primitives as well.
+_PRIMITIVES = (int, float, str, bool)
+
+
+def compile_workflow(wf: PythonFunctionWorkflow) -> typing.Callable[..., typing.Any]:
+    nodes = [(n.id, compile_node(n)) for n in wf.nodes]
+    outputs = {b.var: compile_binding(b.binding) for b in wf.output_bindings}
+    output_names = list(wf.python_interface.outputs.keys())
+    defaults = wf.python_interface.default_inputs_as_kwargs
+    converters = {
+        name: t if t in _PRIMITIVES else None
+        for name, t in wf.python_interface.inputs.items()
+    }
+
+    def run(**kwargs):
+        values: Values = {}
+        for name, convert in converters.items():
+            v = kwargs[name] if name in kwargs else defaults[name]
+            values[(_common_constants.GLOBAL_INPUT_NODE_ID, name)] = (
+                convert(v) if convert else v
+            )
+        for node_id, run_node in nodes:
+            for var, v in run_node(values).items():
+                values[(node_id, var)] = v
+        results = tuple(outputs[name](values) for name in output_names)
+        if len(results) == 1:
+            return results[0]
+        return results or None
+
+    return run
+
+
+# %%
+# Compiled workflows are cached, so a workflow is only compiled the first time it is run. Workflows that cannot be
+# compiled are cached as such, and run like any other workflow.
+_COMPILED: typing.Dict[
+    PythonFunctionWorkflow, typing.Optional[typing.Callable[..., typing.Any]]
+] = {}
+
+
+def run_local(wf: PythonFunctionWorkflow, **kwargs):
+    if wf not in _COMPILED:
+        try:
+            _COMPILED[wf] = compile_workflow(wf)
+        except Unsupported:
+            _COMPILED[wf] = None
+    compiled = _COMPILED[wf]
+    if compiled is None:
+        return wf(**kwargs)
+    return compiled(**kwargs)
+
+
+# %%
+# Let us run the workflows of the conditions example in a loop, the regular way and through the cache of compiled
+# workflows, and check that both give the same results. ``basic_boolean_wf`` tosses a coin, so we only time it.
+if __name__ == "__main__":
+    number = 200
+    cases = [
+        (bool_input_wf, [{"b": True}, {"b": False}]),
+        (
+            nested_conditions,
+            [{"my_input": 0.4}, {"my_input": 0.6}, {"my_input": 5}, {"my_input": 20.0}],
+        ),
+    ]
+    for wf, inputs in cases:
+        for kwargs in inputs:
+            assert run_local(wf, **kwargs) == wf(**kwargs), kwargs
+    cases.append((basic_boolean_wf, [{}]))
+
+    for wf, inputs in cases:
+        timings = []
+        for run in (
+            lambda **kwargs: wf(**kwargs),
+            lambda **kwargs: run_local(wf, **kwargs),
+        ):
+            start = time.perf_counter()
+            for i in range(number):
+                run(**inputs[i % len(inputs)])
+            timings.append((time.perf_counter() - start) / number * 1000)
+        print(
+            f"{wf.name}: {timings[0]:.3f}ms per run, {timings[1]:.3f}ms per compiled run"
+        )
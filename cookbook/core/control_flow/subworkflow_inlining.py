@@ -0,0 +1,231 @@
+"""
+.. _subworkflow_inlining:
+
+Inlining Subworkflows and Merging Duplicate Nodes
+-------------------------------------------------
+
+A subworkflow is copied into its parent workflow wherever it is called, as explained in
+:ref:`the subworkflows example <sphx_glr_auto_core_control_flow_subworkflows.py>`. ``nested_parent_wf`` calls
+``my_subwf`` directly and once more through ``parent_wf``, and both copies - as well as ``parent_wf`` itself - start
+with the same ``t1(a=a)`` call on the same input. Each of these calls is a node of its own, and runs on its own.
+
+This example flattens a workflow by inlining all of its subworkflows, and merges nodes that run the same task with the
+same inputs: the first of them is kept and every reference to the others is pointed at it. Merging assumes that a
+task returns the same outputs for the same inputs, which is what Flyte assumes for cached tasks as well.
+"""
+import copy
+import typing
+
+from flytekit.common import constants as _common_constants
+from flytekit.core.condition import BranchNode
+from flytekit.core.context_manager import FlyteEntities
+from flytekit.core.node import Node
+from flytekit.core.workflow import PythonFunctionWorkflow
+from flytekit.models import literals as _literal_models
+from flytekit.models import types as _type_models
+
+from core.control_flow.subworkflows import nested_parent_wf, parent_wf
+
+
+# %%
+# Rewriting Bindings
+# ^^^^^^^^^^^^^^^^^^
+# Nodes are copied from the subworkflow into the flattened workflow, so their bindings have to be rewritten: references
+# to the inputs of the subworkflow are replaced with whatever the subworkflow node was bound to, and references to
+# other nodes with references to their copies - or to the nodes they were merged into.
+class Scope(object):
+    def __init__(self, inputs: typing.Dict[str, _literal_models.BindingData]):
+        self.inputs = inputs
+        self.outputs: typing.Dict[
+            typing.Tuple[str, str], _literal_models.BindingData
+        ] = {}
+        # The nodes of the flattened workflow that each node of the workflow turned into
+        self.nodes: typing.Dict[str, typing.List[Node]] = {}
+
+    def rewrite(self, b: _literal_models.BindingData) -> _literal_models.BindingData:
+        if b.promise is not None:
+            if b.promise.node_id == _common_constants.GLOBAL_INPUT_NODE_ID:
+                return self.inputs[b.promise.var]
+            return self.outputs[(b.promise.node_id, b.promise.var)]
+        if b.collection is not None:
+            return _literal_models.BindingData(
+                collection=_literal_models.BindingDataCollection(
+                    bindings=[self.rewrite(c) for c in b.collection.bindings]
+                )
+            )
+        if b.map is not None:
+            return _literal_models.BindingData(
+                map=_literal_models.BindingDataMap(
+                    bindings={k: self.rewrite(v) for k, v in b.map.bindings.items()}
+                )
+            )
+        return b
+
+
+def _referenced_nodes(b: _literal_models.BindingData) -> typing.Iterator[str]:
+    if b.promise is not None:
+        if b.promise.node_id != _common_constants.GLOBAL_INPUT_NODE_ID:
+            yield b.promise.node_id
+    elif b.collection is not None:
+        for c in b.collection.bindings:
+            yield from _referenced_nodes(c)
+    elif b.map is not None:
+        for v in b.map.bindings.values():
+            yield from _referenced_nodes(v)
+
+
+def _serialized(model) -> typing.Optional[bytes]:
+    if model is None:
+        return None
+    return model.to_flyte_idl().SerializeToString(deterministic=True)
+
+
+# %%
+# Flattening and Merging
+# ^^^^^^^^^^^^^^^^^^^^^^
+# Two nodes are the same if they run the same entity with the same rewritten bindings and after the same upstream
+# nodes, and if they were not overridden differently: their metadata - the timeout, retries and interruptible flag of
+# the node - their resource overrides, where flytekit supports them, and their output aliases have to match as well. Nodes are visited in topological order, and the nodes they depend on have been merged by then, so nodes that
+# only become the same once their upstream nodes are merged - like the second ``t1`` of both ``my_subwf`` copies - are
+# found in a single pass. The node ids of inlined nodes are prefixed with the id of the subworkflow node.
+#
+# Conditions reference nodes from inside of their branches, which would have to be rewritten as well, so workflows
+# with conditions are not supported.
+class InliningReport(object):
+    def __init__(self):
+        self.nodes_before = 0
+        self.inlined: typing.List[str] = []
+        self.merged: typing.Dict[str, str] = {}
+        self.nodes_after = 0
+
+    def __str__(self):
+        return (
+            f"{self.nodes_before} nodes -> {self.nodes_after} nodes, "
+            f"inlined {len(self.inlined)} subworkflows, merged {len(self.merged)} nodes: "
+            + ", ".join(f"{k} into {v}" for k, v in self.merged.items())
+        )
+
+
+class Inliner(object):
+    def __init__(self):
+        self.nodes: typing.List[Node] = []
+        self.nodes_by_id: typing.Dict[str, Node] = {}
+        self.seen: typing.Dict[typing.Tuple, Node] = {}
+        self.report = InliningReport()
+
+    def inline(
+        self, wf: PythonFunctionWorkflow, scope: Scope, prefix: str = ""
+    ) -> typing.List[_literal_models.Binding]:
+        for n in wf.nodes:
+            entity = n.flyte_entity
+            if isinstance(entity, BranchNode):
+                raise ValueError(
+                    f"Node {n.id} of {wf.name} is a condition, which cannot be inlined"
+                )
+            bindings = [
+                _literal_models.Binding(var=b.var, binding=scope.rewrite(b.binding))
+                for b in n.bindings
+            ]
+            upstream = {}
+            for u in n.upstream_nodes:
+                for new in scope.nodes.get(u.id, []):
+                    upstream[new.id] = new
+            for b in bindings:
+                for node_id in _referenced_nodes(b.binding):
+                    upstream[node_id] = self.nodes_by_id[node_id]
+
+            if isinstance(entity, PythonFunctionWorkflow):
+                self.report.inlined.append(f"{prefix}{n.id}")
+                sub_scope = Scope({b.var: b.binding for b in bindings})
+                outputs = self.inline(entity, sub_scope, prefix=f"{prefix}{n.id}-")
+                for b in outputs:
+                    scope.outputs[(n.id, b.var)] = b.binding
+                scope.nodes[n.id] = list(
+                    {m.id: m for ns in sub_scope.nodes.values() for m in ns}.values()
+                )
+                continue
+
+            self.report.nodes_before += 1
+            key = (
+                id(entity),
+                tuple(
+                    (
+                        b.var,
+                        b.binding.to_flyte_idl().SerializeToString(deterministic=True),
+                    )
+                    for b in sorted(bindings, key=lambda b: b.var)
+                ),
+                tuple(sorted(upstream)),
+                _serialized(n.metadata),
+                _serialized(getattr(n, "_resources", None)),
+                tuple((a.var, a.alias) for a in n._aliases or []),
+            )
+            node = self.seen.get(key)
+            if node is None:
+                node = Node(
+                    id=f"{prefix}{n.id}",
+                    metadata=n.metadata,
+                    bindings=bindings,
+                    upstream_nodes=list(upstream.values()),
+                    flyte_entity=entity,
+                )
+                node._aliases = n._aliases
+                self.seen[key] = node
+                self.nodes.append(node)
+                self.nodes_by_id[node.id] = node
+            else:
+                self.report.merged[f"{prefix}{n.id}"] = node.id
+            for var in entity.python_interface.outputs:
+                scope.outputs[(n.id, var)] = _literal_models.BindingData(
+                    promise=_type_models.OutputReference(node.id, var)
+                )
+            scope.nodes[n.id] = [node]
+
+        return [
+            _literal_models.Binding(var=b.var, binding=scope.rewrite(b.binding))
+            for b in wf.output_bindings
+        ]
+
+
+def inline_subworkflows(
+    wf: PythonFunctionWorkflow, name: typing.Optional[str] = None
+) -> typing.Tuple[PythonFunctionWorkflow, InliningReport]:
+    inliner = Inliner()
+    scope = Scope(
+        {
+            var: _literal_models.BindingData(
+                promise=_type_models.OutputReference(
+                    _common_constants.GLOBAL_INPUT_NODE_ID, var
+                )
+            )
+            for var in wf.python_interface.inputs
+        }
+    )
+    outputs = inliner.inline(wf, scope)
+    inliner.report.nodes_after = len(inliner.nodes)
+
+    inlined = copy.copy(wf)
+    inlined._name = name or f"{wf.name}_inlined"
+    inlined._nodes = inliner.nodes
+    inlined._output_bindings = outputs
+    # Copies are not tracked like workflows declared with @workflow, so it is added for serialization
+    FlyteEntities.entities.append(inlined)
+    return inlined, inliner.report
+
+
+# %%
+# The inlined workflows can be registered like any other workflow. ``nested_parent_wf`` runs ``t1`` five times across
+# ``parent_wf`` and the two copies of ``my_subwf``, which comes down to three distinct calls.
+parent_wf_inlined, parent_wf_report = inline_subworkflows(parent_wf)
+nested_parent_wf_inlined, nested_parent_wf_report = inline_subworkflows(
+    nested_parent_wf
+)
+
+
+if __name__ == "__main__":
+    for report in (parent_wf_report, nested_parent_wf_report):
+        print(report)
+    for n in nested_parent_wf_inlined.nodes:
+        print(
+            f"{n.id}: {n.flyte_entity.name}({', '.join(b.var for b in n.bindings)}) after {[u.id for u in n.upstream_nodes]}"
+        )
@@ -0,0 +1,291 @@
+"""
+.. _subworkflow_splitting:
+
+Splitting Large Workflows into Child Launch Plans
+-------------------------------------------------
+
+:ref:`The subworkflows example <sphx_glr_auto_core_control_flow_subworkflows.py>` explains the trade-off between
+subworkflows and child launch plans: the nodes of a subworkflow become part of the parent execution and share its
+parallelism constraint, while a launch plan starts an execution of its own, with its own constraint. Large graphs are
+also slower to compile and to handle for Flyte, so beyond a certain size, a workflow is better off calling some of its
+subworkflows as child launch plans. Launching an execution takes longer than starting a node, though, so small
+subworkflows are better kept as they are.
+
+This example makes the choice given two budgets: the maximum number of nodes of an execution and the maximum number of
+nodes an execution runs in parallel. Workflows over the node budget have their largest subworkflows turned into child
+launch plans until they fit, and the expected gain in parallelism is estimated before and after the split.
+"""
+import copy
+import math
+import typing
+
+from flytekit import LaunchPlan
+from flytekit.core.context_manager import FlyteEntities
+from flytekit.core.node import Node
+from flytekit.core.workflow import PythonFunctionWorkflow
+
+from core.control_flow.subworkflows import nested_parent_wf
+
+
+# %%
+# Measuring Workflows
+# ^^^^^^^^^^^^^^^^^^^
+# The nodes of an execution include the nodes of all its subworkflows, whereas a launch plan node is a single node in
+# its parent execution. While a split is planned, the subworkflow nodes that are going to be launch plan nodes are kept
+# in a set, and counted as launch plan nodes already.
+def execution_size(
+    wf: PythonFunctionWorkflow, launched: typing.AbstractSet[Node] = frozenset()
+) -> int:
+    return sum(
+        (
+            execution_size(n.flyte_entity, launched)
+            if isinstance(n.flyte_entity, PythonFunctionWorkflow) and n not in launched
+            else 1
+        )
+        for n in wf.nodes
+    )
+
+
+# %%
+# To estimate parallelism, all nodes are assumed to take the same time. A node runs one step after the last of its
+# upstream nodes - the nodes of a subworkflow start with the subworkflow node - so all nodes of the same depth can run
+# at once, but an execution runs at most ``max_parallelism`` of them at a time. ``depths`` collects the depth and the
+# execution of every node, with child launch plans counting as executions of their own.
+def depths(
+    wf: PythonFunctionWorkflow,
+    out: typing.List[typing.Tuple[int, str]],
+    execution: str = "",
+    start: int = 0,
+    launched: typing.AbstractSet[Node] = frozenset(),
+) -> int:
+    ends: typing.Dict[str, int] = {}
+    for n in wf.nodes:
+        depth = max(
+            [ends[u.id] for u in n.upstream_nodes if u.id in ends], default=start
+        )
+        entity = n.flyte_entity
+        if isinstance(entity, PythonFunctionWorkflow):
+            child = f"{execution}/{n.id}" if n in launched else execution
+            ends[n.id] = depths(entity, out, child, depth, launched)
+        elif isinstance(entity, LaunchPlan) and isinstance(
+            entity.workflow, PythonFunctionWorkflow
+        ):
+            ends[n.id] = depths(
+                entity.workflow, out, f"{execution}/{n.id}", depth, launched
+            )
+        else:
+            out.append((depth + 1, execution))
+            ends[n.id] = depth + 1
+    return max(ends.values(), default=start)
+
+
+class Estimate(typing.NamedTuple):
+    # Number of nodes of every execution, by the path of launch plan nodes that leads to it
+    executions: typing.Dict[str, int]
+    steps: int
+
+
+def estimate(
+    wf: PythonFunctionWorkflow,
+    max_parallelism: int,
+    launched: typing.AbstractSet[Node] = frozenset(),
+) -> Estimate:
+    nodes: typing.List[typing.Tuple[int, str]] = []
+    depths(wf, nodes, launched=launched)
+    executions: typing.Dict[str, int] = {}
+    per_depth: typing.Dict[int, typing.Dict[str, int]] = {}
+    for depth, execution in nodes:
+        executions[execution] = executions.get(execution, 0) + 1
+        counts = per_depth.setdefault(depth, {})
+        counts[execution] = counts.get(execution, 0) + 1
+    steps = sum(
+        max(math.ceil(c / max_parallelism) for c in counts.values())
+        for counts in per_depth.values()
+    )
+    return Estimate(executions, steps)
+
+
+# %%
+# Planning a Split
+# ^^^^^^^^^^^^^^^^
+# Subworkflow nodes are picked to become launch plan nodes, largest first, until the workflow fits the node budget; the
+# workflows of the picked nodes are planned the same way. A workflow that cannot fit - because it has too many nodes
+# outside of subworkflows - raises an error before anything is created. Given a parallelism budget, any remaining
+# subworkflow node, at any level, is picked as well if running it as an execution of its own lowers the estimated
+# number of steps. A subworkflow that is called from several places is the same workflow everywhere, so it is split
+# the same way everywhere.
+def _subworkflow_nodes(wf: PythonFunctionWorkflow) -> typing.Iterator[Node]:
+    for n in wf.nodes:
+        if isinstance(n.flyte_entity, PythonFunctionWorkflow):
+            yield n
+            yield from _subworkflow_nodes(n.flyte_entity)
+
+
+def _plan_nodes(wf: PythonFunctionWorkflow, max_nodes: int, launched: typing.Set[Node]):
+    size = execution_size(wf, launched)
+    subworkflows = [
+        n
+        for n in wf.nodes
+        if isinstance(n.flyte_entity, PythonFunctionWorkflow) and n not in launched
+    ]
+    for n in sorted(subworkflows, key=lambda n: -execution_size(n.flyte_entity)):
+        if size <= max_nodes:
+            break
+        size -= execution_size(n.flyte_entity, launched) - 1
+        launched.add(n)
+        _plan_nodes(n.flyte_entity, max_nodes, launched)
+    if size > max_nodes:
+        raise ValueError(
+            f"{wf.name} has {size} nodes outside of subworkflows, more than the budget of {max_nodes}"
+        )
+
+
+def plan_split(
+    wf: PythonFunctionWorkflow,
+    max_nodes: int,
+    max_parallelism: typing.Optional[int] = None,
+) -> typing.Set[Node]:
+    """
+    Returns the subworkflow nodes to turn into launch plan nodes
+    """
+    launched: typing.Set[Node] = set()
+    _plan_nodes(wf, max_nodes, launched)
+    if max_parallelism:
+        steps = estimate(wf, max_parallelism, launched).steps
+        candidates = dict.fromkeys(
+            n for n in _subworkflow_nodes(wf) if n not in launched
+        )
+        for n in sorted(candidates, key=lambda n: -execution_size(n.flyte_entity)):
+            # A picked node fits, since the execution it is taken out of fits
+            trial = estimate(wf, max_parallelism, launched | {n}).steps
+            if trial < steps:
+                launched.add(n)
+                steps = trial
+    return launched
+
+
+# %%
+# Splitting Workflows
+# ^^^^^^^^^^^^^^^^^^^
+# The split is built once it is planned. A picked node becomes a launch plan node that keeps its id and bindings, so
+# nothing else in the workflow changes, apart from pointing the nodes downstream at the new node. Workflows with picked
+# nodes anywhere below them are copied, and named after the budgets - unless ``name`` is given for the top workflow - so
+# that splits for different budgets do not clash. Splitting a workflow for the same budgets again returns the same
+# copies, so every copy, and its launch plan, is registered once. Workflows without picked nodes are kept as they are.
+_SPLITS: typing.Dict[str, typing.Tuple[typing.Tuple, PythonFunctionWorkflow]] = {}
+
+
+def _launch_plan(wf: PythonFunctionWorkflow) -> LaunchPlan:
+    lp = LaunchPlan.get_or_create(wf)
+    if lp.workflow is not wf:
+        raise ValueError(f"The launch plan {lp.name} belongs to another workflow")
+    return lp
+
+
+def _build(
+    wf: PythonFunctionWorkflow,
+    launched: typing.Set[Node],
+    suffix: str,
+    name: typing.Optional[str] = None,
+) -> PythonFunctionWorkflow:
+    if not any(n in launched for n in _subworkflow_nodes(wf)):
+        return wf
+    name = name or f"{wf.name}{suffix}"
+    key = (wf, frozenset(launched & set(_subworkflow_nodes(wf))))
+    if name in _SPLITS:
+        split_key, split = _SPLITS[name]
+        if split_key != key:
+            raise ValueError(f"{name} is the name of another split of {wf.name}")
+        return split
+
+    replaced: typing.Dict[Node, Node] = {}
+    for n in wf.nodes:
+        if not isinstance(n.flyte_entity, PythonFunctionWorkflow):
+            continue
+        child = _build(n.flyte_entity, launched, suffix)
+        if n in launched:
+            entity = _launch_plan(child)
+        elif child is not n.flyte_entity:
+            entity = child
+        else:
+            continue
+        replaced[n] = Node(
+            id=n.id,
+            metadata=n.metadata,
+            bindings=n.bindings,
+            upstream_nodes=n.upstream_nodes,
+            flyte_entity=entity,
+        )
+
+    nodes = []
+    for n in wf.nodes:
+        node = replaced.get(n, n)
+        upstream = [replaced.get(u, u) for u in node.upstream_nodes]
+        if upstream != node.upstream_nodes:
+            node = Node(
+                id=node.id,
+                metadata=node.metadata,
+                bindings=node.bindings,
+                upstream_nodes=upstream,
+                flyte_entity=node.flyte_entity,
+            )
+            node._aliases = n._aliases
+        replaced[n] = node
+        nodes.append(node)
+
+    split = copy.copy(wf)
+    split._name = name
+    split._nodes = nodes
+    _SPLITS[name] = (key, split)
+    # Copies are not tracked like workflows declared with @workflow, so it is added for serialization
+    FlyteEntities.entities.append(split)
+    return split
+
+
+def split_workflow(
+    wf: PythonFunctionWorkflow,
+    max_nodes: int,
+    max_parallelism: typing.Optional[int] = None,
+    name: typing.Optional[str] = None,
+) -> PythonFunctionWorkflow:
+    launched = plan_split(wf, max_nodes, max_parallelism)
+    suffix = f"_split_{max_nodes}"
+    if max_parallelism:
+        suffix += f"_{max_parallelism}"
+    return _build(wf, launched, suffix, name)
+
+
+# %%
+# The report compares the estimates before and after the split.
+def split_report(
+    wf: PythonFunctionWorkflow, split: PythonFunctionWorkflow, max_parallelism: int
+) -> str:
+    before = estimate(wf, max_parallelism)
+    after = estimate(split, max_parallelism)
+    executions = ", ".join(
+        f"{e or 'parent'}: {count} nodes" for e, count in after.executions.items()
+    )
+    return (
+        f"{split.name}: {len(after.executions)} executions ({executions}), "
+        f"{before.steps} -> {after.steps} steps, {before.steps / after.steps:.2f}x parallelism"
+    )
+
+
+# %%
+# ``nested_parent_wf`` runs five nodes in a single execution. With a budget of three nodes, ``parent_wf`` - the larger
+# of its subworkflows - becomes a child launch plan and runs next to the rest of the nodes. With a budget of five nodes
+# the workflow fits as it is, but a parallelism of one still makes ``parent_wf`` worth an execution of its own.
+nested_parent_wf_split = split_workflow(nested_parent_wf, max_nodes=3)
+nested_parent_wf_parallel = split_workflow(
+    nested_parent_wf, max_nodes=5, max_parallelism=1
+)
+
+if __name__ == "__main__":
+    print(split_report(nested_parent_wf, nested_parent_wf_split, max_parallelism=1))
+    print(split_report(nested_parent_wf, nested_parent_wf_parallel, max_parallelism=1))
+    for max_nodes in (1, 2, 5):
+        try:
+            split = split_workflow(nested_parent_wf, max_nodes)
+            print(split_report(nested_parent_wf, split, max_parallelism=1))
+        except ValueError as e:
+            print(e)
@@ -125,6 +125,11 @@ def my_workflow(path: str) -> str:
 
 
 # %%
+# .. note::
+#
+#   This sensor polls at a fixed interval and waits for a single file. Refer to :ref:`advanced_object_store_sensors`
+#   for sensors that back off exponentially, wait for many files or a pattern in one task, and report metrics.
+#
 # Ofcourse you can run the workflow using your own new shiny plugin locally
 if __name__ == "__main__":
     f = "/tmp/some-file"
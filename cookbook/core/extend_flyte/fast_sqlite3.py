@@ -0,0 +1,761 @@
+"""
+.. _extend_fast_sqlite3:
+
+Faster SQLite3 Tasks
+--------------------
+
+The :py:class:`flytekit.extras.sqlite3.task.SQLite3Task` used in :ref:`extend_sql_sqlite3` downloads its database - and
+unpacks it, if it is compressed - every time it runs, and then runs its query from scratch. For the example databases
+that is cheap, but for a database of a few gigabytes the download dominates the run time of every execution.
+
+This example extends the ``SQLite3Task`` with a few optimizations, following the same pattern the ``SQLite3Task``
+itself uses: a ``ShimTaskExecutor`` that holds the business logic, and a task that serializes everything the executor
+needs into the task template.
+
+Database and Query Result Caches
+^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+The first optimization is an on-disk cache:
+
+- Downloaded and unpacked databases are stored under the hash of their content. Which content a URI points to is
+  remembered in a small index, so a repeated run skips the download entirely. For local files the index entry is
+  invalidated when the file's size or modification time changes.
+- Optionally, query results are cached too, keyed by the hash of the database and the rendered query.
+
+The cache lives in ``~/.cache/flytesnacks/sqlite3``, unless the ``FLYTE_SQLITE3_CACHE_DIR`` environment variable or the
+task configuration point elsewhere. Locally this speeds up repeated runs. On a cluster the cache directory should be a
+volume that outlives the task's pod.
+
+Streaming Results
+^^^^^^^^^^^^^^^^^
+
+The ``SQLite3Task`` reads the whole result of its query into a single dataframe, before it is written to the output
+``FlyteSchema``. A ``select * from data`` on a large table needs as much memory as the table. With ``chunk_size``
+set, rows are fetched from the cursor ``chunk_size`` at a time and every chunk is appended to the output parquet file as
+a row group, so memory use is bounded by the size of a chunk.
+
+Partitioned Extraction
+^^^^^^^^^^^^^^^^^^^^^^
+
+A query runs on a single core. When a task declares a ``partition_table`` and a number of ``partitions``, the rowids of
+that table are split into equal ranges, and one process per range runs the query against its range only and writes the
+rows into the output schema. The query itself is not changed or wrapped, and every process reads only its part of the
+table. All partitions are written to the same schema directory, which downstream tasks read as one schema. Only queries
+that handle the rows of the table one at a time can be partitioned: a query with a ``limit``, ``group by``, ``order by``,
+``distinct`` or aggregate function, or one that reads the table more than once, is rejected when the task is created.
+
+Partitioning only pays off when a query keeps a core busy for long enough to make up for starting a process per
+partition, and when there are cores to spare. For a query as cheap as the ``select *`` over 100,000 rows in the example
+below it does not: one partition is the fastest, and the example prints the times of one, two and four partitions so
+they can be compared on the machine at hand.
+
+In-Memory Databases
+^^^^^^^^^^^^^^^^^^^
+
+Test suites run the same local workflows over and over again. With ``in_memory`` set, the database is loaded once into
+an in-memory connection that is shared by every execution of the task in the same process, and SQLite reuses the
+prepared statement of a query that ran before on that connection. Query templates are compiled once, too, instead of
+being searched for inputs on every execution.
+"""
+import contextlib
+import functools
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import timeit
+import tracemalloc
+import typing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import pandas
+import pyarrow
+import pyarrow.parquet as pq
+from flytekit import FlyteContext, kwtypes, task, workflow
+from flytekit.core.context_manager import SerializationSettings
+from flytekit.extras.sqlite3.task import SQLite3Config, SQLite3Task, SQLite3TaskExecutor, unarchive_file
+from flytekit.models import task as task_models
+from flytekit.types.schema import FlyteSchema
+
+CACHE_DIR_ENV = "FLYTE_SQLITE3_CACHE_DIR"
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "flytesnacks", "sqlite3"
+)
+
+# %%
+# Unlike the ``SQLite3Task``, which runs in the pre-built flytekit image, the executor below is part of this repository.
+# The task therefore runs in the image that the examples are built into.
+DEFAULT_IMAGE = os.environ.get(
+    "FLYTE_INTERNAL_IMAGE", "ghcr.io/flyteorg/flytecookbook:core-latest"
+)
+
+
+# %%
+# The configuration extends ``SQLite3Config``, so any ``SQLite3Task`` can be switched over by changing its config.
+@dataclass
+class FastSQLite3Config(SQLite3Config):
+    """
+    Args:
+        cache_dir: directory for cached databases and query results, defaults to ``$FLYTE_SQLITE3_CACHE_DIR`` or
+                   ``~/.cache/flytesnacks/sqlite3``
+        cache_results: Boolean that indicates if query results should be cached as well
+        chunk_size: if set, results are streamed to the output schema this many rows at a time
+        partition_table: a table that the query reads row by row, whose rowids are used to split the extraction into
+                         ranges
+        partitions: the number of ranges that are extracted in parallel, if a ``partition_table`` is set
+        in_memory: Boolean that indicates if the database should be loaded into memory once and shared by all
+                   executions in the same process
+    """
+
+    cache_dir: typing.Optional[str] = None
+    cache_results: bool = False
+    chunk_size: typing.Optional[int] = None
+    partition_table: typing.Optional[str] = None
+    partitions: int = 1
+    in_memory: bool = False
+
+
+def _sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class DatabaseCache(object):
+    """
+    A content addressed store of downloaded databases and of query results
+    """
+
+    def __init__(self, cache_dir: str):
+        self._dir = cache_dir
+        for d in ("uris", "dbs", "results"):
+            os.makedirs(os.path.join(cache_dir, d), exist_ok=True)
+
+    @staticmethod
+    def _fingerprint(uri: str) -> typing.Optional[typing.List[int]]:
+        """
+        Local files can change in place, remote databases are assumed to be immutable
+        """
+        path = uri[len("file://") :] if uri.startswith("file://") else uri
+        if not os.path.isfile(path):
+            return None
+        st = os.stat(path)
+        return [st.st_size, st.st_mtime_ns]
+
+    def _write_atomically(self, path: str, write: typing.Callable[[str], None]):
+        # Concurrent tasks may share the cache, readers should never see a partially written file
+        fd, tmp = tempfile.mkstemp(dir=self._dir)
+        os.close(fd)
+        write(tmp)
+        os.replace(tmp, path)
+
+    def db_path(self, db_hash: str) -> str:
+        return os.path.join(self._dir, "dbs", f"{db_hash}.db")
+
+    def get(
+        self, ctx: FlyteContext, uri: str, compressed: bool
+    ) -> typing.Tuple[str, str]:
+        """
+        Returns the local path and the content hash of the database at the given uri, downloading it only if needed
+        """
+        index = os.path.join(
+            self._dir, "uris", hashlib.sha256(uri.encode()).hexdigest() + ".json"
+        )
+        fingerprint = self._fingerprint(uri)
+        if os.path.exists(index):
+            with open(index) as f:
+                entry = json.load(f)
+            if entry["fingerprint"] == fingerprint and os.path.exists(
+                self.db_path(entry["sha256"])
+            ):
+                return self.db_path(entry["sha256"]), entry["sha256"]
+
+        with tempfile.TemporaryDirectory(dir=self._dir) as temp_dir:
+            local_path = os.path.join(temp_dir, os.path.basename(uri))
+            ctx.file_access.download(uri, local_path)
+            if compressed:
+                local_path = unarchive_file(local_path, temp_dir)
+            db_hash = _sha256_file(local_path)
+            if not os.path.exists(self.db_path(db_hash)):
+                os.replace(local_path, self.db_path(db_hash))
+
+        def write_index(tmp: str):
+            with open(tmp, "w") as f:
+                json.dump({"sha256": db_hash, "fingerprint": fingerprint}, f)
+
+        self._write_atomically(index, write_index)
+        return self.db_path(db_hash), db_hash
+
+    def query(
+        self,
+        db_hash: str,
+        query: str,
+        db: typing.Optional[typing.Union[str, sqlite3.Connection]] = None,
+        **options,
+    ) -> typing.Union[pandas.DataFrame, FlyteSchema]:
+        """
+        Runs the query against the cached database - or the given in-memory copy of it - or returns the cached result
+        of an earlier run. The options are those of :py:func:`extract`
+        """
+        db = db or self.db_path(db_hash)
+        key = hashlib.sha256(f"{db_hash}\0{query}".encode()).hexdigest()
+        if writes_schema(**options):
+            # Streamed results are kept as the schema directory they were written to
+            result = os.path.join(self._dir, "results", key)
+            if not os.path.exists(result):
+                tmp = tempfile.mkdtemp(dir=self._dir)
+                extract(db, query, tmp, **options)
+                try:
+                    os.rename(tmp, result)
+                except OSError:
+                    # Another task stored the same result in the meantime
+                    shutil.rmtree(tmp)
+            return FlyteSchema(local_path=result)
+
+        result = os.path.join(self._dir, "results", f"{key}.parquet")
+        if os.path.exists(result):
+            return pandas.read_parquet(result)
+        df = run_query(db, query)
+        self._write_atomically(result, lambda tmp: df.to_parquet(tmp))
+        return df
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    # Cached databases are shared by all tasks, so they are opened read-only
+    return sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+
+
+# %%
+# In-memory copies of the databases are kept per process, keyed by the hash of the database. A shared connection may
+# be used by tasks running in different threads, so queries against it are serialized with a lock.
+STATEMENT_CACHE_SIZE = 256
+
+_MEMORY_DBS: typing.Dict[str, sqlite3.Connection] = {}
+_MEMORY_DBS_LOCK = threading.Lock()
+_QUERY_LOCK = threading.RLock()
+
+
+def memory_connection(db_path: str, db_hash: str) -> sqlite3.Connection:
+    """
+    Returns the shared in-memory copy of the database, loading it on first use
+    """
+    with _MEMORY_DBS_LOCK:
+        con = _MEMORY_DBS.get(db_hash)
+        if con is None:
+            con = sqlite3.connect(
+                ":memory:",
+                check_same_thread=False,
+                cached_statements=STATEMENT_CACHE_SIZE,
+            )
+            with contextlib.closing(_connect(db_path)) as disk:
+                disk.backup(con)
+            _MEMORY_DBS[db_hash] = con
+        return con
+
+
+@contextlib.contextmanager
+def _open(
+    db: typing.Union[str, sqlite3.Connection],
+) -> typing.Iterator[sqlite3.Connection]:
+    if isinstance(db, sqlite3.Connection):
+        with _QUERY_LOCK:
+            yield db
+    else:
+        with contextlib.closing(_connect(db)) as con:
+            yield con
+
+
+def run_query(
+    db: typing.Union[str, sqlite3.Connection], query: str
+) -> pandas.DataFrame:
+    with _open(db) as con:
+        return pandas.read_sql_query(query, con)
+
+
+# %%
+# SQLite columns are dynamically typed, so a chunk may infer a different arrow type than the chunks before it - e.g. a
+# column that is ``NULL`` in every row of the first chunk. Instead of failing, such a chunk starts a new parquet file in
+# the schema directory. Schema readers read all the files of the directory.
+def stream_query(
+    db: typing.Union[str, sqlite3.Connection],
+    query: str,
+    chunk_size: int,
+    to_dir: str,
+    params: typing.Sequence[typing.Any] = (),
+    prefix: str = "",
+) -> int:
+    """
+    Writes the result of the query into parquet files in the given directory, fetching at most ``chunk_size`` rows at
+    a time, and returns the number of rows written
+    """
+    rows = 0
+    writer = None
+    files = 0
+    with _open(db) as con:
+        cursor = con.execute(query, params)
+        columns = [d[0] for d in cursor.description]
+        try:
+            while True:
+                records = cursor.fetchmany(chunk_size)
+                if not records and writer is not None:
+                    break
+                table = pyarrow.Table.from_pandas(
+                    pandas.DataFrame.from_records(records, columns=columns),
+                    preserve_index=False,
+                )
+                if writer is None or not table.schema.equals(writer.schema):
+                    if writer is not None:
+                        writer.close()
+                    writer = pq.ParquetWriter(
+                        os.path.join(to_dir, f"{prefix}{files:05d}"), table.schema
+                    )
+                    files += 1
+                writer.write_table(table)
+                rows += len(records)
+                # An empty result still produces a file, so that readers know the columns
+                if not records:
+                    break
+        finally:
+            if writer is not None:
+                writer.close()
+    return rows
+
+
+# %%
+# Partitions are ranges of the rowids of the partition table, computed from its smallest and largest rowid - a lookup
+# in the table's b-tree, no matter how large it is. Each process shadows the table with a temporary view of its range:
+# SQLite resolves names in the ``temp`` schema first, so the query reads the view instead of the table, and the
+# ``rowid`` condition of the view becomes a range search on the table. That only gives the same rows as a single run for
+# queries that handle the rows of the table one at a time, like filters and projections. Queries that aggregate, sort,
+# limit, remove duplicates or read the table more than once - in a self-join or a subquery - would be computed per
+# partition, so ``check_partitionable`` rejects them before any partition runs. The check looks for the SQL keywords and
+# aggregate functions that make a query unpartitionable, outside of string literals and comments; it errs on the side of
+# rejecting, e.g. the two-argument ``min`` and ``max`` are scalar functions in SQLite but are rejected all the same.
+DEFAULT_CHUNK_SIZE = 100_000
+
+_UNPARTITIONABLE = [
+    (re.compile(r"\blimit\b"), "has a limit"),
+    (re.compile(r"\bgroup\s+by\b"), "groups rows"),
+    (re.compile(r"\border\s+by\b"), "sorts rows"),
+    (re.compile(r"\bdistinct\b"), "removes duplicate rows"),
+    (
+        re.compile(r"\b(union(?!\s+all\b)|intersect|except)\b"),
+        "combines results without duplicates",
+    ),
+    (re.compile(r"\bover\s*[(\w]"), "calls window functions"),
+    (
+        re.compile(r"\b(count|sum|total|avg|min|max|group_concat|string_agg)\s*\("),
+        "calls aggregate functions",
+    ),
+]
+_LITERALS_AND_COMMENTS = re.compile(r"'(?:[^']|'')*'|--[^\n]*|/\*.*?(?:\*/|$)", re.S)
+
+
+def check_partitionable(query: str, table: str):
+    """
+    Raises a ``ValueError`` if the query does not give the same rows when it is run per partition of the table
+    """
+    sql = _LITERALS_AND_COMMENTS.sub(" ", query).lower()
+    for pattern, reason in _UNPARTITIONABLE:
+        if pattern.search(sql):
+            raise ValueError(
+                f"Cannot partition the query by {table}, because it {reason}: {query}"
+            )
+    references = re.findall(
+        rf'(?<![\w."]){re.escape(table.lower())}(?![\w."])|"{re.escape(table.lower())}"(?!\.)',
+        sql,
+    )
+    if len(references) > 1:
+        raise ValueError(
+            f"Cannot partition the query by {table}, because it reads the table more than once: {query}"
+        )
+
+
+def partition_ranges(
+    db_path: str, table: str, partitions: int
+) -> typing.List[typing.Tuple[int, int]]:
+    """
+    Returns the half-open rowid ranges of the partitions of the table
+    """
+    with contextlib.closing(_connect(db_path)) as con:
+        lo, hi = con.execute(
+            f'select min(rowid), max(rowid) from main."{table}"'
+        ).fetchone()
+    if lo is None:
+        return [(0, 1)]
+    step = -(-(hi + 1 - lo) // partitions)
+    return [(start, min(start + step, hi + 1)) for start in range(lo, hi + 1, step)]
+
+
+def _extract_partition(args) -> int:
+    db_path, query, table, rowids, chunk_size, to_dir, idx = args
+    with contextlib.closing(_connect(db_path)) as con:
+        con.execute(
+            f'create temp view "{table}" as select * from main."{table}" '
+            f"where rowid >= {int(rowids[0])} and rowid < {int(rowids[1])}"
+        )
+        return stream_query(con, query, chunk_size, to_dir, prefix=f"{idx:05d}-")
+
+
+def writes_schema(
+    chunk_size: typing.Optional[int] = None,
+    partition_table: typing.Optional[str] = None,
+    partitions: int = 1,
+) -> bool:
+    return bool(chunk_size) or (partition_table is not None and partitions > 1)
+
+
+def extract(
+    db: typing.Union[str, sqlite3.Connection],
+    query: str,
+    to_dir: str,
+    chunk_size: typing.Optional[int] = None,
+    partition_table: typing.Optional[str] = None,
+    partitions: int = 1,
+) -> int:
+    """
+    Writes the result of the query into the given schema directory, in parallel if a partition table is given, and
+    returns the number of rows written. Partitions are extracted by separate processes, which need the database's path
+    """
+    chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+    if partition_table is None or partitions <= 1:
+        return stream_query(db, query, chunk_size, to_dir)
+    if not isinstance(db, str):
+        raise ValueError("Partitioned extraction requires the path of the database")
+    check_partitionable(query, partition_table)
+    ranges = partition_ranges(db, partition_table, partitions)
+    with ProcessPoolExecutor(max_workers=min(len(ranges), os.cpu_count() or 1)) as pool:
+        return sum(
+            pool.map(
+                _extract_partition,
+                [
+                    (db, query, partition_table, rowids, chunk_size, to_dir, i)
+                    for i, rowids in enumerate(ranges)
+                ],
+            )
+        )
+
+
+# %%
+# A compiled template is the list of its literal fragments and the names of the inputs between them, so rendering a
+# query is a single join. It raises the same errors as :py:meth:`flytekit.core.base_sql_task.SQLTask.interpolate_query`.
+TEMPLATE_CACHE_SIZE = 1024
+
+
+@functools.lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def compile_template(
+    query_template: str,
+) -> typing.Tuple[typing.Tuple[str, ...], typing.Tuple[str, ...]]:
+    fragments = []
+    names = []
+    pos = 0
+    for match in SQLite3Task._INPUT_REGEX.finditer(query_template):
+        fragments.append(query_template[pos : match.start()])
+        names.append(match.group(2))
+        pos = match.end()
+    fragments.append(query_template[pos:])
+    return tuple(fragments), tuple(names)
+
+
+def render_query(query_template: str, **kwargs) -> str:
+    fragments, names = compile_template(query_template)
+    missing = set(names).difference(kwargs.keys())
+    if missing:
+        raise ValueError(
+            f"Variables {missing} in Query not found in inputs {kwargs.keys()}"
+        )
+    if len(kwargs) > len(set(names)):
+        diff = set(kwargs.keys()).difference(names)
+        raise ValueError(
+            f"Extra Inputs have no matches in query template - missing {diff}"
+        )
+    parts = [fragments[0]]
+    for name, fragment in zip(names, fragments[1:]):
+        parts.append(str(kwargs[name]))
+        parts.append(fragment)
+    return "".join(parts)
+
+
+# %%
+# The executor only has access to what was serialized into the task template, which is why the cache configuration is
+# part of ``get_custom`` below.
+class FastSQLite3TaskExecutor(SQLite3TaskExecutor):
+    def execute_from_model(self, tt: task_models.TaskTemplate, **kwargs) -> typing.Any:
+        ctx = FlyteContext.current_context()
+        cache = DatabaseCache(
+            tt.custom.get("cache_dir")
+            or os.environ.get(CACHE_DIR_ENV, DEFAULT_CACHE_DIR)
+        )
+        db_path, db_hash = cache.get(ctx, tt.custom["uri"], tt.custom["compressed"])
+        query = render_query(tt.custom["query_template"], **kwargs)
+        options = {
+            "chunk_size": tt.custom.get("chunk_size"),
+            "partition_table": tt.custom.get("partition_table"),
+            "partitions": tt.custom.get("partitions") or 1,
+        }
+        db = db_path
+        # Partitions run in their own processes, which cannot share the in-memory connection
+        if tt.custom.get("in_memory") and options["partitions"] <= 1:
+            db = memory_connection(db_path, db_hash)
+        if tt.custom.get("cache_results"):
+            return cache.query(db_hash, query, db=db, **options)
+        if writes_schema(**options):
+            schema = FlyteSchema()
+            extract(db, query, schema.local_path, **options)
+            return schema
+        return run_query(db, query)
+
+
+class FastSQLite3Task(SQLite3Task):
+    """
+    A drop-in replacement for the ``SQLite3Task``, that caches databases and - optionally - query results on disk, and
+    can stream or extract large results in parallel to its output schema. Locally, a database can be kept in memory
+    across executions
+    """
+
+    def __init__(
+        self,
+        name: str,
+        query_template: str,
+        inputs: typing.Optional[typing.Dict[str, typing.Type]] = None,
+        task_config: typing.Optional[FastSQLite3Config] = None,
+        output_schema_type: typing.Optional[typing.Type[FlyteSchema]] = None,
+        container_image: str = DEFAULT_IMAGE,
+        **kwargs,
+    ):
+        if task_config is None or task_config.uri is None:
+            raise ValueError("SQLite DB uri is required.")
+        if task_config.partition_table is not None and task_config.partitions > 1:
+            check_partitionable(query_template, task_config.partition_table)
+        outputs = kwtypes(
+            results=output_schema_type if output_schema_type else FlyteSchema
+        )
+        # The SQLite3Task constructor pins flytekit's image and executor, so we initialize its parents directly
+        super(SQLite3Task, self).__init__(
+            name=name,
+            task_config=task_config,
+            container_image=container_image,
+            executor_type=FastSQLite3TaskExecutor,
+            task_type=self._SQLITE_TASK_TYPE,
+            query_template=query_template,
+            inputs=inputs,
+            outputs=outputs,
+            **kwargs,
+        )
+
+    def get_custom(
+        self, settings: SerializationSettings
+    ) -> typing.Dict[str, typing.Any]:
+        return {
+            **super().get_custom(settings),
+            "cache_dir": self.task_config.cache_dir,
+            "cache_results": self.task_config.cache_results,
+            "chunk_size": self.task_config.chunk_size,
+            "partition_table": self.task_config.partition_table,
+            "partitions": self.task_config.partitions,
+            "in_memory": self.task_config.in_memory,
+        }
+
+
+# %%
+# The task is used exactly like the ``SQLite3Task``.
+EXAMPLE_DB = "https://cdn.sqlitetutorial.net/wp-content/uploads/2018/03/chinook.zip"
+
+sql_task = FastSQLite3Task(
+    name="cookbook.fast_sqlite3.sample",
+    query_template="select TrackId, Name from tracks limit {{.inputs.limit}}",
+    inputs=kwtypes(limit=int),
+    output_schema_type=FlyteSchema[kwtypes(TrackId=int, Name=str)],
+    task_config=FastSQLite3Config(uri=EXAMPLE_DB, compressed=True, cache_results=True),
+)
+
+
+@task
+def print_and_count_columns(df: pandas.DataFrame) -> int:
+    return len(df[df.columns[0]])
+
+
+@workflow
+def wf() -> int:
+    return print_and_count_columns(df=sql_task(limit=100))
+
+
+# %%
+# Running Locally
+# ^^^^^^^^^^^^^^^
+# To see the caches at work without network access, we build a small compressed database on the local disk and point a
+# task at it with a ``file://`` URI. The first run populates the caches, the following runs are served from them.
+def make_local_db(directory: str, rows: int = 100_000) -> str:
+    db_dir = os.path.join(directory, "db")
+    os.makedirs(db_dir)
+    with contextlib.closing(sqlite3.connect(os.path.join(db_dir, "local.db"))) as con:
+        con.execute("create table data (id integer primary key, value real, name text)")
+        con.executemany(
+            "insert into data values (?, ?, ?)",
+            ((i, i * 0.5, f"name-{i}") for i in range(rows)),
+        )
+        con.commit()
+    return "file://" + shutil.make_archive(
+        os.path.join(directory, "local"), "zip", db_dir
+    )
+
+
+# %%
+# To pick a chunk size, we compare the throughput and the peak memory of streaming a query against reading the result
+# into a single dataframe. Peak memory is measured with :py:mod:`tracemalloc`, which sees the dataframes and NumPy
+# arrays built by pandas, but not the buffers that arrow allocates internally - those are bounded by the chunk size too.
+def benchmark_chunk_sizes(
+    db_path: str, query: str, chunk_sizes: typing.List[int] = (1_000, 10_000, 100_000)
+):
+    print(f"{'chunk size':>12}{'rows/s':>14}{'peak MiB':>12}")
+    for chunk_size in [None, *chunk_sizes]:
+        with tempfile.TemporaryDirectory() as out:
+            tracemalloc.start()
+            start = time.monotonic()
+            if chunk_size:
+                rows = stream_query(db_path, query, chunk_size, out)
+            else:
+                df = run_query(db_path, query)
+                df.to_parquet(os.path.join(out, "00000"))
+                rows = len(df)
+                del df
+            elapsed = time.monotonic() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        print(
+            f"{chunk_size or 'all':>12}{rows / elapsed:>14.0f}{peak / (1 << 20):>12.1f}"
+        )
+
+
+# %%
+# Finally, we measure what a test suite that runs the same query many times gains from the caches and the in-memory
+# database. Every task runs its query ``number`` times through ``execute``, which is what a local workflow run calls.
+def benchmark_local_runs(uri: str, cache_dir: str, number: int = 100):
+    template = "select * from data where id < {{.inputs.limit}}"
+    variants = {
+        "SQLite3Task": SQLite3Task(
+            name="cookbook.fast_sqlite3.bench.plain",
+            query_template=template,
+            inputs=kwtypes(limit=int),
+            task_config=SQLite3Config(uri=uri, compressed=True),
+        ),
+        "on-disk cache": FastSQLite3Task(
+            name="cookbook.fast_sqlite3.bench.disk",
+            query_template=template,
+            inputs=kwtypes(limit=int),
+            task_config=FastSQLite3Config(
+                uri=uri, compressed=True, cache_dir=cache_dir
+            ),
+        ),
+        "in-memory": FastSQLite3Task(
+            name="cookbook.fast_sqlite3.bench.memory",
+            query_template=template,
+            inputs=kwtypes(limit=int),
+            task_config=FastSQLite3Config(
+                uri=uri, compressed=True, cache_dir=cache_dir, in_memory=True
+            ),
+        ),
+    }
+    print(f"{'variant':<16}{'ms/run':>10}")
+    for name, t in variants.items():
+        # The first run loads the caches
+        t.execute(limit=100)
+        elapsed = timeit.timeit(lambda: t.execute(limit=100), number=number)
+        print(f"{name:<16}{elapsed * 1000 / number:>10.2f}")
+
+    n = 100_000
+    interpolate = timeit.timeit(
+        lambda: SQLite3Task.interpolate_query(template, limit=100), number=n
+    )
+    render = timeit.timeit(lambda: render_query(template, limit=100), number=n)
+    print(
+        f"Rendering the template: {interpolate * 1e6 / n:.2f}usec interpolated, {render * 1e6 / n:.2f}usec compiled"
+    )
+
+
+if __name__ == "__main__":
+    print(f"Running {__file__} main...")
+    with tempfile.TemporaryDirectory() as d:
+        local_task = FastSQLite3Task(
+            name="cookbook.fast_sqlite3.local",
+            query_template="select * from data where id < {{.inputs.limit}}",
+            inputs=kwtypes(limit=int),
+            task_config=FastSQLite3Config(
+                uri=make_local_db(d),
+                compressed=True,
+                cache_dir=os.path.join(d, "cache"),
+                cache_results=True,
+            ),
+        )
+
+        @workflow
+        def local_wf(limit: int) -> int:
+            return print_and_count_columns(df=local_task(limit=limit))
+
+        for i in range(3):
+            start = time.monotonic()
+            n = local_wf(limit=50_000)
+            print(f"Run {i}: {n} rows in {time.monotonic() - start:.3f}s")
+
+        streaming_task = FastSQLite3Task(
+            name="cookbook.fast_sqlite3.streaming",
+            query_template="select * from data where id < {{.inputs.limit}}",
+            inputs=kwtypes(limit=int),
+            task_config=FastSQLite3Config(
+                uri=local_task.task_config.uri,
+                compressed=True,
+                cache_dir=os.path.join(d, "cache"),
+                chunk_size=10_000,
+            ),
+        )
+
+        @workflow
+        def streaming_wf(limit: int) -> int:
+            return print_and_count_columns(df=streaming_task(limit=limit))
+
+        print(f"Streamed {streaming_wf(limit=50_000)} rows")
+        db_path, _ = DatabaseCache(os.path.join(d, "cache")).get(
+            FlyteContext.current_context(), local_task.task_config.uri, True
+        )
+        benchmark_chunk_sizes(db_path, "select * from data")
+
+        for partitions in (1, 2, 4):
+            with tempfile.TemporaryDirectory() as out:
+                start = time.monotonic()
+                rows = extract(
+                    db_path,
+                    "select * from data",
+                    out,
+                    partition_table="data",
+                    partitions=partitions,
+                )
+                print(
+                    f"Extracted {rows} rows with {partitions} partition(s) in {time.monotonic() - start:.3f}s"
+                )
+
+        # Queries that are not computed row by row are rejected instead of being extracted per partition
+        for query in (
+            "select * from data limit 5",
+            "select count(*) from data",
+            "select name, sum(value) from data group by name",
+            "select * from data order by value",
+            "select distinct name from data",
+            "select a.* from data a join data b on a.id = b.id + 1",
+        ):
+            with tempfile.TemporaryDirectory() as out:
+                try:
+                    extract(db_path, query, out, partition_table="data", partitions=2)
+                except ValueError as e:
+                    print(e)
+                else:
+                    raise AssertionError(f"{query} was partitioned")
+
+        benchmark_local_runs(local_task.task_config.uri, os.path.join(d, "cache"))
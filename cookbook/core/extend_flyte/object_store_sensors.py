@@ -0,0 +1,426 @@
+"""
+.. _advanced_object_store_sensors:
+
+Efficient Object Store Sensors
+-------------------------------
+
+The ``WaitForObjectStoreFile`` sensor from :ref:`advanced_custom_task_plugin` checks for its file at a fixed interval
+and logs on every iteration. This is fine for a tutorial, but a production sensor usually waits much longer than it
+runs and should
+
+- back off exponentially, with some random jitter so that many sensors started together do not poll in lock-step,
+- wait for many files, or for any files matching a pattern under a prefix, from a single task, listing each prefix
+  once instead of checking every file, and
+- get notified by the operating system instead of polling, when the files are on a local disk.
+
+This example builds such sensors. Each one reports the time it took to detect its files and the number of calls it made
+to the object store as task metrics.
+"""
+import abc
+import fnmatch
+import os
+import random
+import subprocess
+import threading
+import time
+import typing
+from datetime import timedelta
+
+from flytekit import TaskMetadata, task, workflow
+from flytekit.configuration import aws as aws_config
+from flytekit.core.tracker import InstanceTrackingMeta
+from flytekit.extend import Interface, PythonTask, context_manager
+
+# %%
+# The `watchdog <https://pypi.org/project/watchdog/>`__ library wraps inotify (and its equivalents on other
+# platforms). It is part of ``core/requirements.in``, but optional: without it the sensors just poll local paths, like
+# remote ones.
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+
+# %%
+# Backoff
+# ^^^^^^^^
+# The delay between two polls starts at ``initial`` and grows by ``multiplier`` up to ``maximum``. Every delay is
+# randomly stretched or shrunk by up to ``jitter`` of its value.
+class Backoff(object):
+    def __init__(
+        self,
+        initial: timedelta = timedelta(seconds=1),
+        maximum: timedelta = timedelta(minutes=5),
+        multiplier: float = 2.0,
+        jitter: float = 0.2,
+    ):
+        self._initial = initial.total_seconds()
+        self._maximum = maximum.total_seconds()
+        self._multiplier = multiplier
+        self._jitter = jitter
+
+    def intervals(self) -> typing.Iterator[float]:
+        delay = self._initial
+        while True:
+            yield delay * random.uniform(1 - self._jitter, 1 + self._jitter)
+            delay = min(delay * self._multiplier, self._maximum)
+
+
+# %%
+# Listing Objects
+# ^^^^^^^^^^^^^^^
+# Flytekit's data proxies can check whether a single object exists, but cannot list a prefix. Like the proxies, we shell
+# out to the cloud provider's CLI for that. Both CLIs exit with an error when nothing matches the prefix - which is just
+# an empty listing for a sensor - but any other error, like missing credentials, is raised rather than taken for one.
+def is_local(path: str) -> bool:
+    return not (path.startswith("s3://") or path.startswith("gs://"))
+
+
+def _run_cli(
+    cmd: typing.List[str],
+    no_matches: typing.Callable[[subprocess.CompletedProcess], bool],
+    env: typing.Optional[typing.Dict[str, str]] = None,
+) -> str:
+    process = subprocess.run(
+        cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    if process.returncode == 0:
+        return process.stdout
+    if no_matches(process):
+        return ""
+    raise RuntimeError(
+        f"{' '.join(cmd)} exited with {process.returncode}: {process.stderr.strip()}"
+    )
+
+
+def list_prefix(prefix: str) -> typing.List[str]:
+    """
+    Returns the paths of all objects whose path starts with the given prefix
+    """
+    if prefix.startswith("s3://"):
+        bucket = prefix[len("s3://") :].split("/", 1)[0]
+        cmd = ["aws", "s3", "ls", "--recursive", prefix]
+        env = os.environ.copy()
+        if aws_config.S3_ENDPOINT.get() is not None:
+            cmd[1:1] = [aws_config.S3_ENDPOINT_ARG_NAME, aws_config.S3_ENDPOINT.get()]
+        if aws_config.S3_ACCESS_KEY_ID.get() is not None:
+            env[aws_config.S3_ACCESS_KEY_ID_ENV_NAME] = (
+                aws_config.S3_ACCESS_KEY_ID.get()
+            )
+        if aws_config.S3_SECRET_ACCESS_KEY.get() is not None:
+            env[aws_config.S3_SECRET_ACCESS_KEY_ENV_NAME] = (
+                aws_config.S3_SECRET_ACCESS_KEY.get()
+            )
+        # Without matches, the CLI exits with 1 and prints nothing
+        out = _run_cli(
+            cmd,
+            lambda p: p.returncode == 1 and not p.stdout and not p.stderr.strip(),
+            env=env,
+        )
+        # Every line has the form "<date> <time> <size> <key>"
+        return [
+            f"s3://{bucket}/{line.split(None, 3)[3]}"
+            for line in out.splitlines()
+            if len(line.split(None, 3)) == 4
+        ]
+    if prefix.startswith("gs://"):
+        out = _run_cli(
+            ["gsutil", "ls", f"{prefix}**"],
+            lambda p: "matched no objects" in p.stderr,
+        )
+        return [line.strip() for line in out.splitlines() if line.strip()]
+    base = prefix if os.path.isdir(prefix) else os.path.dirname(prefix)
+    if not os.path.isdir(base):
+        return []
+    return [
+        os.path.join(root, f)
+        for root, _, files in os.walk(base)
+        for f in files
+        if os.path.join(root, f).startswith(prefix)
+    ]
+
+
+# %%
+# Local Notifications
+# ^^^^^^^^^^^^^^^^^^^
+# When every watched path is local, the sensor waits on file system events instead of sleeping. The backoff delay is
+# still used as a timeout, so that events that are missed - e.g. on network file systems - only delay detection.
+class LocalNotifier(object):
+    def __init__(self, paths: typing.List[str]):
+        self._event = threading.Event()
+        handler = FileSystemEventHandler()
+        handler.on_any_event = lambda _: self._event.set()
+        self._observer = Observer()
+        for d in {self._existing_parent(p) for p in paths}:
+            self._observer.schedule(handler, d, recursive=True)
+        self._observer.start()
+
+    @staticmethod
+    def _existing_parent(path: str) -> str:
+        path = os.path.abspath(path)
+        while not os.path.isdir(path):
+            path = os.path.dirname(path)
+        return path
+
+    def wait(self, timeout: float):
+        self._event.wait(timeout)
+        self._event.clear()
+
+    def stop(self):
+        self._observer.stop()
+        self._observer.join()
+
+
+# %%
+# Sensor Base Class
+# ^^^^^^^^^^^^^^^^^
+# The base class owns the wait loop. Subclasses only implement ``poke``, which checks the object store once and returns
+# the task's output when the sensor is done - or ``None`` to keep waiting - along with the number of object store calls
+# it made. Any state that a sensor wants to keep between two pokes is kept in the ``state`` dictionary. Tasks track the
+# module they are created in through their metaclass, which the metaclass of an abstract sensor has to extend.
+class _AbstractTaskMeta(InstanceTrackingMeta, abc.ABCMeta):
+    pass
+
+
+class ObjectStoreSensor(PythonTask, abc.ABC, metaclass=_AbstractTaskMeta):
+    def __init__(
+        self,
+        name: str,
+        inputs: typing.Dict[str, type],
+        outputs: typing.Dict[str, type],
+        backoff: Backoff = None,
+        local_notifications: bool = True,
+        **kwargs,
+    ):
+        super(ObjectStoreSensor, self).__init__(
+            task_type="object-store-sensor",
+            name=name,
+            task_config=None,
+            interface=Interface(inputs=inputs, outputs=outputs),
+            **kwargs,
+        )
+        self._backoff = backoff or Backoff()
+        self._local_notifications = local_notifications
+
+    @abc.abstractmethod
+    def watched_paths(self, **kwargs) -> typing.List[str]:
+        ...
+
+    @abc.abstractmethod
+    def poke(
+        self, ctx: context_manager.FlyteContext, state: dict, **kwargs
+    ) -> typing.Tuple[typing.Any, int]:
+        ...
+
+    def execute(self, **kwargs) -> typing.Any:
+        ctx = context_manager.FlyteContext.current_context()
+        user_context = ctx.user_space_params
+        paths = self.watched_paths(**kwargs)
+        notifier = None
+        if (
+            self._local_notifications
+            and Observer is not None
+            and all(is_local(p) for p in paths)
+        ):
+            notifier = LocalNotifier(paths)
+
+        start = time.monotonic()
+        state = {}
+        calls = 0
+        polls = 0
+        try:
+            for delay in self._backoff.intervals():
+                result, n = self.poke(ctx, state, **kwargs)
+                calls += n
+                polls += 1
+                if result is not None:
+                    elapsed = time.monotonic() - start
+                    user_context.stats.gauge(
+                        f"{self.name}.time_to_detect_ms", int(elapsed * 1000)
+                    )
+                    user_context.stats.incr(f"{self.name}.api_calls", calls)
+                    user_context.logging.info(
+                        f"Sensed {paths} after {elapsed:.2f}s, {polls} polls and {calls} object store calls"
+                    )
+                    return result
+                if polls == 1:
+                    user_context.logging.info(f"Waiting for {paths}...")
+                if notifier is not None:
+                    notifier.wait(delay)
+                else:
+                    time.sleep(delay)
+        finally:
+            if notifier is not None:
+                notifier.stop()
+
+
+# %%
+# Waiting for Many Files
+# ^^^^^^^^^^^^^^^^^^^^^^
+# This sensor waits for all of the given paths. Paths that were found once are not checked again.
+class WaitForObjectStoreFiles(ObjectStoreSensor):
+    _VAR_NAME: str = "paths"
+
+    def __init__(self, name: str, **kwargs):
+        super(WaitForObjectStoreFiles, self).__init__(
+            name=name,
+            inputs={self._VAR_NAME: typing.List[str]},
+            outputs={self._VAR_NAME: typing.List[str]},
+            **kwargs,
+        )
+
+    def watched_paths(self, **kwargs) -> typing.List[str]:
+        return kwargs[self._VAR_NAME]
+
+    def poke(
+        self, ctx: context_manager.FlyteContext, state: dict, **kwargs
+    ) -> typing.Tuple[typing.Any, int]:
+        paths = kwargs[self._VAR_NAME]
+        pending = state.setdefault("pending", list(paths))
+        state["pending"] = [p for p in pending if not ctx.file_access.exists(p)]
+        return (paths if not state["pending"] else None), len(pending)
+
+
+# %%
+# Waiting for a Pattern
+# ^^^^^^^^^^^^^^^^^^^^^
+# This sensor lists a prefix once per poll and waits until at least ``min_files`` objects under it match a glob style
+# ``pattern``. It returns the matching paths, so that downstream tasks know which files landed.
+class WaitForObjectStorePrefix(ObjectStoreSensor):
+    _VAR_NAME: str = "prefix"
+
+    def __init__(self, name: str, pattern: str = "*", min_files: int = 1, **kwargs):
+        super(WaitForObjectStorePrefix, self).__init__(
+            name=name,
+            inputs={self._VAR_NAME: str},
+            outputs={"paths": typing.List[str]},
+            **kwargs,
+        )
+        self._pattern = pattern
+        self._min_files = min_files
+
+    def watched_paths(self, **kwargs) -> typing.List[str]:
+        return [kwargs[self._VAR_NAME]]
+
+    def poke(
+        self, ctx: context_manager.FlyteContext, state: dict, **kwargs
+    ) -> typing.Tuple[typing.Any, int]:
+        prefix = kwargs[self._VAR_NAME]
+        matches = sorted(
+            p
+            for p in list_prefix(prefix)
+            if fnmatch.fnmatch(p[len(prefix) :].lstrip("/"), self._pattern)
+        )
+        return (matches if len(matches) >= self._min_files else None), 1
+
+
+# %%
+# Batched Sensing With a Quorum
+# ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+# Instead of one ``WaitForObjectStoreFile`` per expected file - each of them a pod with its own polling loop - a single
+# batched sensor can wait for all of them. Rather than checking every path individually, it groups the paths that have
+# not landed yet by their parent prefix and lists each prefix once per poll, so the number of object store calls grows
+# with the number of distinct prefixes, not with the number of files.
+#
+# By default the sensor waits for all the paths. With ``quorum`` it returns as soon as that many have landed. The output
+# holds the paths that have landed, in the order they were given.
+class WaitForObjectStoreFileBatch(ObjectStoreSensor):
+    _VAR_NAME: str = "paths"
+
+    def __init__(self, name: str, quorum: typing.Optional[int] = None, **kwargs):
+        super(WaitForObjectStoreFileBatch, self).__init__(
+            name=name,
+            inputs={self._VAR_NAME: typing.List[str]},
+            outputs={self._VAR_NAME: typing.List[str]},
+            **kwargs,
+        )
+        self._quorum = quorum
+
+    def watched_paths(self, **kwargs) -> typing.List[str]:
+        return kwargs[self._VAR_NAME]
+
+    def poke(
+        self, ctx: context_manager.FlyteContext, state: dict, **kwargs
+    ) -> typing.Tuple[typing.Any, int]:
+        paths = kwargs[self._VAR_NAME]
+        quorum = len(paths) if self._quorum is None else min(self._quorum, len(paths))
+        landed = state.setdefault("landed", set())
+        by_prefix = {}
+        for p in paths:
+            if p not in landed:
+                # Relative local paths would otherwise have the empty directory - the root - as their prefix
+                path = os.path.abspath(p) if is_local(p) else p
+                prefix = os.path.dirname(path).rstrip("/") + "/"
+                by_prefix.setdefault(prefix, {})[path] = p
+        for prefix, pending in by_prefix.items():
+            found = set(list_prefix(prefix))
+            landed.update(p for path, p in pending.items() if path in found)
+        if len(landed) >= quorum:
+            return [p for p in paths if p in landed], len(by_prefix)
+        return None, len(by_prefix)
+
+
+# %%
+# Actual Usage
+# ^^^^^^^^^^^^
+files_sensor = WaitForObjectStoreFiles(
+    name="my-objectstore-files-sensor",
+    metadata=TaskMetadata(retries=10, timeout=timedelta(hours=1)),
+    backoff=Backoff(initial=timedelta(seconds=1), maximum=timedelta(minutes=2)),
+)
+
+prefix_sensor = WaitForObjectStorePrefix(
+    name="my-objectstore-prefix-sensor",
+    pattern="*.csv",
+    min_files=2,
+    metadata=TaskMetadata(retries=10, timeout=timedelta(hours=1)),
+    backoff=Backoff(initial=timedelta(seconds=1), maximum=timedelta(minutes=2)),
+)
+
+batch_sensor = WaitForObjectStoreFileBatch(
+    name="my-objectstore-batch-sensor",
+    quorum=2,
+    metadata=TaskMetadata(retries=10, timeout=timedelta(hours=1)),
+    backoff=Backoff(initial=timedelta(seconds=1), maximum=timedelta(minutes=2)),
+)
+
+
+@task
+def count_files(paths: typing.List[str]) -> int:
+    return len(paths)
+
+
+@workflow
+def wait_for_files(paths: typing.List[str]) -> int:
+    return count_files(paths=files_sensor(paths=paths))
+
+
+@workflow
+def wait_for_prefix(prefix: str) -> int:
+    return count_files(paths=prefix_sensor(prefix=prefix))
+
+
+@workflow
+def wait_for_quorum(paths: typing.List[str]) -> int:
+    return count_files(paths=batch_sensor(paths=paths))
+
+
+# %%
+# To try the sensors locally, we create the files from a background thread a little after the workflows start.
+if __name__ == "__main__":
+    import tempfile
+
+    d = tempfile.mkdtemp()
+    expected = [os.path.join(d, f"part-{i}.csv") for i in range(3)]
+
+    def land_files():
+        for p in expected:
+            time.sleep(0.5)
+            with open(p, "w") as w:
+                w.write("a,b\n1,2\n")
+
+    threading.Thread(target=land_files).start()
+    print(f"wait_for_quorum -> {wait_for_quorum(paths=expected)}")
+    print(f"wait_for_prefix -> {wait_for_prefix(prefix=d)}")
+    print(f"wait_for_files -> {wait_for_files(paths=expected)}")
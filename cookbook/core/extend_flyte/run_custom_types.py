@@ -20,6 +20,7 @@ Flytekit's typing engine.
 import os
 import tempfile
 import typing
+from concurrent.futures import Future, ThreadPoolExecutor
 
 # %%
 # FlyteContext is used only to access a random local directory
@@ -39,6 +40,9 @@ class MyDataset(object):
     Dataset here is a set of files that exist together. In Flyte this maps to a Multi-part blob or a directory
     """
 
+    # Name of the index file written next to the data, listing the names of all files in the dataset
+    MANIFEST = ".manifest"
+
     def __init__(self, base_dir: str = None):
         if base_dir is None:
             self._tmp_dir = tempfile.TemporaryDirectory()
@@ -47,7 +51,9 @@ class MyDataset(object):
         else:
             self._base_dir = base_dir
             files = os.listdir(base_dir)
-            self._files = [os.path.join(base_dir, f) for f in files]
+            self._files = [
+                os.path.join(base_dir, f) for f in files if f != self.MANIFEST
+            ]
 
     @property
     def base_dir(self) -> str:
@@ -103,7 +109,13 @@ class MyDatasetTransformer(TypeTransformer[MyDataset]):
         # Step 1: lets upload all the data into a remote place recommended by Flyte
         remote_dir = ctx.file_access.get_random_remote_directory()
         ctx.file_access.upload_directory(python_val.base_dir, remote_dir)
-        # Step 2: lets return a pointer to this remote_dir in the form of a literal
+        # Step 2: lets upload an index of the files next to them, so that readers can find them without listing the
+        # remote directory. It is written to a file of its own, to leave the directory of the dataset untouched
+        manifest = ctx.file_access.get_random_local_path()
+        with open(manifest, "w") as f:
+            f.write("\n".join(os.path.basename(fp) for fp in python_val.files))
+        ctx.file_access.put_data(manifest, os.path.join(remote_dir, MyDataset.MANIFEST))
+        # Step 3: lets return a pointer to this remote_dir in the form of a literal
         return Literal(
             scalar=Scalar(
                 blob=Blob(uri=remote_dir, metadata=BlobMetadata(type=self._TYPE_INFO))
@@ -159,9 +171,173 @@ def wf() -> str:
     return consume(d=generate())
 
 
+# %%
+# Lazily Materialized Datasets
+# ^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+#
+# ``MyDatasetTransformer.to_python_value`` downloads the entire directory before the task body runs. For large
+# multi-part blobs of which a task only reads a few parts, this is wasteful. Since the transformer decides how the
+# literal is re-hydrated, we can instead hand out remote-backed file handles, that are downloaded only when they are
+# first opened. This is the same idea that :py:class:`flytekit.types.file.FlyteFile` uses.
+class LazyFile(os.PathLike):
+    """
+    A handle to a single file in a remote dataset. The file is downloaded the first time its path is needed.
+    """
+
+    def __init__(
+        self,
+        ctx: FlyteContext,
+        remote_path: str,
+        local_path: str,
+        downloaded: bool = False,
+    ):
+        self._file_access = ctx.file_access
+        self._remote_path = remote_path
+        self._local_path = local_path
+        self._download: typing.Optional[Future] = None
+        self._downloaded = downloaded
+
+    @property
+    def remote_path(self) -> str:
+        return self._remote_path
+
+    @property
+    def downloaded(self) -> bool:
+        return self._downloaded
+
+    def _get(self):
+        self._file_access.get_data(self._remote_path, self._local_path)
+        self._downloaded = True
+
+    def prefetch(self, executor: ThreadPoolExecutor):
+        """
+        Starts downloading the file in the background, if that has not happened already
+        """
+        if self._download is None and not self._downloaded:
+            self._download = executor.submit(self._get)
+
+    def download(self) -> str:
+        if self._download is not None:
+            self._download.result()
+        elif not self._downloaded:
+            self._get()
+        return self._local_path
+
+    def __fspath__(self) -> str:
+        return self.download()
+
+    def open(self, mode: str = "r") -> typing.IO:
+        return open(self.download(), mode)
+
+
+# %%
+# The lazy dataset reads the manifest written by ``to_literal`` - a single small file - and creates one handle per
+# entry. Datasets that were written without a manifest cannot be listed this way, so they are downloaded as a whole,
+# like ``MyDatasetTransformer`` does. Optionally, opening a file starts downloading the next ``prefetch`` files in the
+# background, which hides the download latency for tasks that read the files in order. All datasets share a small pool
+# of download threads, so no dataset leaves threads of its own behind.
+_PREFETCH_EXECUTOR = ThreadPoolExecutor(
+    max_workers=4, thread_name_prefix="mydataset-prefetch"
+)
+
+
+class LazyMyDataset(MyDataset):
+    """
+    A :py:class:`MyDataset` whose files are downloaded on first access
+    """
+
+    def __init__(
+        self, ctx: FlyteContext, remote_dir: str, local_dir: str, prefetch: int = 0
+    ):
+        remote_manifest = os.path.join(remote_dir, MyDataset.MANIFEST)
+        if ctx.file_access.exists(remote_manifest):
+            manifest = os.path.join(local_dir, MyDataset.MANIFEST)
+            ctx.file_access.get_data(remote_manifest, manifest)
+            with open(manifest) as f:
+                names = [n for n in f.read().splitlines() if n]
+            downloaded = False
+        else:
+            ctx.file_access.download_directory(remote_dir, local_dir)
+            names = sorted(os.listdir(local_dir))
+            downloaded = True
+        super(LazyMyDataset, self).__init__(base_dir=local_dir)
+        self._handles = [
+            LazyFile(
+                ctx,
+                os.path.join(remote_dir, n),
+                os.path.join(local_dir, n),
+                downloaded=downloaded,
+            )
+            for n in names
+        ]
+        self._prefetch = prefetch
+
+    @property
+    def files(self) -> typing.List[LazyFile]:
+        return self._handles
+
+    def open(self, idx: int, mode: str = "r") -> typing.IO:
+        """
+        Opens the file at the given position and prefetches the ones that follow it
+        """
+        for h in self._handles[idx + 1 : idx + 1 + self._prefetch]:
+            h.prefetch(_PREFETCH_EXECUTOR)
+        return self._handles[idx].open(mode)
+
+    def new_file(self, name: str) -> str:
+        raise ValueError(
+            "LazyMyDataset is read-only, create a MyDataset to write files"
+        )
+
+
+# %%
+# The transformer only differs from ``MyDatasetTransformer`` in how the value is re-hydrated. The literal type is the
+# same, so a task that produces ``MyDataset`` can be consumed by a task that accepts ``LazyMyDataset``.
+class LazyMyDatasetTransformer(MyDatasetTransformer):
+    def __init__(self, prefetch: int = 0):
+        TypeTransformer.__init__(self, name="lazy-mydataset-transform", t=LazyMyDataset)
+        self._prefetch = prefetch
+
+    def to_literal(
+        self,
+        ctx: FlyteContext,
+        python_val: LazyMyDataset,
+        python_type: Type[LazyMyDataset],
+        expected: LiteralType,
+    ) -> Literal:
+        raise ValueError("LazyMyDataset is read-only, return a MyDataset instead")
+
+    def to_python_value(
+        self, ctx: FlyteContext, lv: Literal, expected_python_type: Type[LazyMyDataset]
+    ) -> LazyMyDataset:
+        return LazyMyDataset(
+            ctx,
+            remote_dir=lv.scalar.blob.uri,
+            local_dir=ctx.file_access.get_random_local_directory(),
+            prefetch=self._prefetch,
+        )
+
+
+TypeEngine.register(LazyMyDatasetTransformer(prefetch=1))
+
+
+# %%
+# This consumer only pays for the one file it reads, no matter how many files the dataset holds.
+@task
+def consume_first(d: LazyMyDataset) -> str:
+    with d.open(0) as fp:
+        return fp.read()
+
+
+@workflow
+def lazy_wf() -> str:
+    return consume_first(d=generate())
+
+
 # %%
 # We can run this workflow locally and test it. Remember even when you run it locally, flytekit will excercise the
 # entire path
 
 if __name__ == "__main__":
     print(wf())
+    print(lazy_wf())
@@ -18,6 +18,11 @@ and thus users are not required to build a container for SQLite3. You can simply
 execute it immediately.
 
 In some cases local execution is not possible - e.g. Snowflake. But for SQLlite3 local execution is also supported.
+
+.. tip::
+
+    Every execution of a ``SQLite3Task`` downloads and unpacks its database again. Refer to :ref:`extend_fast_sqlite3`
+    for a variant that caches databases and query results on disk.
 """
 import pandas
 from flytekit import kwtypes, task, workflow
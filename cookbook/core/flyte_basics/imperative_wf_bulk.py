@@ -0,0 +1,380 @@
+"""
+.. _imperative_wf_bulk:
+
+Building Large Imperative Workflows
+-----------------------------------
+
+:ref:`imperative_wf_style` adds nodes to a workflow one at a time with ``add_entity``. That is the right tool for a
+handful of nodes, but workflows that are generated from legacy DAG definitions often have thousands of them, and
+
+- every ``add_entity`` call enters and leaves a compilation context of its own,
+- nodes have to be added in an order in which all their inputs already exist, and
+- the first invalid node raises, so fixing a broken definition takes one attempt per error.
+
+This example adds a bulk builder that takes the whole DAG as a list of node specs, sorts it topologically, validates
+all of it at once and then constructs the workflow in a single pass.
+"""
+import collections
+import time
+import typing
+from dataclasses import dataclass, field
+
+from flytekit import Workflow, task
+from flytekit.common.exceptions.user import FlyteValidationException
+from flytekit.core.context_manager import FlyteContext, FlyteContextManager
+from flytekit.core.node import Node
+from flytekit.core.node_creation import create_node
+from flytekit.core.promise import Promise
+
+
+# %%
+# Describing a DAG
+# ^^^^^^^^^^^^^^^^
+# A node spec names the entity to run and binds each of its inputs to a constant, to a workflow input or to an output
+# of another node. Lists and dicts of those are supported, just like with ``add_entity``. ``upstream`` lists nodes that
+# have to run before this one without passing data to it.
+class Input(typing.NamedTuple):
+    name: str
+
+
+class Output(typing.NamedTuple):
+    node: str
+    var: str = "o0"
+
+
+@dataclass
+class NodeSpec(object):
+    id: str
+    entity: typing.Any
+    inputs: typing.Dict[str, typing.Any] = field(default_factory=dict)
+    upstream: typing.List[str] = field(default_factory=list)
+
+
+def _references(value) -> typing.Iterator[typing.Union[Input, Output]]:
+    if isinstance(value, (Input, Output)):
+        yield value
+    elif isinstance(value, list):
+        for v in value:
+            yield from _references(v)
+    elif isinstance(value, dict):
+        for v in value.values():
+            yield from _references(v)
+
+
+def _topological_order(
+    specs: typing.List[NodeSpec],
+    by_id: typing.Dict[str, NodeSpec],
+    dependencies: typing.Dict[str, typing.Set[str]],
+    errors: typing.List[str],
+) -> typing.List[NodeSpec]:
+    """
+    Kahn's algorithm, keeping the order of the specs among nodes that are ready at the same time. Nodes that are part of
+    a cycle, or depend on one, are reported and left out.
+    """
+    downstream = {spec_id: [] for spec_id in by_id}
+    pending = {}
+    for spec_id, deps in dependencies.items():
+        pending[spec_id] = len(deps)
+        for d in deps:
+            downstream[d].append(spec_id)
+    ready = collections.deque(spec.id for spec in specs if pending[spec.id] == 0)
+    order = []
+    while ready:
+        spec_id = ready.popleft()
+        order.append(by_id[spec_id])
+        for d in downstream[spec_id]:
+            pending[d] -= 1
+            if pending[d] == 0:
+                ready.append(d)
+    if len(order) < len(by_id):
+        cycle = sorted(k for k, v in pending.items() if v > 0)
+        errors.append(f"Nodes {cycle} are part of or depend on a cycle")
+    return order
+
+
+# %%
+# The Bulk Builder
+# ^^^^^^^^^^^^^^^^
+# ``BulkWorkflow`` is an imperative workflow - it can still be extended with ``add_entity`` - with methods that add many
+# inputs, nodes and outputs at once.
+class BulkWorkflow(Workflow):
+    def add_workflow_inputs(
+        self, inputs: typing.Dict[str, typing.Type]
+    ) -> typing.Dict[str, Promise]:
+        duplicates = set(inputs).intersection(self.inputs)
+        if duplicates:
+            raise FlyteValidationException(
+                f"Inputs {duplicates} have already been specified for wf {self.name}."
+            )
+        return {k: self.add_workflow_input(k, t) for k, t in inputs.items()}
+
+    def _dependencies(
+        self,
+        spec: NodeSpec,
+        by_id: typing.Dict[str, NodeSpec],
+        errors: typing.List[str],
+    ) -> typing.Set[str]:
+        """
+        Validates the inputs of the spec and returns the ids of the nodes it depends on
+        """
+        interface = spec.entity.python_interface
+        missing = set(interface.inputs).difference(spec.inputs)
+        if missing:
+            errors.append(f"Node {spec.id}: inputs {sorted(missing)} are not bound")
+        extra = set(spec.inputs).difference(interface.inputs)
+        if extra:
+            errors.append(
+                f"Node {spec.id}: {spec.entity.name} has no inputs {sorted(extra)}"
+            )
+        deps = set()
+        for ref in _references(spec.inputs):
+            if isinstance(ref, Input):
+                if ref.name not in self.inputs:
+                    errors.append(
+                        f"Node {spec.id}: workflow input {ref.name} does not exist"
+                    )
+            elif ref.node not in by_id:
+                errors.append(
+                    f"Node {spec.id}: upstream node {ref.node} does not exist"
+                )
+            else:
+                if ref.var not in by_id[ref.node].entity.python_interface.outputs:
+                    errors.append(
+                        f"Node {spec.id}: node {ref.node} has no output {ref.var}"
+                    )
+                deps.add(ref.node)
+        for upstream in spec.upstream:
+            if upstream not in by_id:
+                errors.append(
+                    f"Node {spec.id}: upstream node {upstream} does not exist"
+                )
+            else:
+                deps.add(upstream)
+        return deps
+
+    def _sort(
+        self, specs: typing.List[NodeSpec], errors: typing.List[str]
+    ) -> typing.List[NodeSpec]:
+        """
+        Validates the specs and returns them in topological order
+        """
+        by_id = {}
+        for spec in specs:
+            if spec.id in by_id:
+                errors.append(f"Node {spec.id} is specified more than once")
+            by_id[spec.id] = spec
+        dependencies = {
+            spec.id: self._dependencies(spec, by_id, errors) for spec in specs
+        }
+        return _topological_order(specs, by_id, dependencies, errors)
+
+    def _resolve(self, value, nodes: typing.Dict[str, Node]):
+        if isinstance(value, Input):
+            return self._inputs[value.name]
+        if isinstance(value, Output):
+            return nodes[value.node].outputs[value.var]
+        if isinstance(value, list):
+            return [self._resolve(v, nodes) for v in value]
+        if isinstance(value, dict):
+            return {k: self._resolve(v, nodes) for k, v in value.items()}
+        return value
+
+    def add_nodes(self, specs: typing.List[NodeSpec]) -> typing.Dict[str, Node]:
+        """
+        Adds all the nodes to the workflow in topological order and returns them by their spec id. All the problems
+        that are found are raised together in a single ``FlyteValidationException``.
+        """
+        errors = []
+        order = self._sort(specs, errors)
+        if errors:
+            raise FlyteValidationException("\n".join(errors))
+
+        nodes = {}
+        ctx = FlyteContext.current_context()
+        if ctx.compilation_state is not None:
+            raise Exception("Can't already be compiling")
+        self._create_nodes(ctx, order, nodes, errors)
+        if errors:
+            raise FlyteValidationException("\n".join(errors))
+
+        # Nodes are not created with ``add_entity``, so the inputs they use are marked as bound the way it does
+        for spec in specs:
+            for ref in _references(spec.inputs):
+                if isinstance(ref, Input):
+                    self._unbound_inputs.discard(self.inputs[ref.name])
+        return nodes
+
+    def _create_nodes(
+        self,
+        ctx: FlyteContext,
+        order: typing.List[NodeSpec],
+        nodes: typing.Dict[str, Node],
+        errors: typing.List[str],
+    ):
+        # All the nodes are created in a single compilation context
+        with FlyteContextManager.with_context(
+            ctx.with_compilation_state(self.compilation_state)
+        ):
+            for spec in order:
+                try:
+                    node = create_node(spec.entity, **self._resolve(spec.inputs, nodes))
+                except Exception as e:
+                    # Keep going, so that every node with a type error is reported at once
+                    if any(d not in nodes for d in spec.upstream) or any(
+                        isinstance(r, Output) and r.node not in nodes
+                        for r in _references(spec.inputs)
+                    ):
+                        continue
+                    errors.append(f"Node {spec.id}: {e}")
+                    continue
+                for upstream in spec.upstream:
+                    if upstream in nodes:
+                        nodes[upstream].runs_before(node)
+                nodes[spec.id] = node
+
+    def add_workflow_outputs(
+        self,
+        outputs: typing.Dict[str, typing.Any],
+        nodes: typing.Dict[str, Node],
+        python_types: typing.Optional[typing.Dict[str, typing.Type]] = None,
+    ):
+        """
+        Adds all the outputs at once. The python type of an output that is bound to a single node output is inferred,
+        the types of lists and dicts have to be given.
+        """
+        python_types = dict(python_types or {})
+        errors = []
+        for name, value in outputs.items():
+            if name in self.python_interface.outputs:
+                errors.append(f"Output {name} already exists in workflow {self.name}")
+            if name not in python_types:
+                if isinstance(value, Output):
+                    python_types[name] = nodes[
+                        value.node
+                    ].flyte_entity.python_interface.outputs[value.var]
+                else:
+                    errors.append(f"Output {name} needs a python type")
+        if errors:
+            raise FlyteValidationException("\n".join(errors))
+
+        for name, value in outputs.items():
+            self.add_workflow_output(
+                name, self._resolve(value, nodes), python_types[name]
+            )
+
+
+def build_workflow(
+    name: str,
+    inputs: typing.Dict[str, typing.Type],
+    nodes: typing.List[NodeSpec],
+    outputs: typing.Dict[str, typing.Any],
+    output_types: typing.Optional[typing.Dict[str, typing.Type]] = None,
+) -> BulkWorkflow:
+    wb = BulkWorkflow(name=name)
+    wb.add_workflow_inputs(inputs)
+    built = wb.add_nodes(nodes)
+    wb.add_workflow_outputs(outputs, built, output_types)
+    return wb
+
+
+# %%
+# Using the Builder
+# ^^^^^^^^^^^^^^^^^
+# The tasks from :ref:`imperative_wf_style`, wired up from a description - note that the nodes do not have to be listed
+# in order.
+@task
+def t1(a: str) -> str:
+    return a + " world"
+
+
+@task
+def t2():
+    print("side effect")
+
+
+@task
+def t3(a: typing.List[str]) -> str:
+    return ",".join(a)
+
+
+wb = build_workflow(
+    name="my.imperative.workflow.bulk",
+    inputs={"in1": str, "in2": str},
+    nodes=[
+        NodeSpec("join", t3, {"a": [Output("hello"), Input("in2")]}),
+        NodeSpec("hello", t1, {"a": Input("in1")}),
+        NodeSpec("side_effect", t2, upstream=["hello"]),
+    ],
+    outputs={
+        "output_from_t1": Output("hello"),
+        "output_list": [Output("hello"), Output("join")],
+    },
+    output_types={"output_list": typing.List[str]},
+)
+
+
+# %%
+# Benchmarking Build Times
+# ^^^^^^^^^^^^^^^^^^^^^^^^
+# To compare both builders, we generate a layered DAG in which every node adds up two nodes of the layer before it,
+# and build it once with ``add_entity`` calls and once with the bulk builder.
+@task
+def add(a: int, b: int) -> int:
+    return a + b
+
+
+def layered_dag(
+    num_nodes: int, width: int = 50
+) -> typing.Tuple[typing.Dict[str, typing.Type], typing.List[NodeSpec]]:
+    inputs = {f"x{i}": int for i in range(width)}
+    specs = []
+    for i in range(num_nodes):
+        layer, pos = divmod(i, width)
+        if layer == 0:
+            a, b = Input(f"x{pos}"), Input(f"x{(pos + 1) % width}")
+        else:
+            a = Output(f"n{i - width}")
+            b = Output(f"n{(layer - 1) * width + (pos + 1) % width}")
+        specs.append(NodeSpec(f"n{i}", add, {"a": a, "b": b}))
+    return inputs, specs
+
+
+def build_one_by_one(
+    name: str, inputs: typing.Dict[str, typing.Type], specs: typing.List[NodeSpec]
+) -> Workflow:
+    wf = Workflow(name=name)
+    for input_name, python_type in inputs.items():
+        wf.add_workflow_input(input_name, python_type)
+    nodes = {}
+
+    def resolve(v):
+        if isinstance(v, Input):
+            return wf.inputs[v.name]
+        return nodes[v.node].outputs[v.var]
+
+    for spec in specs:
+        nodes[spec.id] = wf.add_entity(
+            spec.entity, **{k: resolve(v) for k, v in spec.inputs.items()}
+        )
+    wf.add_workflow_output("o0", nodes[specs[-1].id].outputs["o0"])
+    return wf
+
+
+def benchmark(sizes: typing.List[int] = (500, 1000, 2000, 5000)):
+    print(f"{'nodes':>8}{'add_entity (s)':>18}{'bulk (s)':>12}")
+    for n in sizes:
+        inputs, specs = layered_dag(n)
+        start = time.monotonic()
+        build_one_by_one(f"bench.one_by_one.{n}", inputs, specs)
+        one_by_one = time.monotonic() - start
+        start = time.monotonic()
+        build_workflow(
+            f"bench.bulk.{n}", inputs, specs, outputs={"o0": Output(specs[-1].id)}
+        )
+        bulk = time.monotonic() - start
+        print(f"{n:>8}{one_by_one:>18.3f}{bulk:>12.3f}")
+
+
+if __name__ == "__main__":
+    print(wb(in1="hello", in2="foo"))
+    benchmark()
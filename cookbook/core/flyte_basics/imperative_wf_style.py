@@ -11,6 +11,9 @@ and record the workflow structure. This is the declarative style and makes sense
 For cases where workflows are constructed programmatically, an imperative style makes more sense. For example, when tasks have already been defined, their order and dependencies have
 been specified in text format of some kind (perhaps you're converting from a legacy system), and your goal is to orchestrate those tasks. 
 
+.. tip::
+
+    For generated workflows with thousands of nodes, refer to :ref:`imperative_wf_bulk`.
 """
 import typing
 
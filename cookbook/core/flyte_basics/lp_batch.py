@@ -0,0 +1,398 @@
+"""
+Launching Launch Plans in Batches
+---------------------------------
+
+:ref:`The launch plans example <sphx_glr_auto_core_flyte_basics_lp.py>` greets every day of the week by calling
+``morning_greeting`` in a loop. Backfills and per-tenant runs launch the same launch plan for thousands of input sets
+though, and launching them one after the other - waiting for each execution to finish before launching the next - takes
+as long as all executions together.
+
+This example launches a launch plan for a list of input sets concurrently. The number of executions that run at the
+same time is bounded, launches are rate limited so that Flyte Admin is not flooded, and the outputs and failures of all
+executions are collected in the order of the input sets. The launcher talks to Flyte Admin through a
+:py:class:`flytekit.clients.friendly.SynchronousFlyteClient`, or to a local stand-in with the same methods, which runs
+the launch plans locally.
+"""
+import datetime
+import threading
+import time
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
+from flytekit import LaunchPlan
+from flytekit.common.exceptions import user as _user_exceptions
+from flytekit.core.context_manager import FlyteContextManager
+from flytekit.core.type_engine import TypeEngine
+from flytekit.models import execution as _execution_models
+from flytekit.models import literals as _literal_models
+from flytekit.models.core import execution as _core_execution_models
+from flytekit.models.core import identifier as _identifier_models
+
+from core.flyte_basics.lp import morning_greeting
+
+_TERMINAL_PHASES = {
+    _core_execution_models.WorkflowExecutionPhase.SUCCEEDED,
+    _core_execution_models.WorkflowExecutionPhase.FAILED,
+    _core_execution_models.WorkflowExecutionPhase.ABORTED,
+    _core_execution_models.WorkflowExecutionPhase.TIMED_OUT,
+}
+
+
+# %%
+# Rate Limiting
+# ^^^^^^^^^^^^^
+# A token bucket allows short bursts of launches while keeping the average rate at the limit.
+class RateLimiter(object):
+    def __init__(self, rate: float, burst: int = 1):
+        self._rate = rate
+        self._burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self._burst, self._tokens + (now - self._updated) * self._rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self._rate
+            time.sleep(wait)
+
+
+# %%
+# The Batch Launcher
+# ^^^^^^^^^^^^^^^^^^
+# Inputs are converted to literals up front, so that input sets that do not match the launch plan - that lack a required
+# input, override a fixed one or have one the workflow does not know - fail right away. Only the inputs of a set are sent - Flyte Admin fills in the default and fixed inputs of the launch plan.
+# Each worker launches an execution and polls it until it is done, so at most ``max_parallel`` executions run at the
+# same time - unless the batch is started with ``launch``, which only creates the executions, for callers that check on
+# them later. Executions are named after the prefix and the index of their input set, when a prefix is given, or get the
+# names they are given. Flyte Admin refuses to launch an execution with a name that already exists, in which case the
+# launcher waits for the existing execution instead - so a batch that was interrupted can be launched again without
+# running any input set twice. The existing execution has to be one of the same launch plan with the same inputs though;
+# a name that is taken by any other execution is a failure of its input set.
+class BatchResult(typing.NamedTuple):
+    outputs: typing.List[typing.Any]
+    failures: typing.Dict[int, str]
+    executions: typing.List[
+        typing.Optional[_identifier_models.WorkflowExecutionIdentifier]
+    ]
+
+
+class BatchLauncher(object):
+    def __init__(
+        self,
+        client,
+        project: str,
+        domain: str,
+        version: str,
+        max_parallel: int = 10,
+        launches_per_second: float = 5.0,
+        poll_interval: float = 5.0,
+    ):
+        self._client = client
+        self._project = project
+        self._domain = domain
+        self._version = version
+        self._max_parallel = max_parallel
+        self._limiter = RateLimiter(launches_per_second, burst=max_parallel)
+        self._poll_interval = poll_interval
+
+    def _to_literal_map(
+        self, lp: LaunchPlan, inputs: typing.Dict[str, typing.Any]
+    ) -> _literal_models.LiteralMap:
+        fixed = set(inputs).intersection(lp.fixed_inputs.literals)
+        if fixed:
+            raise ValueError(f"Inputs {sorted(fixed)} are fixed by {lp.name}")
+        missing = [
+            k
+            for k, p in lp.parameters.parameters.items()
+            if p.required and k not in inputs
+        ]
+        if missing:
+            raise ValueError(f"Inputs {missing} of {lp.name} are required")
+        ctx = FlyteContextManager.current_context()
+        types = lp.workflow.python_interface.inputs
+        literals = {}
+        for k, v in inputs.items():
+            if k not in types:
+                raise ValueError(f"{lp.name} has no input {k}")
+            literals[k] = TypeEngine.to_literal(
+                ctx, v, types[k], TypeEngine.to_literal_type(types[k])
+            )
+        return _literal_models.LiteralMap(literals=literals)
+
+    def _launch(
+        self, lp: LaunchPlan, inputs: _literal_models.LiteralMap, name: str
+    ) -> _identifier_models.WorkflowExecutionIdentifier:
+        spec = _execution_models.ExecutionSpec(
+            launch_plan=_identifier_models.Identifier(
+                _identifier_models.ResourceType.LAUNCH_PLAN,
+                self._project,
+                self._domain,
+                lp.name,
+                self._version,
+            ),
+            metadata=_execution_models.ExecutionMetadata(
+                _execution_models.ExecutionMetadata.ExecutionMode.MANUAL, "batch", 0
+            ),
+        )
+        self._limiter.acquire()
+        try:
+            return self._client.create_execution(
+                self._project, self._domain, name, spec, inputs
+            )
+        except _user_exceptions.FlyteEntityAlreadyExistsException:
+            if not name:
+                raise
+        execution_id = _identifier_models.WorkflowExecutionIdentifier(
+            self._project, self._domain, name
+        )
+        existing = self._client.get_execution(execution_id).spec.launch_plan
+        if (existing.name, existing.version) != (lp.name, self._version):
+            raise ValueError(
+                f"Execution {name} already exists for launch plan {existing.name}:{existing.version}"
+            )
+        # Flyte Admin fills in the default inputs of the launch plan, so only the inputs of the set are compared
+        existing_inputs = self._client.get_execution_data(execution_id).full_inputs
+        if any(
+            existing_inputs.literals.get(k) != v for k, v in inputs.literals.items()
+        ):
+            raise ValueError(f"Execution {name} already exists with other inputs")
+        return execution_id
+
+    def _wait(
+        self,
+        lp: LaunchPlan,
+        execution_id: _identifier_models.WorkflowExecutionIdentifier,
+    ) -> typing.Any:
+        while True:
+            closure = self._client.get_execution(execution_id).closure
+            if closure.phase in _TERMINAL_PHASES:
+                break
+            time.sleep(self._poll_interval)
+        if closure.phase != _core_execution_models.WorkflowExecutionPhase.SUCCEEDED:
+            phase = _core_execution_models.WorkflowExecutionPhase.enum_to_string(
+                closure.phase
+            )
+            message = closure.error.message if closure.error else ""
+            raise RuntimeError(f"Execution {execution_id.name} {phase}: {message}")
+
+        outputs = self._client.get_execution_data(execution_id).full_outputs
+        types = lp.workflow.python_interface.outputs
+        values = TypeEngine.literal_map_to_kwargs(
+            FlyteContextManager.current_context(), outputs, types
+        )
+        if len(types) == 0:
+            return None
+        if len(types) == 1:
+            return values[next(iter(types))]
+        return tuple(values[k] for k in types)
+
+    def run(
+        self,
+        lp: LaunchPlan,
+        inputs: typing.List[typing.Dict[str, typing.Any]],
+        name_prefix: typing.Optional[str] = None,
+        names: typing.Optional[typing.List[str]] = None,
+    ) -> BatchResult:
+        return self._run(lp, inputs, name_prefix, names, wait=True)
+
+    def launch(
+        self,
+        lp: LaunchPlan,
+        inputs: typing.List[typing.Dict[str, typing.Any]],
+        name_prefix: typing.Optional[str] = None,
+        names: typing.Optional[typing.List[str]] = None,
+    ) -> BatchResult:
+        """
+        Creates the executions without waiting for them, so there are no outputs and only launches can fail
+        """
+        return self._run(lp, inputs, name_prefix, names, wait=False)
+
+    def _run(
+        self,
+        lp: LaunchPlan,
+        inputs: typing.List[typing.Dict[str, typing.Any]],
+        name_prefix: typing.Optional[str],
+        names: typing.Optional[typing.List[str]],
+        wait: bool,
+    ) -> BatchResult:
+        if names and len(names) != len(inputs):
+            raise ValueError(f"Got {len(names)} names for {len(inputs)} input sets")
+        outputs: typing.List[typing.Any] = [None] * len(inputs)
+        executions: typing.List[
+            typing.Optional[_identifier_models.WorkflowExecutionIdentifier]
+        ] = [None] * len(inputs)
+        failures: typing.Dict[int, str] = {}
+
+        literals = {}
+        for i, kwargs in enumerate(inputs):
+            try:
+                literals[i] = self._to_literal_map(lp, kwargs)
+            except Exception as e:
+                failures[i] = f"Invalid inputs: {e}"
+
+        def run_one(i: int):
+            try:
+                if names:
+                    name = names[i]
+                else:
+                    name = f"{name_prefix}-{i}" if name_prefix else ""
+                executions[i] = self._launch(lp, literals[i], name)
+                if wait:
+                    outputs[i] = self._wait(lp, executions[i])
+            except Exception as e:
+                failures[i] = str(e)
+
+        with ThreadPoolExecutor(max_workers=self._max_parallel) as pool:
+            list(pool.map(run_one, sorted(literals)))
+        return BatchResult(outputs, dict(sorted(failures.items())), executions)
+
+
+# %%
+# A Local Stand-in for Flyte Admin
+# ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+# ``LocalAdmin`` has the methods of the client that the launcher uses and runs the launch plans it knows about locally.
+# A delay before every execution stands in for the time Flyte takes to queue an execution and start its pods. Local
+# execution is not thread safe, so executions wait for each other after their delay - just like a single worker would.
+class LocalAdmin(object):
+    def __init__(self, launch_plans: typing.List[LaunchPlan], delay: float = 0.0):
+        self._launch_plans = {lp.name: lp for lp in launch_plans}
+        self._delay = delay
+        self._executions: typing.Dict[str, _execution_models.Execution] = {}
+        self._inputs: typing.Dict[str, _literal_models.LiteralMap] = {}
+        self._outputs: typing.Dict[str, _literal_models.LiteralMap] = {}
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+
+    def _set_phase(self, execution_id, spec, phase, error=None):
+        closure = _execution_models.ExecutionClosure(
+            phase, datetime.datetime.now(datetime.timezone.utc), error=error
+        )
+        self._executions[execution_id.name] = _execution_models.Execution(
+            execution_id, spec, closure
+        )
+
+    def _run(self, execution_id, spec, inputs: _literal_models.LiteralMap):
+        time.sleep(self._delay)
+        lp = self._launch_plans[spec.launch_plan.name]
+        self._set_phase(
+            execution_id, spec, _core_execution_models.WorkflowExecutionPhase.RUNNING
+        )
+        try:
+            with self._run_lock:
+                ctx = FlyteContextManager.current_context()
+                types = lp.workflow.python_interface.inputs
+                kwargs = TypeEngine.literal_map_to_kwargs(
+                    ctx, inputs, {k: types[k] for k in inputs.literals}
+                )
+                result = lp(**kwargs)
+                types = lp.workflow.python_interface.outputs
+                if len(types) == 0:
+                    values = []
+                else:
+                    values = [result] if len(types) == 1 else list(result)
+                self._outputs[execution_id.name] = _literal_models.LiteralMap(
+                    literals={
+                        k: TypeEngine.to_literal(
+                            ctx, v, t, TypeEngine.to_literal_type(t)
+                        )
+                        for (k, t), v in zip(types.items(), values)
+                    }
+                )
+        except Exception as e:
+            error = _core_execution_models.ExecutionError("USER", str(e), "")
+            self._set_phase(
+                execution_id,
+                spec,
+                _core_execution_models.WorkflowExecutionPhase.FAILED,
+                error,
+            )
+            return
+        self._set_phase(
+            execution_id, spec, _core_execution_models.WorkflowExecutionPhase.SUCCEEDED
+        )
+
+    def create_execution(self, project, domain, name, execution_spec, inputs):
+        with self._lock:
+            name = name or f"local-{len(self._executions)}"
+            if name in self._executions:
+                raise _user_exceptions.FlyteEntityAlreadyExistsException(
+                    f"Execution {name} already exists"
+                )
+            if execution_spec.launch_plan.name not in self._launch_plans:
+                raise ValueError(
+                    f"Launch plan {execution_spec.launch_plan.name} not found"
+                )
+            execution_id = _identifier_models.WorkflowExecutionIdentifier(
+                project, domain, name
+            )
+            self._set_phase(
+                execution_id,
+                execution_spec,
+                _core_execution_models.WorkflowExecutionPhase.QUEUED,
+            )
+            self._inputs[name] = inputs
+        threading.Thread(
+            target=self._run, args=(execution_id, execution_spec, inputs), daemon=True
+        ).start()
+        return execution_id
+
+    def get_execution(self, id):
+        return self._executions[id.name]
+
+    def get_execution_data(self, id):
+        return _execution_models.WorkflowExecutionGetDataResponse(
+            None,
+            None,
+            self._inputs[id.name],
+            self._outputs.get(id.name, _literal_models.LiteralMap(literals={})),
+        )
+
+
+# %%
+# Greeting Every Day
+# ^^^^^^^^^^^^^^^^^^
+# Let's greet every day of the next four weeks, one day after the other and then as a batch. The last input set lacks
+# the day of the week and fails before it is launched, without affecting the other executions.
+if __name__ == "__main__":
+    days = [datetime.date.today() + datetime.timedelta(days=n) for n in range(28)]
+    inputs = [
+        {"day_of_week": d.strftime("%A"), "number": 3 if d.weekday() >= 5 else 1}
+        for d in days
+    ] + [{"number": 2}]
+
+    admin = LocalAdmin([morning_greeting], delay=0.2)
+    launcher = BatchLauncher(
+        admin, "flytesnacks", "development", "v1", max_parallel=1, poll_interval=0.01
+    )
+    start = time.monotonic()
+    sequential = launcher.run(morning_greeting, inputs, name_prefix="sequential")
+    print(f"Sequential: {time.monotonic() - start:.2f}s")
+
+    launcher = BatchLauncher(
+        admin,
+        "flytesnacks",
+        "development",
+        "v1",
+        max_parallel=16,
+        launches_per_second=50,
+        poll_interval=0.01,
+    )
+    start = time.monotonic()
+    batch = launcher.run(morning_greeting, inputs, name_prefix="batch")
+    print(f"Batch: {time.monotonic() - start:.2f}s")
+
+    assert batch.outputs == sequential.outputs
+    assert batch.outputs[:-1] == [morning_greeting(**i) for i in inputs[:-1]]
+    print(f"{len(inputs) - len(batch.failures)} succeeded, e.g. {batch.outputs[0]}")
+    for i, failure in batch.failures.items():
+        print(f"Input set {i} failed: {failure}")
+    assert batch.executions[-1] is None
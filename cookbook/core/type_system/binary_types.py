@@ -0,0 +1,203 @@
+"""
+.. _binary_types:
+
+Passing Bytes and NumPy Arrays
+-------------------------------
+
+``bytes`` and ``numpy.ndarray`` are not part of the types that flytekit maps automatically (refer to
+:ref:`flytekit_to_flyte_type_mapping`). The common workaround is to pickle arrays into a
+:py:class:`flytekit.types.file.PythonPickledFile`, which costs a full serialization on write and a full
+deserialization - and thus a copy of the data - on every read.
+
+Both types are raw buffers, so they map naturally onto Flyte's single part blobs. This example adds a transformer for
+each of them:
+
+- ``bytes`` and ``bytearray`` are written to the blob as is.
+- ``numpy.ndarray`` is written in the `npy format <https://numpy.org/doc/stable/reference/generated/numpy.lib.format.html>`__,
+  which stores the dtype and shape in a small header followed by the raw buffer. Downstream tasks memory map the file
+  instead of reading it, so loading an array is zero-copy and only the pages that are accessed are read from disk.
+"""
+import os
+import pickle
+import timeit
+import typing
+from typing import Type
+
+import numpy as np
+from flytekit import FlyteContext, task, workflow
+from flytekit.extend import TypeEngine, TypeTransformer
+from flytekit.models.core.types import BlobType
+from flytekit.models.literals import Blob, BlobMetadata, Literal, Scalar
+from flytekit.models.types import LiteralType
+from flytekit.types.file import PythonPickledFile
+
+
+# %%
+# Bytes
+# ^^^^^
+#
+# A single transformer class handles both ``bytes`` and ``bytearray``. It is registered once for each type, since
+# ``bytearray`` is not a subclass of ``bytes``.
+class BytesTransformer(TypeTransformer[bytes]):
+    _TYPE_INFO = BlobType(
+        format="bytes", dimensionality=BlobType.BlobDimensionality.SINGLE
+    )
+
+    def __init__(self, t: Type[typing.Union[bytes, bytearray]] = bytes):
+        super(BytesTransformer, self).__init__(name=f"{t.__name__}-transform", t=t)
+
+    def get_literal_type(self, t: Type[bytes]) -> LiteralType:
+        return LiteralType(blob=self._TYPE_INFO)
+
+    def to_literal(
+        self,
+        ctx: FlyteContext,
+        python_val: bytes,
+        python_type: Type[bytes],
+        expected: LiteralType,
+    ) -> Literal:
+        local_path = ctx.file_access.get_random_local_path()
+        with open(local_path, "wb") as f:
+            f.write(python_val)
+        remote_path = ctx.file_access.get_random_remote_path(local_path)
+        ctx.file_access.put_data(local_path, remote_path, is_multipart=False)
+        return Literal(
+            scalar=Scalar(
+                blob=Blob(uri=remote_path, metadata=BlobMetadata(type=self._TYPE_INFO))
+            )
+        )
+
+    def to_python_value(
+        self, ctx: FlyteContext, lv: Literal, expected_python_type: Type[bytes]
+    ) -> bytes:
+        local_path = ctx.file_access.get_random_local_path()
+        ctx.file_access.get_data(lv.scalar.blob.uri, local_path, is_multipart=False)
+        # bytes objects own their buffer, so unlike arrays they cannot be backed by a memory mapped file
+        with open(local_path, "rb") as f:
+            return expected_python_type(f.read())
+
+
+TypeEngine.register(BytesTransformer(bytes))
+TypeEngine.register(BytesTransformer(bytearray))
+
+
+# %%
+# NumPy Arrays
+# ^^^^^^^^^^^^
+#
+# Arrays are loaded with ``mmap_mode="c"`` (copy-on-write). Reading the array only touches the pages that are actually
+# used, and a task that modifies its input still works - the modified pages are copied in memory and the file is left
+# untouched.
+class NumpyArrayTransformer(TypeTransformer[np.ndarray]):
+    _TYPE_INFO = BlobType(
+        format="npy", dimensionality=BlobType.BlobDimensionality.SINGLE
+    )
+
+    def __init__(self):
+        super(NumpyArrayTransformer, self).__init__(
+            name="numpy-array-transform", t=np.ndarray
+        )
+
+    def get_literal_type(self, t: Type[np.ndarray]) -> LiteralType:
+        return LiteralType(blob=self._TYPE_INFO)
+
+    def to_literal(
+        self,
+        ctx: FlyteContext,
+        python_val: np.ndarray,
+        python_type: Type[np.ndarray],
+        expected: LiteralType,
+    ) -> Literal:
+        local_path = ctx.file_access.get_random_local_path() + ".npy"
+        # Object arrays would need pickle, which defeats the purpose of this type
+        np.save(local_path, python_val, allow_pickle=False)
+        remote_path = ctx.file_access.get_random_remote_path(local_path)
+        ctx.file_access.put_data(local_path, remote_path, is_multipart=False)
+        return Literal(
+            scalar=Scalar(
+                blob=Blob(uri=remote_path, metadata=BlobMetadata(type=self._TYPE_INFO))
+            )
+        )
+
+    def to_python_value(
+        self, ctx: FlyteContext, lv: Literal, expected_python_type: Type[np.ndarray]
+    ) -> np.ndarray:
+        uri = lv.scalar.blob.uri
+        # Files that are already on the local disk - e.g. when running locally - are mapped in place
+        local_path = uri
+        if ctx.file_access.is_remote(uri):
+            local_path = ctx.file_access.get_random_local_path() + ".npy"
+            ctx.file_access.get_data(uri, local_path, is_multipart=False)
+        return np.load(local_path, mmap_mode="c", allow_pickle=False)
+
+
+TypeEngine.register(NumpyArrayTransformer())
+
+
+# %%
+# With the transformers registered, ``bytes`` and ``numpy.ndarray`` can be used like any other type.
+@task
+def generate_array(n: int) -> np.ndarray:
+    return np.arange(n, dtype=np.float64).reshape(-1, 4)
+
+
+@task
+def column_sum(a: np.ndarray) -> np.ndarray:
+    return a.sum(axis=0)
+
+
+@task
+def encode(a: np.ndarray) -> bytes:
+    return a.tobytes()
+
+
+@task
+def decode(b: bytes) -> float:
+    return float(np.frombuffer(b, dtype=np.float64).sum())
+
+
+@workflow
+def array_wf(n: int = 16) -> (np.ndarray, float):
+    a = generate_array(n=n)
+    return column_sum(a=a), decode(b=encode(a=column_sum(a=a)))
+
+
+# %%
+# Benchmarking Against Pickled Files
+# ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+#
+# To compare both approaches we run one round trip through the type engine - which is what happens between two tasks -
+# and then read a single row of the array, like a task that only needs a slice of its input would.
+def pickled_round_trip(ctx: FlyteContext, a: np.ndarray) -> float:
+    lt = TypeEngine.to_literal_type(PythonPickledFile)
+    path = ctx.file_access.get_random_local_path()
+    with open(path, "wb") as f:
+        pickle.dump(a, f, protocol=pickle.HIGHEST_PROTOCOL)
+    lv = TypeEngine.to_literal(ctx, PythonPickledFile(path), PythonPickledFile, lt)
+    ff = TypeEngine.to_python_value(ctx, lv, PythonPickledFile)
+    with open(ff, "rb") as f:
+        return float(pickle.load(f)[0].sum())
+
+
+def ndarray_round_trip(ctx: FlyteContext, a: np.ndarray) -> float:
+    lt = TypeEngine.to_literal_type(np.ndarray)
+    lv = TypeEngine.to_literal(ctx, a, np.ndarray, lt)
+    return float(TypeEngine.to_python_value(ctx, lv, np.ndarray)[0].sum())
+
+
+def benchmark(sizes: typing.List[int] = (10**4, 10**6, 10**7), number: int = 5):
+    ctx = FlyteContext.current_context()
+    print(f"{'elements':>12}{'pickled (ms)':>16}{'ndarray (ms)':>16}")
+    for size in sizes:
+        a = np.random.rand(size // 4, 4)
+        pickled = timeit.timeit(lambda: pickled_round_trip(ctx, a), number=number)
+        mapped = timeit.timeit(lambda: ndarray_round_trip(ctx, a), number=number)
+        print(
+            f"{size:>12}{pickled * 1000 / number:>16.2f}{mapped * 1000 / number:>16.2f}"
+        )
+
+
+if __name__ == "__main__":
+    print(f"Running {os.path.basename(__file__)} main...")
+    print(f"array_wf(n=16) -> {array_wf(n=16)}")
+    benchmark()
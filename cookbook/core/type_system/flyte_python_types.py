@@ -34,9 +34,9 @@ The following table provides a quick overview of how types are converted from th
      - Automatic
      - just use python 3 type hints
    * - bytes/bytearray
-     - binary
-     - Not Supported
-     - Let us know if this is an interesting usecase that you can currently support using your own transformers.
+     - Blob - Single
+     - Custom Transformers
+     - Not mapped automatically, but can be passed as raw blobs using a custom transformer. Refer to :ref:`binary_types`.
    * - complex
      - NA
      - Not Supported
@@ -77,6 +77,10 @@ The following table provides a quick overview of how types are converted from th
      - Schema
      - Automatic
      - Use python 3 type hints. Pandas column types are not preserved
+   * - numpy.ndarray
+     - Blob - Single
+     - Custom Transformers
+     - Not mapped automatically, but can be passed as memory mapped ``.npy`` blobs using a custom transformer. Refer to :ref:`binary_types`.
    * - pyspark.DataFrame
      - Schema
      - Automatic
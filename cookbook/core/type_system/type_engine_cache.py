@@ -0,0 +1,177 @@
+"""
+.. _type_engine_cache:
+
+Caching Type Transformer Resolution
+------------------------------------
+
+Every typed input and output of a task or workflow goes through the :py:class:`flytekit.extend.TypeEngine`, once to
+compute its Flyte literal type when the interface is compiled, and once more to find the transformer that converts the
+value when the task runs. Resolving a transformer is a dictionary lookup for the simple types, but generic types like
+``typing.List[int]``, dataclasses and subclasses of registered types - like the ``MyDataset`` example in
+:ref:`advanced_custom_types` - fall back to scanning the whole registry. Literal types for nested generics are
+recomputed recursively every time.
+
+For workflows with hundreds of typed variables this adds up. Since a python type always resolves to the same
+transformer and literal type (until a new transformer is registered), both lookups can be memoized.
+
+This example shows how to install such a cache and includes a micro-benchmark that measures the cost of
+``to_literal`` / ``to_python_value`` for every type listed in :ref:`flytekit_to_flyte_type_mapping`.
+"""
+import datetime
+import os
+import tempfile
+import timeit
+import typing
+from dataclasses import dataclass
+
+import pandas
+from dataclasses_json import dataclass_json
+from flytekit import FlyteContext, kwtypes
+from flytekit.extend import TypeEngine
+from flytekit.models.types import LiteralType
+from flytekit.types.directory import FlyteDirectory
+from flytekit.types.file import FlyteFile
+from flytekit.types.schema import FlyteSchema
+
+# %%
+# The original, uncached implementations are kept around so that the cache can be switched off again.
+_get_transformer = TypeEngine.get_transformer.__func__
+_to_literal_type = TypeEngine.to_literal_type.__func__
+_register = TypeEngine.register.__func__
+
+_TRANSFORMERS: typing.Dict[typing.Any, typing.Any] = {}
+_LITERAL_TYPES: typing.Dict[typing.Any, LiteralType] = {}
+
+
+def _memoize(cache: typing.Dict, fn: typing.Callable) -> typing.Callable:
+    def cached(cls, python_type):
+        try:
+            return cache[python_type]
+        except KeyError:
+            v = fn(cls, python_type)
+            cache[python_type] = v
+            return v
+        except TypeError:
+            # Unhashable type annotations cannot be cached, resolve them every time
+            return fn(cls, python_type)
+
+    return cached
+
+
+def _register_and_invalidate(cls, transformer):
+    _register(cls, transformer)
+    # A new transformer may take precedence for types that were resolved through the registry scan
+    _TRANSFORMERS.clear()
+    _LITERAL_TYPES.clear()
+
+
+# %%
+# The cache is installed by replacing the classmethods on the ``TypeEngine``. Every code path in flytekit - including
+# nested types such as ``typing.List[typing.Dict[str, int]]`` whose transformers call back into the ``TypeEngine`` -
+# will now go through the cache.
+def enable_transformer_cache():
+    TypeEngine.get_transformer = classmethod(_memoize(_TRANSFORMERS, _get_transformer))
+    TypeEngine.to_literal_type = classmethod(_memoize(_LITERAL_TYPES, _to_literal_type))
+    TypeEngine.register = classmethod(_register_and_invalidate)
+
+
+def disable_transformer_cache():
+    TypeEngine.get_transformer = classmethod(_get_transformer)
+    TypeEngine.to_literal_type = classmethod(_to_literal_type)
+    TypeEngine.register = classmethod(_register)
+    _TRANSFORMERS.clear()
+    _LITERAL_TYPES.clear()
+
+
+# %%
+# Benchmarking the Type Engine
+# ^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+#
+# To know what the cache buys us, we measure the three operations for one sample value of every type from the table
+# in :ref:`flytekit_to_flyte_type_mapping`. ``bytes`` and ``complex`` are not supported and ``pyspark.DataFrame``
+# requires a plugin, so they are left out.
+@dataclass_json
+@dataclass
+class Datum(object):
+    x: int
+    y: str
+
+
+def sample_values() -> typing.List[typing.Tuple[str, type, typing.Any]]:
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, "sample.txt")
+    with open(path, "w") as f:
+        f.write("hello")
+    df = pandas.DataFrame(data={"x": [1, 2], "y": ["3", "4"]})
+    return [
+        ("int", int, 1),
+        ("float", float, 1.0),
+        ("str", str, "hello"),
+        ("bool", bool, True),
+        ("datetime.timedelta", datetime.timedelta, datetime.timedelta(hours=1)),
+        ("datetime.datetime", datetime.datetime, datetime.datetime.now()),
+        ("typing.List[int]", typing.List[int], list(range(10))),
+        ("FlyteFile", FlyteFile, FlyteFile(path)),
+        ("FlyteDirectory", FlyteDirectory, FlyteDirectory(tmp)),
+        ("typing.Dict[str, int]", typing.Dict[str, int], {"a": 1, "b": 2}),
+        ("dict", dict, {"a": [1, 2], "b": {"c": "d"}}),
+        ("@dataclass", Datum, Datum(x=1, y="1")),
+        ("pandas.DataFrame", pandas.DataFrame, df),
+        ("FlyteSchema[Columns]", FlyteSchema[kwtypes(x=int, y=str)], df),
+    ]
+
+
+def benchmark(number: int = 200) -> typing.List[typing.Dict[str, typing.Any]]:
+    """
+    Returns the average time in microseconds for resolving the literal type, converting to a literal and converting
+    back to a python value, for every sample type
+    """
+    ctx = FlyteContext.current_context()
+    results = []
+    for name, t, v in sample_values():
+        lt = TypeEngine.to_literal_type(t)
+        lv = TypeEngine.to_literal(ctx, v, t, lt)
+        # Files, directories and schemas copy data on every conversion, a few iterations are enough for them
+        n = (
+            number
+            if lv.scalar is None or lv.scalar.primitive is not None
+            else max(1, number // 20)
+        )
+        timings = {
+            "to_literal_type": timeit.timeit(
+                lambda: TypeEngine.to_literal_type(t), number=n
+            ),
+            "to_literal": timeit.timeit(
+                lambda: TypeEngine.to_literal(ctx, v, t, lt), number=n
+            ),
+            "to_python_value": timeit.timeit(
+                lambda: TypeEngine.to_python_value(ctx, lv, t), number=n
+            ),
+        }
+        results.append({"type": name, **{k: v * 1e6 / n for k, v in timings.items()}})
+    return results
+
+
+def print_results(title: str, results: typing.List[typing.Dict[str, typing.Any]]):
+    print(title)
+    print(
+        f"{'type':<24}{'to_literal_type':>18}{'to_literal':>18}{'to_python_value':>18}   (usec/op)"
+    )
+    for r in results:
+        print(
+            f"{r['type']:<24}{r['to_literal_type']:>18.2f}{r['to_literal']:>18.2f}{r['to_python_value']:>18.2f}"
+        )
+
+
+# %%
+# Running the benchmark with and without the cache shows the difference for each of the types. Resolving the literal
+# type of generics, dataclasses and schemas becomes a single dictionary lookup, while the conversion of simple
+# primitives - which were a dictionary lookup already - does not change. The conversion of files, directories and
+# dataframes is dominated by copying the data, not by the type engine.
+if __name__ == "__main__":
+    print_results("Uncached TypeEngine", benchmark())
+    enable_transformer_cache()
+    try:
+        print_results("Cached TypeEngine", benchmark())
+    finally:
+        disable_transformer_cache()
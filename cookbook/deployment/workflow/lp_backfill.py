@@ -0,0 +1,336 @@
+"""
+Backfilling Scheduled Launch Plans
+----------------------------------
+
+A schedule only kicks off executions from the moment its launch plan is activated. Executions that were missed - because
+the launch plan was activated late, was deactivated for a while, or its executions failed - have to be launched by hand,
+one kickoff time after the other.
+
+This example backfills a scheduled launch plan over a window of time. It lists all kickoff times of the schedule in the
+window and launches them concurrently with the :ref:`batch launcher <sphx_glr_auto_core_flyte_basics_lp_batch.py>`,
+passing each kickoff time to the ``kickoff_time_input_arg`` of the schedule. Kickoff times that were backfilled before,
+or whose outputs already exist, are skipped, and progress is saved as the backfill goes, so that an interrupted backfill
+resumes where it stopped.
+"""
+import datetime
+import hashlib
+import json
+import os
+import typing
+
+import croniter
+from flytekit import LaunchPlan
+from flytekit.models import schedule as _schedule_models
+from flytekit.models.core import execution as _core_execution_models
+
+from core.flyte_basics.lp_batch import BatchLauncher, LocalAdmin
+from deployment.workflow.lp_schedules import cron_lp, fixed_rate_lp
+
+# %%
+# Listing Kickoff Times
+# ^^^^^^^^^^^^^^^^^^^^^
+# Cron expressions follow the AWS syntax, which has a year as sixth field, accepts ``?`` for either of the day fields and
+# counts the days of the week from 1 for Sunday. croniter counts them from 0, has no year and takes ``*`` for ``?``, so
+# expressions are translated before they are handed to it, and the years are checked separately. Cron aliases and
+# croniter expressions - set with ``schedule`` instead of ``cron_expression`` - are understood by croniter as they are.
+# Fixed rate schedules have no fixed start, so their kickoff times are counted from an anchor, which defaults to the
+# start of the window.
+_ALIASES = {
+    "hourly": "@hourly",
+    "hours": "@hourly",
+    "daily": "@daily",
+    "days": "@daily",
+    "weekly": "@weekly",
+    "weeks": "@weekly",
+    "monthly": "@monthly",
+    "months": "@monthly",
+    "annually": "@yearly",
+    "yearly": "@yearly",
+    "years": "@yearly",
+}
+
+_RATE_UNITS = {
+    _schedule_models.Schedule.FixedRateUnit.MINUTE: datetime.timedelta(minutes=1),
+    _schedule_models.Schedule.FixedRateUnit.HOUR: datetime.timedelta(hours=1),
+    _schedule_models.Schedule.FixedRateUnit.DAY: datetime.timedelta(days=1),
+}
+
+
+def _aws_day_of_week(field: str) -> str:
+    def shift(token: str) -> str:
+        return str(int(token) - 1) if token.isdigit() else token
+
+    parts = []
+    for part in field.split(","):
+        step = ""
+        if "/" in part:
+            part, step = part.split("/")
+            step = f"/{step}"
+        parts.append("-".join(shift(t) for t in part.split("-")) + step)
+    return ",".join(parts)
+
+
+def _years(field: str) -> typing.Optional[typing.Set[int]]:
+    if field in ("*", "?"):
+        return None
+    years = set()
+    for part in field.split(","):
+        first, _, last = part.partition("-")
+        years.update(range(int(first), int(last or first) + 1))
+    return years
+
+
+def croniter_expression(
+    schedule: _schedule_models.Schedule,
+) -> typing.Tuple[str, typing.Optional[typing.Set[int]]]:
+    """
+    Returns the croniter expression of a cron schedule, and the years it runs in, if they are restricted
+    """
+    if schedule.cron_expression:
+        minute, hour, day, month, day_of_week, year = schedule.cron_expression.split()
+        expression = " ".join(
+            [
+                minute,
+                hour,
+                day.replace("?", "*"),
+                month,
+                _aws_day_of_week(day_of_week.replace("?", "*")),
+            ]
+        )
+        return expression, _years(year)
+    if schedule.cron_schedule.offset:
+        raise ValueError("Schedules with an offset are not supported")
+    return (
+        _ALIASES.get(
+            schedule.cron_schedule.schedule.lower(), schedule.cron_schedule.schedule
+        ),
+        None,
+    )
+
+
+def kickoff_times(
+    schedule: _schedule_models.Schedule,
+    start: datetime.datetime,
+    end: typing.Optional[datetime.datetime] = None,
+    anchor: typing.Optional[datetime.datetime] = None,
+) -> typing.Iterator[datetime.datetime]:
+    """
+    Yields the kickoff times of the schedule from ``start`` up to, but not including, ``end`` - or forever, unless the
+    years of the schedule are restricted
+    """
+    if schedule.rate is not None:
+        every = schedule.rate.value * _RATE_UNITS[schedule.rate.unit]
+        anchor = anchor or start
+        t = anchor + max(0, -(-(start - anchor) // every)) * every
+        while end is None or t < end:
+            yield t
+            t += every
+        return
+
+    expression, years = croniter_expression(schedule)
+    # croniter returns the first time after the one it starts from, so it starts just before the window
+    times = croniter.croniter(expression, start - datetime.timedelta(microseconds=1))
+    while True:
+        t = times.get_next(datetime.datetime)
+        if (end is not None and t >= end) or (years and t.year > max(years)):
+            return
+        if years is None or t.year in years:
+            yield t
+
+
+def execution_name(
+    lp: LaunchPlan, kickoff_time: datetime.datetime, attempt: int = 0
+) -> str:
+    """
+    Returns the name of an attempt at the execution of a launch plan for a kickoff time
+    """
+    digest = hashlib.sha1(lp.name.encode()).hexdigest()[:6]
+    name = f"b{digest}-{kickoff_time:%y%m%d%H%M}"
+    return f"{name}-{attempt}" if attempt else name
+
+
+# %%
+# The Backfill
+# ^^^^^^^^^^^^
+# Executions are named after the launch plan and their kickoff time, so that launching a kickoff time twice waits for
+# the first execution instead of starting a second one. Kickoff times are launched in chunks, and after every chunk the
+# kickoff times that succeeded and the ones that failed are saved to a state file. A new backfill with the same state
+# file skips the ones that succeeded and tries the others again. A failed execution keeps its name, so every kickoff time
+# that failed is tried again as a new attempt, with the number of the attempt appended to the name; the state file
+# keeps the number of failed attempts next to the failures. Kickoff times can also be skipped because their outputs
+# exist already - e.g. the partition of a table that the workflow writes - with ``output_exists``.
+class BackfillReport(typing.NamedTuple):
+    kickoff_times: int
+    skipped: int
+    succeeded: int
+    failures: typing.Dict[datetime.datetime, str]
+
+
+class Backfill(object):
+    def __init__(
+        self,
+        launcher: BatchLauncher,
+        lp: LaunchPlan,
+        state_path: str,
+        output_exists: typing.Optional[
+            typing.Callable[[datetime.datetime], bool]
+        ] = None,
+        chunk_size: int = 100,
+    ):
+        if lp.schedule is None:
+            raise ValueError(f"Launch plan {lp.name} has no schedule")
+        self._launcher = launcher
+        self._lp = lp
+        self._state_path = state_path
+        self._output_exists = output_exists
+        self._chunk_size = chunk_size
+        self._completed: typing.Set[str] = set()
+        self._failures: typing.Dict[str, str] = {}
+        self._attempts: typing.Dict[str, int] = {}
+        if os.path.exists(state_path):
+            with open(state_path) as f:
+                state = json.load(f)
+            if state["launch_plan"] != lp.name:
+                raise ValueError(
+                    f"{state_path} is the state of a backfill of {state['launch_plan']}"
+                )
+            self._completed = set(state["completed"])
+            self._failures = state["failures"]
+            self._attempts = state.get("attempts", {})
+
+    def _save(self):
+        tmp = f"{self._state_path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(
+                {
+                    "launch_plan": self._lp.name,
+                    "completed": sorted(self._completed),
+                    "failures": self._failures,
+                    "attempts": self._attempts,
+                },
+                f,
+            )
+        os.replace(tmp, self._state_path)
+
+    def run(
+        self,
+        start: datetime.datetime,
+        end: datetime.datetime,
+        anchor: typing.Optional[datetime.datetime] = None,
+    ) -> BackfillReport:
+        times = list(kickoff_times(self._lp.schedule, start, end, anchor))
+        pending = [
+            t
+            for t in times
+            if t.isoformat() not in self._completed
+            and not (self._output_exists and self._output_exists(t))
+        ]
+        arg = self._lp.schedule.kickoff_time_input_arg
+        failures = {}
+        for i in range(0, len(pending), self._chunk_size):
+            chunk = pending[i : i + self._chunk_size]
+            result = self._launcher.run(
+                self._lp,
+                [{arg: t} if arg else {} for t in chunk],
+                names=[
+                    execution_name(self._lp, t, self._attempts.get(t.isoformat(), 0))
+                    for t in chunk
+                ],
+            )
+            for j, t in enumerate(chunk):
+                key = t.isoformat()
+                if j in result.failures:
+                    self._failures[key] = failures[t] = result.failures[j]
+                    self._attempts[key] = self._attempts.get(key, 0) + 1
+                else:
+                    self._completed.add(key)
+                    self._failures.pop(key, None)
+                    self._attempts.pop(key, None)
+            self._save()
+        return BackfillReport(
+            len(times),
+            len(times) - len(pending),
+            len(pending) - len(failures),
+            failures,
+        )
+
+
+# %%
+# Backfilling the Schedules
+# ^^^^^^^^^^^^^^^^^^^^^^^^^
+# The daily ``cron_lp`` is backfilled over the last four weeks against the local stand-in for Flyte Admin. The first
+# backfill only gets through the first half of the window, as if it was interrupted, and the second one picks up from
+# there. ``fixed_rate_lp`` runs every ten minutes; its first three intervals already have outputs. Finally, a stand-in
+# whose first execution of every kickoff time fails shows a failed backfill succeeding when it is resumed.
+class FlakyAdmin(LocalAdmin):
+    def __init__(self, launch_plans: typing.List[LaunchPlan], delay: float = 0.0):
+        super(FlakyAdmin, self).__init__(launch_plans, delay)
+        self._tried: typing.Set[bytes] = set()
+
+    def _run(self, execution_id, spec, inputs):
+        key = inputs.to_flyte_idl().SerializeToString(deterministic=True)
+        if key in self._tried:
+            return super(FlakyAdmin, self)._run(execution_id, spec, inputs)
+        self._tried.add(key)
+        self._set_phase(
+            execution_id,
+            spec,
+            _core_execution_models.WorkflowExecutionPhase.FAILED,
+            _core_execution_models.ExecutionError("SYSTEM", "Node lost", ""),
+        )
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    admin = LocalAdmin([cron_lp, fixed_rate_lp], delay=0.05)
+    launcher = BatchLauncher(
+        admin,
+        "flytesnacks",
+        "development",
+        "v1",
+        max_parallel=8,
+        launches_per_second=100,
+        poll_interval=0.01,
+    )
+    end = datetime.datetime.now(datetime.timezone.utc).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    start = end - datetime.timedelta(days=28)
+
+    with tempfile.TemporaryDirectory() as d:
+        state = os.path.join(d, "cron_lp.json")
+        print(
+            Backfill(launcher, cron_lp, state, chunk_size=5).run(
+                start, start + datetime.timedelta(days=14)
+            )
+        )
+        print(Backfill(launcher, cron_lp, state, chunk_size=5).run(start, end))
+
+        existing = set(
+            kickoff_times(
+                fixed_rate_lp.schedule, start, start + datetime.timedelta(minutes=30)
+            )
+        )
+        backfill = Backfill(
+            launcher,
+            fixed_rate_lp,
+            os.path.join(d, "fixed_rate_lp.json"),
+            output_exists=existing.__contains__,
+        )
+        print(backfill.run(start, start + datetime.timedelta(hours=2)))
+
+        launcher = BatchLauncher(
+            FlakyAdmin([cron_lp]),
+            "flytesnacks",
+            "development",
+            "v1",
+            launches_per_second=100,
+            poll_interval=0.01,
+        )
+        state = os.path.join(d, "flaky_cron_lp.json")
+        window = (start, start + datetime.timedelta(days=3))
+        first = Backfill(launcher, cron_lp, state).run(*window)
+        second = Backfill(launcher, cron_lp, state).run(*window)
+        print(f"First pass: {len(first.failures)} failed, resumed: {second}")
+        assert second.succeeded == len(first.failures) and not second.failures
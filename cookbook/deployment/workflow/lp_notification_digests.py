@@ -0,0 +1,417 @@
+"""
+Notification Digests
+--------------------
+
+The notifications of :ref:`the notifications example <sphx_glr_auto_deployment_workflow_lp_notifications.py>` are sent
+once per execution: a launch plan that is launched a thousand times - by a schedule, a backfill or a batch - and fails
+every time pages its recipients a thousand times, with the same message.
+
+This example collects the phase changes of executions for a window of time instead, and sends one digest per recipient
+list at the end of the window. Executions of the same workflow that end in the same phase are folded into a single line
+of the digest, with their count and a few of their names. The digests are sent over SMTP - which is how Flyte Admin
+delivers Slack and PagerDuty notifications as well - or posted to a webhook, and both can be tried out against local
+stand-ins.
+"""
+import collections
+import datetime
+import email.message
+import json
+import logging
+import smtplib
+import socketserver
+import threading
+import typing
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from flytekit import LaunchPlan
+from flytekit.models import execution as _execution_models
+from flytekit.models.core import execution as _core_execution_models
+from flytekit.models.core import identifier as _identifier_models
+
+from core.flyte_basics.lp_batch import BatchLauncher, LocalAdmin
+from deployment.workflow.lp_notifications import int_doubler_wf_lp, int_doubler_wf_scheduled_lp, wacky_int_doubler_lp
+
+
+# %%
+# Digests
+# ^^^^^^^
+# A digest goes to the recipients of one kind of notification - ``email``, ``slack`` or ``pager_duty`` - and has one
+# entry per workflow and phase.
+class DigestEntry(object):
+    def __init__(self, workflow: str, phase: int):
+        self.workflow = workflow
+        self.phase = phase
+        self.count = 0
+        self.executions: typing.List[str] = []
+        self.error: typing.Optional[str] = None
+
+    def __str__(self):
+        phase = _core_execution_models.WorkflowExecutionPhase.enum_to_string(self.phase)
+        line = (
+            f"{self.workflow} {phase} {self.count} times: {', '.join(self.executions)}"
+        )
+        if self.count > len(self.executions):
+            line += ", ..."
+        if self.error:
+            line += f"\n    {self.error}"
+        return line
+
+
+class Digest(typing.NamedTuple):
+    kind: str
+    recipients: typing.Tuple[str, ...]
+    start: datetime.datetime
+    end: datetime.datetime
+    entries: typing.List[DigestEntry]
+
+    @property
+    def subject(self) -> str:
+        return f"{sum(e.count for e in self.entries)} executions of {len({e.workflow for e in self.entries})} workflows"
+
+    @property
+    def body(self) -> str:
+        return (
+            f"Between {self.start:%Y-%m-%d %H:%M:%S} and {self.end:%H:%M:%S}:\n"
+            + "\n".join(str(e) for e in self.entries)
+        )
+
+
+# %%
+# The Aggregator
+# ^^^^^^^^^^^^^^
+# Executions are recorded as they reach a phase, with the notifications of their launch plan. Every notification that
+# includes the phase adds the execution to the open digest of its recipients; the first execution opens the digest, and
+# ``flush`` sends every digest that has been open for a full window. An execution that is recorded twice in the same
+# phase - because it was polled twice, or a poller lists the executions that ended every time - is only counted once.
+# The aggregator remembers the executions it has recorded for ``retention``, counted from the last time they were
+# recorded, and at most ``max_seen`` of them, forgetting the least recently recorded ones first. Only an execution that
+# is recorded again after it has been forgotten notifies twice, so ``retention`` should be longer than a poller lists
+# executions for, and ``max_seen`` larger than the number of executions it lists within ``retention``.
+# A digest that a sink fails to send is kept and sent again, before any newer digest, on the next flush; ``flush``
+# raises the first error once it has tried every digest.
+class NotificationAggregator(object):
+    def __init__(
+        self,
+        launch_plans: typing.List[LaunchPlan],
+        sinks: typing.Dict[str, typing.Callable[[Digest], None]],
+        window: datetime.timedelta = datetime.timedelta(minutes=5),
+        max_executions: int = 5,
+        retention: datetime.timedelta = datetime.timedelta(days=7),
+        max_seen: int = 100_000,
+        clock: typing.Callable[[], datetime.datetime] = lambda: datetime.datetime.now(
+            datetime.timezone.utc
+        ),
+    ):
+        if retention < window:
+            raise ValueError(
+                f"Retention {retention} is shorter than the window {window}"
+            )
+        self._launch_plans = {lp.name: lp for lp in launch_plans}
+        self._sinks = sinks
+        self._window = window
+        self._max_executions = max_executions
+        self._clock = clock
+        self._open: typing.Dict[
+            typing.Tuple[str, typing.Tuple[str, ...]],
+            typing.Tuple[
+                datetime.datetime, typing.Dict[typing.Tuple[str, int], DigestEntry]
+            ],
+        ] = {}
+        self._retention = retention
+        self._max_seen = max_seen
+        # In the order of the last time they were recorded
+        self._seen: typing.Dict[typing.Tuple[str, int], datetime.datetime] = (
+            collections.OrderedDict()
+        )
+        self._failed: typing.List[Digest] = []
+        self._lock = threading.Lock()
+        self.notifications = 0
+        self.digests = 0
+
+    def record(self, execution: _execution_models.Execution):
+        lp = self._launch_plans[execution.spec.launch_plan.name]
+        phase = execution.closure.phase
+        now = self._clock()
+        with self._lock:
+            seen = (execution.id.name, phase)
+            if seen in self._seen:
+                self._seen[seen] = now
+                self._seen.move_to_end(seen)
+                return
+            self._seen[seen] = now
+            if len(self._seen) > self._max_seen:
+                self._seen.popitem(last=False)
+            for n in lp.notifications:
+                if phase not in n.phases:
+                    continue
+                for kind in ("email", "slack", "pager_duty"):
+                    target = getattr(n, kind)
+                    if target is None:
+                        continue
+                    if kind not in self._sinks:
+                        raise ValueError(
+                            f"No sink for {kind} notifications of {lp.name}"
+                        )
+                    self.notifications += 1
+                    key = (kind, tuple(sorted(target.recipients_email)))
+                    _, entries = self._open.setdefault(key, (now, {}))
+                    entry = entries.get((lp.workflow.name, phase))
+                    if entry is None:
+                        entry = entries[(lp.workflow.name, phase)] = DigestEntry(
+                            lp.workflow.name, phase
+                        )
+                    entry.count += 1
+                    if len(entry.executions) < self._max_executions:
+                        entry.executions.append(execution.id.name)
+                    if entry.error is None and execution.closure.error:
+                        entry.error = execution.closure.error.message
+
+    def flush(self, force: bool = False) -> typing.List[Digest]:
+        now = self._clock()
+        with self._lock:
+            due = [
+                k
+                for k, (start, _) in self._open.items()
+                if force or now - start >= self._window
+            ]
+            digests, self._failed = self._failed, []
+            for key in due:
+                start, entries = self._open.pop(key)
+                digests.append(
+                    Digest(key[0], key[1], start, now, list(entries.values()))
+                )
+            while (
+                self._seen and now - next(iter(self._seen.values())) >= self._retention
+            ):
+                self._seen.popitem(last=False)
+        sent, failed, errors = [], [], []
+        for digest in digests:
+            try:
+                self._sinks[digest.kind](digest)
+                sent.append(digest)
+            except Exception as e:
+                failed.append(digest)
+                errors.append(e)
+        with self._lock:
+            self._failed = failed + self._failed
+            self.digests += len(sent)
+        if errors:
+            raise errors[0]
+        return sent
+
+    def run(self, stop: threading.Event, interval: float = 1.0):
+        """
+        Flushes the digests every ``interval`` seconds, and once more when stopped
+        """
+        while not stop.wait(interval):
+            try:
+                self.flush()
+            except Exception:
+                logging.exception(
+                    "Sending digests failed, they are sent again on the next flush"
+                )
+        try:
+            self.flush(force=True)
+        except Exception:
+            logging.exception(
+                f"Sending digests failed, {len(self._failed)} are not sent"
+            )
+
+
+# %%
+# Sinks
+# ^^^^^
+# A sink sends a digest. ``EmailSink`` mails it to its recipients, the way Flyte Admin sends notifications, and
+# ``WebhookSink`` posts it as the ``text`` of a JSON message - the format of Slack's incoming webhooks.
+class EmailSink(object):
+    def __init__(self, host: str, port: int, sender: str):
+        self._host = host
+        self._port = port
+        self._sender = sender
+
+    def __call__(self, digest: Digest):
+        message = email.message.EmailMessage()
+        message["Subject"] = f"Flyte: {digest.subject}"
+        message["From"] = self._sender
+        message["To"] = ", ".join(digest.recipients)
+        message.set_content(digest.body)
+        with smtplib.SMTP(self._host, self._port) as smtp:
+            smtp.send_message(message)
+
+
+class WebhookSink(object):
+    def __init__(self, url: str, timeout: float = 10.0):
+        self._url = url
+        self._timeout = timeout
+
+    def __call__(self, digest: Digest):
+        request = urllib.request.Request(
+            self._url,
+            data=json.dumps({"text": f"*{digest.subject}*\n{digest.body}"}).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        urllib.request.urlopen(request, timeout=self._timeout).close()
+
+
+# %%
+# Local Stand-ins
+# ^^^^^^^^^^^^^^^
+# Both stand-ins listen on a free local port and keep what they receive: the SMTP server speaks just enough of the
+# protocol for ``smtplib``, and the webhook accepts any JSON that is posted to it.
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line: str):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.reply("220 localhost")
+        sender, recipients = None, []
+        for line in self.rfile:
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            if verb in ("HELO", "EHLO"):
+                self.reply("250 localhost")
+            elif verb == "MAIL":
+                sender, recipients = command.split(":", 1)[1].strip(" <>"), []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                recipients.append(command.split(":", 1)[1].strip(" <>"))
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                for data_line in self.rfile:
+                    if data_line in (b".\r\n", b".\n"):
+                        break
+                    data.append(data_line.decode())
+                self.server.messages.append((sender, recipients, "".join(data)))
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.messages.append(json.loads(body))
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class _LocalServer(object):
+    def __init__(self, server):
+        self._server = server
+        self._server.messages = []
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    @property
+    def messages(self) -> typing.List:
+        return self._server.messages
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def local_smtp_server() -> _LocalServer:
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    return _LocalServer(socketserver.ThreadingTCPServer(("localhost", 0), _SMTPHandler))
+
+
+def local_webhook() -> _LocalServer:
+    return _LocalServer(ThreadingHTTPServer(("localhost", 0), _WebhookHandler))
+
+
+# %%
+# Digesting a Fan-out
+# ^^^^^^^^^^^^^^^^^^^
+# The launch plans of the notifications example are launched 50 times each through the local stand-in for Flyte Admin,
+# and the scheduled launch plan is made to fail 200 times by recording failed executions. Instead of one notification
+# per execution and recipient list, each list gets a digest. Slack notifications are posted to a webhook.
+if __name__ == "__main__":
+    launch_plans = [
+        int_doubler_wf_lp,
+        int_doubler_wf_scheduled_lp,
+        wacky_int_doubler_lp,
+    ]
+    with local_smtp_server() as smtp, local_webhook() as webhook:
+        mail = EmailSink("localhost", smtp.port, "flyte-notifications@example.com")
+        aggregator = NotificationAggregator(
+            launch_plans,
+            sinks={
+                "email": mail,
+                "pager_duty": mail,
+                "slack": WebhookSink(f"http://localhost:{webhook.port}"),
+            },
+            window=datetime.timedelta(seconds=1),
+        )
+        stop = threading.Event()
+        flusher = threading.Thread(target=aggregator.run, args=(stop, 0.1))
+        flusher.start()
+
+        admin = LocalAdmin(launch_plans)
+        launcher = BatchLauncher(
+            admin,
+            "flytesnacks",
+            "development",
+            "v1",
+            max_parallel=16,
+            launches_per_second=500,
+            poll_interval=0.01,
+        )
+        for lp in (int_doubler_wf_lp, wacky_int_doubler_lp):
+            result = launcher.run(
+                lp, [{"a": i} for i in range(50)], name_prefix=lp.name
+            )
+            for execution_id in result.executions:
+                aggregator.record(admin.get_execution(execution_id))
+                # Polling an execution again does not notify twice
+                aggregator.record(admin.get_execution(execution_id))
+
+        failed = _execution_models.ExecutionClosure(
+            _core_execution_models.WorkflowExecutionPhase.FAILED,
+            datetime.datetime.now(datetime.timezone.utc),
+            error=_core_execution_models.ExecutionError("USER", "Out of memory", ""),
+        )
+        spec = _execution_models.ExecutionSpec(
+            _identifier_models.Identifier(
+                _identifier_models.ResourceType.LAUNCH_PLAN,
+                "flytesnacks",
+                "development",
+                int_doubler_wf_scheduled_lp.name,
+                "v1",
+            ),
+            _execution_models.ExecutionMetadata(
+                _execution_models.ExecutionMetadata.ExecutionMode.SCHEDULED,
+                "scheduler",
+                0,
+            ),
+        )
+        for i in range(200):
+            execution_id = _identifier_models.WorkflowExecutionIdentifier(
+                "flytesnacks", "development", f"scheduled-{i}"
+            )
+            aggregator.record(_execution_models.Execution(execution_id, spec, failed))
+
+        stop.set()
+        flusher.join()
+        print(
+            f"{aggregator.notifications} notifications sent as {aggregator.digests} digests"
+        )
+        for sender, recipients, data in smtp.messages:
+            print(f"--- mail to {', '.join(recipients)}\n{data}")
+        for message in webhook.messages:
+            print(f"--- webhook\n{message['text']}")
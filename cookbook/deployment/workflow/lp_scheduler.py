@@ -0,0 +1,321 @@
+"""
+A Local Scheduler for Many Launch Plans
+---------------------------------------
+
+Flyte evaluates every schedule on its own: each scheduled launch plan gets an event rule of its own that fires it, as
+explained in :ref:`the schedules example <sphx_glr_auto_deployment_workflow_lp_schedules.py>`. Many launch plans share
+their schedule though - every tenant's ``@daily`` report, or hundreds of pipelines starting at the top of the hour - so
+most of that work is done over and over for the same kickoff times.
+
+This example is a scheduler for local development that fires any number of scheduled launch plans from a single
+process. Launch plans with the same schedule are grouped and the next kickoff time of each group is kept in a priority
+queue, so the scheduler only ever looks at the group that is due next, and fires all launch plans that are due at the
+same time as a single batch.
+"""
+import datetime
+import heapq
+import itertools
+import random
+import time
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
+from flytekit import LaunchPlan
+from flytekit.models import schedule as _schedule_models
+from flytekit.models.core import identifier as _identifier_models
+
+from core.flyte_basics.lp_batch import BatchLauncher, LocalAdmin
+from deployment.workflow.lp_backfill import croniter_expression, execution_name, kickoff_times
+from deployment.workflow.lp_schedules import cron_lp, fixed_rate_lp
+
+
+# %%
+# Grouping Schedules
+# ^^^^^^^^^^^^^^^^^^
+# Schedules are grouped by what they evaluate to, rather than by how they are written: ``0 * * * ? *`` and ``@hourly``
+# share a group, as do all fixed rates of the same interval that start at the same time. Each group keeps the iterator
+# of its kickoff times from :ref:`the backfill example <sphx_glr_auto_deployment_workflow_lp_backfill.py>`.
+def schedule_key(
+    schedule: _schedule_models.Schedule, anchor: datetime.datetime
+) -> typing.Tuple:
+    if schedule.rate is not None:
+        return "rate", schedule.rate.value, schedule.rate.unit, anchor
+    expression, years = croniter_expression(schedule)
+    expression = {
+        "@hourly": "0 * * * *",
+        "@daily": "0 0 * * *",
+        "@weekly": "0 0 * * 0",
+        "@monthly": "0 0 1 * *",
+        "@yearly": "0 0 1 1 *",
+    }.get(expression, expression)
+    return "cron", expression, tuple(sorted(years)) if years else None
+
+
+class _Group(object):
+    def __init__(self, key: typing.Tuple, times: typing.Iterator[datetime.datetime]):
+        self.key = key
+        self.times = times
+        self.launch_plans: typing.Dict[str, LaunchPlan] = {}
+
+
+# %%
+# The Scheduler
+# ^^^^^^^^^^^^^
+# The queue holds one entry per group, with the next kickoff time of the group. Groups are removed from the queue
+# lazily: a group that loses its last launch plan is dropped from the index, and its entry is skipped once it comes up.
+# ``due`` pops every entry up to a given time and yields the launch plans of all groups with the same kickoff time as a
+# batch, in the order of their kickoff times - so a scheduler that fell behind catches up on every kickoff time it
+# missed. ``run`` does the same against the clock, sleeping until the next kickoff time. Groups that are created once
+# the scheduler is running start after the last time it handed out, so a launch plan that is removed and added again
+# does not fire any kickoff time twice. Times without a time zone are taken to be in UTC, like the ones of the clock.
+class Batch(typing.NamedTuple):
+    kickoff_time: datetime.datetime
+    launch_plans: typing.List[LaunchPlan]
+
+
+def _utc(t: datetime.datetime) -> datetime.datetime:
+    return t.replace(tzinfo=datetime.timezone.utc) if t.tzinfo is None else t
+
+
+class Scheduler(object):
+    def __init__(self, start: datetime.datetime):
+        self._start = _utc(start)
+        self._handed_out: typing.Optional[datetime.datetime] = None
+        self._groups: typing.Dict[typing.Tuple, _Group] = {}
+        self._keys: typing.Dict[str, typing.Set[typing.Tuple]] = {}
+        self._queue: typing.List[typing.Tuple[datetime.datetime, int, _Group]] = []
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return sum(len(g.launch_plans) for g in self._groups.values())
+
+    @property
+    def groups(self) -> int:
+        return len(self._groups)
+
+    def _push(self, group: _Group):
+        t = next(group.times, None)
+        if t is not None:
+            heapq.heappush(self._queue, (t, next(self._counter), group))
+
+    def add(
+        self,
+        lp: LaunchPlan,
+        schedule: typing.Optional[_schedule_models.Schedule] = None,
+        anchor: typing.Optional[datetime.datetime] = None,
+    ):
+        """
+        Schedules a launch plan - on its own schedule, unless another one is given
+        """
+        schedule = schedule or lp.schedule
+        if schedule is None:
+            raise ValueError(f"Launch plan {lp.name} has no schedule")
+        anchor = _utc(anchor) if anchor else self._start
+        key = schedule_key(schedule, anchor)
+        group = self._groups.get(key)
+        if group is None:
+            start = self._start
+            if self._handed_out is not None:
+                start = self._handed_out + datetime.timedelta(microseconds=1)
+            group = _Group(key, kickoff_times(schedule, start, anchor=anchor))
+            self._groups[key] = group
+            self._push(group)
+        group.launch_plans[lp.name] = lp
+        self._keys.setdefault(lp.name, set()).add(key)
+
+    def remove(self, lp: LaunchPlan):
+        for key in self._keys.pop(lp.name, []):
+            group = self._groups[key]
+            group.launch_plans.pop(lp.name, None)
+            if not group.launch_plans:
+                del self._groups[key]
+
+    def next_kickoff_time(self) -> typing.Optional[datetime.datetime]:
+        while (
+            self._queue
+            and self._groups.get(self._queue[0][2].key) is not self._queue[0][2]
+        ):
+            heapq.heappop(self._queue)
+        return self._queue[0][0] if self._queue else None
+
+    def due(self, now: datetime.datetime) -> typing.Iterator[Batch]:
+        now = _utc(now)
+        while True:
+            t = self.next_kickoff_time()
+            if t is None or t > now:
+                return
+            self._handed_out = t
+            launch_plans = {}
+            while self._queue and self._queue[0][0] == t:
+                _, _, group = heapq.heappop(self._queue)
+                if self._groups.get(group.key) is group:
+                    launch_plans.update(group.launch_plans)
+                    self._push(group)
+            if launch_plans:
+                yield Batch(t, list(launch_plans.values()))
+
+    def run(
+        self,
+        fire: typing.Callable[[Batch], None],
+        until: typing.Optional[datetime.datetime] = None,
+        clock: typing.Callable[[], datetime.datetime] = lambda: datetime.datetime.now(
+            datetime.timezone.utc
+        ),
+    ):
+        until = _utc(until) if until else None
+        while True:
+            now = clock()
+            for batch in self.due(now):
+                fire(batch)
+            t = self.next_kickoff_time()
+            if t is None or (until is not None and t > until):
+                return
+            time.sleep(max(0.0, (t - _utc(clock())).total_seconds()))
+
+
+# %%
+# Firing Batches
+# ^^^^^^^^^^^^^^
+# A batch is launched through the :ref:`batch launcher <sphx_glr_auto_core_flyte_basics_lp_batch.py>`, one execution
+# per launch plan, with the kickoff time passed to the ``kickoff_time_input_arg`` of the schedule. Executions are named
+# like the ones of a backfill, so a kickoff time that was backfilled already is not launched a second time. Firing only
+# creates the executions - it does not wait for them to finish, which would hold up the next kickoff time for as long as
+# the slowest workflow of the batch runs - and returns their ids, so the caller can check on them with the client.
+class FiredBatch(typing.NamedTuple):
+    executions: typing.Dict[str, _identifier_models.WorkflowExecutionIdentifier]
+    failures: typing.Dict[str, str]
+
+
+def batch_launcher(
+    launcher: BatchLauncher, max_parallel: int = 10
+) -> typing.Callable[[Batch], FiredBatch]:
+    def fire(batch: Batch) -> FiredBatch:
+        def launch(lp: LaunchPlan):
+            arg = lp.schedule.kickoff_time_input_arg
+            inputs = {arg: batch.kickoff_time} if arg else {}
+            name = execution_name(lp, batch.kickoff_time)
+            return launcher.launch(lp, [inputs], names=[name])
+
+        with ThreadPoolExecutor(max_workers=max_parallel) as pool:
+            results = list(pool.map(launch, batch.launch_plans))
+        fired = FiredBatch({}, {})
+        for lp, result in zip(batch.launch_plans, results):
+            if 0 in result.failures:
+                fired.failures[lp.name] = result.failures[0]
+            else:
+                fired.executions[lp.name] = result.executions[0]
+        return fired
+
+    return fire
+
+
+# %%
+# Scaling to Many Schedules
+# ^^^^^^^^^^^^^^^^^^^^^^^^^
+# The benchmark schedules ``date_formatter_wf`` under 100,000 names, each on one of a few thousand daily, hourly and
+# fixed rate schedules, and fires a simulated day of kickoff times. It compares the scheduler with one that evaluates
+# every launch plan on its own - a queue entry and an iterator of kickoff times per launch plan.
+def random_schedules(n: int, seed: int = 0) -> typing.List[_schedule_models.Schedule]:
+    rng = random.Random(seed)
+    expressions = set()
+    while len(expressions) < n:
+        minute = rng.randrange(60)
+        kind = rng.random()
+        if kind < 0.6:
+            expressions.add(f"{minute} {rng.randrange(24)} * * ? *")
+        elif kind < 0.9:
+            expressions.add(f"{minute} * * * ? *")
+        else:
+            expressions.add(f"{minute} {rng.randrange(24)} ? * {rng.randint(2, 6)} *")
+    schedules = [
+        _schedule_models.Schedule("kickoff_time", cron_expression=e)
+        for e in sorted(expressions)
+    ]
+    for minutes in (5, 10, 15, 30):
+        schedules.append(
+            _schedule_models.Schedule(
+                "kickoff_time",
+                rate=_schedule_models.Schedule.FixedRate(
+                    minutes, _schedule_models.Schedule.FixedRateUnit.MINUTE
+                ),
+            )
+        )
+    return schedules
+
+
+def benchmark(launch_plans: int = 100_000, schedules: int = 2_000):
+    pool = random_schedules(schedules)
+    rng = random.Random(1)
+    lps = [
+        LaunchPlan(
+            f"lp_{i}",
+            cron_lp.workflow,
+            cron_lp.parameters,
+            cron_lp.fixed_inputs,
+            schedule=rng.choice(pool),
+        )
+        for i in range(launch_plans)
+    ]
+    start = datetime.datetime(2021, 1, 4)
+    end = start + datetime.timedelta(days=1)
+
+    t0 = time.perf_counter()
+    scheduler = Scheduler(start)
+    for lp in lps:
+        scheduler.add(lp)
+    t1 = time.perf_counter()
+    fired = batches = 0
+    for batch in scheduler.due(end):
+        batches += 1
+        fired += len(batch.launch_plans)
+    t2 = time.perf_counter()
+    print(
+        f"Coalesced: {len(scheduler)} launch plans in {scheduler.groups} groups, indexed in {t1 - t0:.2f}s, "
+        f"{fired} launches in {batches} batches in {t2 - t1:.2f}s"
+    )
+
+    t0 = time.perf_counter()
+    queue = []
+    for i, lp in enumerate(lps):
+        times = kickoff_times(lp.schedule, start, anchor=start)
+        queue.append((next(times), i, times, lp))
+    heapq.heapify(queue)
+    t1 = time.perf_counter()
+    independent = 0
+    while queue[0][0] <= end:
+        t, i, times, lp = queue[0]
+        independent += 1
+        heapq.heapreplace(queue, (next(times), i, times, lp))
+    t2 = time.perf_counter()
+    print(
+        f"Independent: {len(lps)} launch plans indexed in {t1 - t0:.2f}s, {independent} launches in {t2 - t1:.2f}s"
+    )
+    assert independent == fired
+
+
+# %%
+# The two scheduled launch plans of the schedules example are fired over a simulated hour first, through a local
+# stand-in for Flyte Admin: ``fixed_rate_lp`` fires every ten minutes, and ``cron_lp`` once at 10:00.
+if __name__ == "__main__":
+    admin = LocalAdmin([cron_lp, fixed_rate_lp])
+    fire = batch_launcher(
+        BatchLauncher(
+            admin,
+            "flytesnacks",
+            "development",
+            "v1",
+            launches_per_second=100,
+            poll_interval=0.01,
+        )
+    )
+    start = datetime.datetime(2021, 1, 4, 9, 30)
+    scheduler = Scheduler(start)
+    scheduler.add(cron_lp)
+    scheduler.add(fixed_rate_lp)
+    for batch in scheduler.due(start + datetime.timedelta(hours=1)):
+        fired = fire(batch)
+        print(
+            f"{batch.kickoff_time:%H:%M}: {', '.join(fired.executions)} {fired.failures or ''}"
+        )
+
+    benchmark()
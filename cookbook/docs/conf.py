@@ -39,26 +39,38 @@ class CustomSorter(FileNameSortKey):
         "task.py",
         "basic_workflow.py",
         "imperative_wf_style.py",
+        "imperative_wf_bulk.py",
         "lp.py",
+        "lp_batch.py",
         "task_cache.py",
         "files.py",
         "folders.py",
         "named_outputs.py"
         # Control Flow
         "run_conditions.py",
+        "constant_folding.py",
+        "local_conditions.py",
         "subworkflows.py",
+        "subworkflow_inlining.py",
+        "subworkflow_splitting.py",
         "dynamics.py",
         "map_task.py",
         "run_merge_sort.py",
+        "compile_profiler.py",
         # Type System
         "flyte_python_types.py",
         "schema.py",
         "typed_schema.py",
         "custom_objects.py",
+        "binary_types.py",
+        "type_engine_cache.py",
         # Testing
         "mocking.py",
         # Containerization
         "raw_container.py",
+        "local_containers.py",
+        "raw_container_proto.py",
+        "literal_io.py",
         "multi_images.py",
         "use_secrets.py",
         "spot_instances.py",
@@ -67,8 +79,11 @@ class CustomSorter(FileNameSortKey):
         ## Workflow
         "deploying_workflows.py",
         "lp_schedules.py",
+        "lp_backfill.py",
+        "lp_scheduler.py",
         "customizing_resources.py",
         "lp_notifications.py",
+        "lp_notification_digests.py",
         "fast_registration.py",
         "multiple_k8s.py",
         ## Cluster
@@ -115,6 +130,8 @@ class CustomSorter(FileNameSortKey):
         "backend_plugins.py",  # NOTE: for some reason this needs to be listed first here to show up last on the TOC
         "run_custom_types.py",
         "custom_task_plugin.py",
+        "object_store_sensors.py",
+        "fast_sqlite3.py",
         # Tutorials
         ## ML Training
         "diabetes.py",
@@ -122,6 +139,7 @@ class CustomSorter(FileNameSortKey):
         "multiregion_house_price_predictor.py",
         "datacleaning_tasks.py",
         "datacleaning_workflow.py",
+        "reference_cache.py",
     ]
     """
     Take a look at the code for the default sorter included in the sphinx_gallery to see how this works.